@@ -0,0 +1,111 @@
+from array import array
+
+# compact representations of the NFA and DFA transition matrices
+# both are kept as a few flat arrays of machine integers (struct-of-arrays) instead of lists of small Python lists,
+# which takes an order of magnitude less memory and keeps the data of neighbouring states close together
+# input symbols are represented by their character codes
+
+# symbol code of epsilon transitions
+EPS = -1
+# outgoing state of a missing transition
+NONE = -1
+
+
+# NFA transition matrix
+# every state of the NFAs created by the McNaughton-Yamada-Thompson algorithm has either one outgoing transition on an
+# input symbol, or up to two outgoing transitions on epsilon [1], so each state is described by its symbol (EPS for
+# epsilon transitions) and two outgoing states (the second one is only used by epsilon transitions)
+# the accepting state has no outgoing transitions at all
+#
+# [1] The Dragon Book, 2nd Ed, p. 161
+class NFA:
+    __slots__ = ('syms', 'out1', 'out2', 'start', 'accept')
+
+    def __init__(self):
+        self.syms = array('i')
+        self.out1 = array('i')
+        self.out2 = array('i')
+        self.start = 0
+        self.accept = 0
+
+    def __len__(self):
+        return len(self.syms)
+
+    # add a new state to the NFA and return its index
+    def add_state(self, sym=EPS, out1=NONE, out2=NONE):
+        self.syms.append(sym)
+        self.out1.append(out1)
+        self.out2.append(out2)
+        return len(self.syms) - 1
+
+    # make the state a copy of the other state
+    def copy_state(self, state, other):
+        self.syms[state] = self.syms[other]
+        self.out1[state] = self.out1[other]
+        self.out2[state] = self.out2[other]
+
+    # append a copy of the states between first and last, which only have transitions to each other (eg. the states of
+    # an NFA fragment), and return the offset which was added to their indexes
+    def copy_fragment(self, first, last):
+        offset = len(self) - first
+        for state in range(first, last):
+            self.add_state(self.syms[state],
+                           self.out1[state] + offset if self.out1[state] != NONE else NONE,
+                           self.out2[state] + offset if self.out2[state] != NONE else NONE)
+        return offset
+
+    # append all the states of the other NFA, and return the offset which was added to their indexes
+    def append(self, other):
+        offset = len(self)
+        self.syms.extend(other.syms)
+        self.out1.extend(array('i', [out + offset if out != NONE else NONE for out in other.out1]))
+        self.out2.extend(array('i', [out + offset if out != NONE else NONE for out in other.out2]))
+        return offset
+
+
+# DFA transition matrix
+# transitions of all the states are stored one after another, and the transitions of state i are the ones between
+# offsets[i] and offsets[i + 1]
+# since the subset construction processes the DFA states in order, transitions are always added to the last state
+class DFATransitions:
+    __slots__ = ('syms', 'targets', 'offsets')
+
+    def __init__(self):
+        self.syms = array('i')
+        self.targets = array('i')
+        self.offsets = array('i', [0])
+
+    # number of states whose transitions are stored
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def transition_count(self):
+        return len(self.syms)
+
+    # start storing the transitions of the next state
+    def add_state(self):
+        self.offsets.append(len(self.syms))
+
+    # add a transition to the last state
+    def add_transition(self, sym, target):
+        self.syms.append(sym)
+        self.targets.append(target)
+        self.offsets[-1] = len(self.syms)
+
+    # return the list of (input symbol, outgoing state) pairs of the state
+    def transitions(self, state):
+        begin = self.offsets[state]
+        end = self.offsets[state + 1]
+        return list(zip(self.syms[begin:end], self.targets[begin:end]))
+
+
+# encode a set of states (eg. NFA states which make up a DFA state) as a compact, hashable key
+def encode_states(states):
+    return array('i', sorted(states)).tobytes()
+
+
+# decode the set of states encoded by encode_states as a list
+def decode_states(key):
+    states = array('i')
+    states.frombytes(key)
+    return states.tolist()
@@ -0,0 +1,183 @@
+import argparse
+import os
+import subprocess
+import tempfile
+from parse_input_file import generate_lexer, SpecError
+from generation_budget import BudgetError
+
+# benchmark of the scanner backends (see create_body) on a language specification and a representative input
+# the lexer is generated with every backend, compiled along with a small driver, and each of its scanners is timed on
+# the input: the stream scanner (Lexer::get_next_word), the buffer scanner (Lexer::tokenize_parallel on one thread)
+# and the push scanner (PushLexer, fed in 64 KB chunks)
+# which backend is faster depends on the grammar, the compiler and the machine, so there is no better default
+# every scanner reports the offset where it stopped, and the throughput is computed from the bytes it consumed up to
+# there, but the benchmark fails unless all the scanners tokenize the whole input into the same number of tokens
+
+BACKENDS = ["switch", "goto"]
+
+DRIVER = """
+#include <algorithm>
+#include <chrono>
+#include <cstdio>
+#include <cstdlib>
+#include <fstream>
+#include <memory>
+#include <sstream>
+#include "lexer.h"
+
+// Run the function the provided number of times, and return the shortest time in seconds.
+template <typename F>
+static double best_of(int repeat, F f) {
+	double best{0};
+	for (int i = 0; i < repeat; i++) {
+		auto start = std::chrono::steady_clock::now();
+		f();
+		std::chrono::duration<double> elapsed{std::chrono::steady_clock::now() - start};
+		if (i == 0 || elapsed.count() < best)
+			best = elapsed.count();
+	}
+	return best;
+}
+
+// Print the results of one scanner: the number of tokens, the offset of the last token, whether
+// it is an error token (the scanner stops at the first one), and the time.
+static void report(size_t tokens, const std::shared_ptr<Token>& last, double seconds) {
+	std::printf(" %zu %llu %d %.9f", tokens, static_cast<unsigned long long>(last->get_offset()),
+			last->get_token_type() == TokenType::ERROR ? 1 : 0, seconds);
+}
+
+int main(int argc, char** argv) {
+	const int repeat{std::atoi(argv[2])};
+	std::ifstream file(argv[1], std::ios::binary);
+	std::stringstream contents;
+	contents << file.rdbuf();
+	const std::string input{contents.str()};
+	size_t tokens{0};
+	std::shared_ptr<Token> last;
+	std::printf("%zu", input.size());
+
+	double stream{best_of(repeat, [&]() {
+		Lexer lexer(argv[1]);
+		tokens = 0;
+		do {
+			last = lexer.get_next_word();
+			tokens++;
+		} while (last->get_token_type() != TokenType::LAST && last->get_token_type() != TokenType::ERROR);
+	})};
+	report(tokens, last, stream);
+
+	double buffer{best_of(repeat, [&]() {
+		std::vector<std::shared_ptr<Token>> result{Lexer::tokenize_parallel(input, 1)};
+		tokens = result.size();
+		last = result.back();
+	})};
+	report(tokens, last, buffer);
+
+	double push{best_of(repeat, [&]() {
+		PushLexer lexer;
+		tokens = 0;
+		auto add = [&](const std::vector<std::shared_ptr<Token>>& result) {
+			tokens += result.size();
+			if (!result.empty())
+				last = result.back();
+		};
+		for (size_t i = 0; i < input.size(); i += 1 << 16)
+			add(lexer.feed(input.data() + i, std::min<size_t>(1 << 16, input.size() - i)));
+		add(lexer.finish());
+	})};
+	report(tokens, last, push);
+	std::printf("\\n");
+	return 0;
+}
+"""
+
+
+# generate and compile the lexer with the provided backend in the directory, and return the path of the benchmark
+def build(spec, backend, engine, directory, compiler, flags):
+    prefix = os.path.join(directory, "lexer")
+    generate_lexer(spec, prefix, engine, backend=backend)
+    driver = os.path.join(directory, "driver.cpp")
+    with open(driver, 'w') as file:
+        file.write(DRIVER)
+    binary = os.path.join(directory, "benchmark_" + backend)
+    subprocess.run([compiler, "-std=c++11", "-pthread", *flags.split(), prefix + ".cpp", driver, "-o", binary],
+                   check=True)
+    return binary
+
+
+SCANNERS = ["stream", "buffer", "push"]
+
+
+# results of one scanner of the benchmark: the number of tokens, the offset where the scanner stopped (of the LAST
+# token, or of the first ERROR token), whether it stopped at an ERROR token, and the best time in seconds
+class ScannerResult:
+    __slots__ = ('tokens', 'stop', 'error', 'seconds')
+
+    def __init__(self, tokens, stop, error, seconds):
+        self.tokens = tokens
+        self.stop = stop
+        self.error = error
+        self.seconds = seconds
+
+    # throughput in MB/s, over the bytes the scanner consumed before it stopped
+    def throughput(self):
+        return self.stop / 1e6 / max(self.seconds, 1e-9)
+
+
+# return the input size, and the ScannerResult of every scanner of the benchmark binary on the input
+def run(binary, input_file, repeat):
+    output = subprocess.run([binary, input_file, str(repeat)], check=True, capture_output=True, text=True).stdout
+    fields = output.split()
+    results = {}
+    for (k, scanner) in enumerate(SCANNERS):
+        (tokens, stop, error, seconds) = fields[1 + 4 * k:5 + 4 * k]
+        results[scanner] = ScannerResult(int(tokens), int(stop), error == "1", float(seconds))
+    return int(fields[0]), results
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Compare the scanner backends on a language specification.")
+    arg_parser.add_argument("filename", help="input file with the language specification")
+    arg_parser.add_argument("input", help="representative input of the generated lexer")
+    arg_parser.add_argument("--engine", choices=["nfa", "direct"], default="nfa",
+                            help="engine which creates the DFA, see the lexer generator")
+    arg_parser.add_argument("--repeat", type=int, default=5, help="report the best of this many runs")
+    arg_parser.add_argument("--cxx", default="g++", help="C++ compiler")
+    arg_parser.add_argument("--cxxflags", default="-O2", help="C++ compiler flags")
+    args = arg_parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for backend in BACKENDS:
+            os.mkdir(os.path.join(directory, backend))
+            try:
+                binary = build(args.filename, backend, args.engine, os.path.join(directory, backend), args.cxx,
+                               args.cxxflags)
+            except (SpecError, BudgetError, OSError, subprocess.CalledProcessError) as e:
+                print(e)
+                exit(1)
+            results[backend] = run(binary, args.input, args.repeat)
+
+    size = results[BACKENDS[0]][0]
+    print(args.input + ": " + str(size) + " bytes")
+    failed = False
+    for backend in BACKENDS:
+        for scanner in SCANNERS:
+            result = results[backend][1][scanner]
+            print("{} {} scanner: {} tokens, stopped at offset {}{}".format(
+                backend, scanner, result.tokens, result.stop, " on an ERROR token" if result.error else ""))
+            failed = failed or result.error or result.stop != size
+    if len({result.tokens for (_, scanner_results) in results.values() for result in scanner_results.values()}) > 1:
+        print("The scanners returned different numbers of tokens!")
+        failed = True
+    if failed:
+        print("The input has to be tokenized to the end by every scanner!")
+        exit(1)
+
+    print("{:<10}{:>14}{:>14}{:>14}".format("backend", *[scanner + " MB/s" for scanner in SCANNERS]))
+    for backend in BACKENDS:
+        print("{:<10}{:>14.1f}{:>14.1f}{:>14.1f}".format(
+            backend, *[results[backend][1][scanner].throughput() for scanner in SCANNERS]))
+    for scanner in SCANNERS:
+        fastest = min(BACKENDS, key=lambda backend: results[backend][1][scanner].seconds)
+        print("fastest " + scanner + " scanner: " + fastest)
@@ -0,0 +1,114 @@
+from regex_parser import Node, NodeType
+from regex_simplifier import operands
+
+# case-insensitive patterns (the ones with the _nocase attribute), by folding the case of the input
+# writing a case-insensitive pattern out as (i|I)(f|F) doubles the transitions of all its letters, and the DFA states
+# of the patterns which share a prefix with it, so instead the scanner looks every input byte up in a fold table, which
+# maps the upper case ASCII letters to the lower case ones, and the DFA only has transitions on the lower case letters
+# since the input is folded for all the patterns, a letter is only folded if none of the case-sensitive patterns tells
+# its cases apart, which they do unless each of its cases only ever appears in a union along with the other one (as in
+# [a-z]|[A-Z]), or does not appear at all
+# the case-insensitive patterns match the letters which are not folded through unions of their cases, just as if they
+# were written out, so only the folded letters save states (with the usual SQL-like grammars, that is all of them)
+
+
+# return the set of the lower case letters whose cases the AST of a case-sensitive pattern tells apart
+# visited keeps the nodes which have been gone through by their ids, as the ASTs of the defines are shared
+def distinguished_letters(root, visited):
+    if id(root) in visited:
+        return set()
+    visited[id(root)] = root
+
+    if root.type == NodeType.CHAR:
+        return {root.value.lower()} if root.value.isascii() and root.value.isalpha() else set()
+    if root.type != NodeType.UNION:
+        result = set()
+        for child in root.children:
+            result |= distinguished_letters(child, visited)
+        return result
+
+    alternatives = operands(root, NodeType.UNION)
+    chars = {alternative.value for alternative in alternatives if alternative.type == NodeType.CHAR}
+    result = {char.lower() for char in chars
+              if char.isascii() and char.isalpha() and char.swapcase() not in chars}
+    for alternative in alternatives:
+        if alternative.type != NodeType.CHAR:
+            result |= distinguished_letters(alternative, visited)
+    return result
+
+
+# rewrites the ASTs of the patterns for the folded input
+# rewritten subexpressions are remembered by their original nodes, separately for the case-sensitive and the
+# case-insensitive patterns, so the shared ASTs of the defines are only rewritten once for each
+class CaseFolder:
+    __slots__ = ('folded', 'folded_upper', 'rewritten')
+
+    def __init__(self, folded):
+        # lower case letters which are folded, and their upper case letters
+        self.folded = folded
+        self.folded_upper = {letter.upper() for letter in folded}
+        # (original node, rewritten node) by whether the pattern is case-insensitive, and by the id of the original node
+        # the original node is kept alive, so that its id is not reused
+        self.rewritten = {False: {}, True: {}}
+
+    # return the AST rewritten for the folded input
+    def rewrite(self, root, nocase):
+        cache = self.rewritten[nocase]
+        if id(root) in cache:
+            return cache[id(root)][1]
+
+        if root.type == NodeType.CHAR:
+            result = self.rewrite_char(root, nocase)
+        elif root.type == NodeType.UNION and not nocase:
+            # the upper case letters which are folded never come out of the fold table, and their lower case letters
+            # are alternatives of the same union
+            alternatives = operands(root, NodeType.UNION)
+            kept = [self.rewrite(alternative, nocase) for alternative in alternatives
+                    if alternative.type != NodeType.CHAR or alternative.value not in self.folded_upper]
+            if len(kept) == len(alternatives) and all(new is old for (new, old) in zip(kept, alternatives)):
+                result = root
+            else:
+                result = kept[0]
+                for alternative in kept[1:]:
+                    result = Node(NodeType.UNION, '|', result, alternative)
+        else:
+            children = [self.rewrite(child, nocase) for child in root.children]
+            if all(child is original for (child, original) in zip(children, root.children)):
+                result = root
+            else:
+                result = Node(root.type, root.value, *children)
+
+        cache[id(root)] = (root, result)
+        return result
+
+    # return the AST which matches the character of the node in the folded input
+    def rewrite_char(self, node, nocase):
+        char = node.value
+        if not nocase or not char.isascii() or not char.isalpha():
+            return node
+        if char.lower() in self.folded:
+            return node if char.islower() else Node(NodeType.CHAR, char.lower())
+        return Node(NodeType.UNION, '|', Node(NodeType.CHAR, char.lower()), Node(NodeType.CHAR, char.upper()))
+
+
+# rewrite the ASTs of the patterns (PatternDesc objects) in place for the folded input, and return the fold table, the
+# list of the input symbols of all the 256 bytes, or None if there are no case-insensitive patterns
+def fold_patterns(pattern_descs):
+    if not any(patt_desc.nocase for patt_desc in pattern_descs):
+        return None
+
+    distinguished = set()
+    visited = {}
+    for patt_desc in pattern_descs:
+        if not patt_desc.nocase:
+            distinguished |= distinguished_letters(patt_desc.root, visited)
+    folded = {chr(code) for code in range(ord('a'), ord('z') + 1)} - distinguished
+
+    folder = CaseFolder(folded)
+    for patt_desc in pattern_descs:
+        patt_desc.root = folder.rewrite(patt_desc.root, patt_desc.nocase)
+
+    fold_table = list(range(256))
+    for letter in folded:
+        fold_table[ord(letter.upper())] = ord(letter)
+    return fold_table
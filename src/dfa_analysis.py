@@ -0,0 +1,84 @@
+# analyses of the finished DFA, used by the code generator to emit specialized code for some of the states
+
+
+# return the sorted list of the DFA states which can make the scanner backtrack more than a bounded number of characters
+# the scanner backtracks over the states it has passed since the last accepting state, so the amount of backtracking
+# is only unbounded if a path of non-accepting states can be arbitrarily long, which means that it goes through a cycle
+# of non-accepting states
+# these are the states which belong to the non-trivial strongly connected components of the subgraph of non-accepting
+# states, found using Tarjan's algorithm [1]
+#
+# [1] Tarjan, R. (1972). Depth-first search and linear graph algorithms. SIAM Journal on Computing, 1(2), 146-160.
+def backtracking_states(dstates_num, dtran, dfa_acc_states):
+    accepting = set(dfa_acc_states)
+    successors = [[] if state in accepting else
+                  sorted({target for (sym, target) in dtran.transitions(state) if target not in accepting})
+                  for state in range(dstates_num)]
+
+    index = [None] * dstates_num
+    lowlink = [0] * dstates_num
+    on_stack = [False] * dstates_num
+    stack = []
+    result = []
+    next_index = 0
+    for root in range(dstates_num):
+        if root in accepting or index[root] is not None:
+            continue
+
+        # iterative depth-first search, every frame is a state and the position of its next successor to visit
+        frames = [(root, 0)]
+        index[root] = lowlink[root] = next_index
+        next_index += 1
+        stack.append(root)
+        on_stack[root] = True
+        while len(frames) > 0:
+            (state, i) = frames.pop()
+            if i < len(successors[state]):
+                frames.append((state, i + 1))
+                successor = successors[state][i]
+                if index[successor] is None:
+                    index[successor] = lowlink[successor] = next_index
+                    next_index += 1
+                    stack.append(successor)
+                    on_stack[successor] = True
+                    frames.append((successor, 0))
+                elif on_stack[successor]:
+                    lowlink[state] = min(lowlink[state], index[successor])
+                continue
+
+            if len(frames) > 0:
+                parent = frames[-1][0]
+                lowlink[parent] = min(lowlink[parent], lowlink[state])
+
+            if lowlink[state] == index[state]:
+                component = []
+                while True:
+                    member = stack.pop()
+                    on_stack[member] = False
+                    component.append(member)
+                    if member == state:
+                        break
+                # a component of a single state is only a cycle if the state loops to itself
+                if len(component) > 1 or state in successors[state]:
+                    result += component
+
+    return sorted(result)
+
+
+# a self-looping state gets a skip loop if it loops on at least this many input symbols
+MIN_LOOP_SYMS = 2
+# and if it has at most this many transitions to other states
+MAX_EXITS = 4
+
+
+# return the dictionary which maps the DFA states which loop to themselves on many input symbols, and leave on few, to
+# the sorted lists of the input symbols they loop on
+# the scanner can skip runs of these symbols without going through the whole state for every one of them
+def self_loop_states(dstates_num, dtran):
+    result = {}
+    for state in range(dstates_num):
+        transitions = dtran.transitions(state)
+        loop_syms = sorted(sym for (sym, target) in transitions if target == state)
+        if len(loop_syms) >= MIN_LOOP_SYMS and len(transitions) - len(loop_syms) <= MAX_EXITS:
+            result[state] = loop_syms
+    return result
@@ -5,15 +5,43 @@
 #
 # [1] "Engineering a Compiler" 2nd edition, p. 60
 
+import os
+import re
+from scanner_profile import PROFILE_MAGIC, dfa_fingerprint
+
+
+# return the c++ character literal of the input symbol code
+def char_literal(sym):
+    if 32 <= sym < 127 and chr(sym) not in "'\\":
+        return "'" + chr(sym) + "'"
+    return "'\\x" + format(sym, "02x") + "'"
+
+
+# return the token type the pattern code sets, if that is all the code does, or None
+def static_token_type(code, token_list):
+    match = re.fullmatch(r"\{\s*token->set_token_type\(\s*(?:TokenType::)?(\w+)\s*\);\s*\}", code.strip())
+    if match is None or match.group(1) not in token_list:
+        return None
+    return match.group(1)
+
+
+# return the name of the header guard macro of the header file with the provided output prefix
+def header_guard(output_prefix):
+    return "__" + re.sub(r"\W", "_", os.path.basename(output_prefix)).upper() + "_H"
+
 
 # open the header file and emit necessary class and enum declarations (eg. Token class, States enum, etc.)
 # also emit manifest code, which is provided by the user in the first part of the input file
-def create_header_and_emit_manifest(manifest, token_list, states_num):
-    with open("my_little_lexer.h", 'w') as header:
+# the header file is named output_prefix.h, and it is opened in the provided OutputFiles
+# memo_states_num is the number of DFA states whose failures are memoized (see backtracking_states)
+def create_header_and_emit_manifest(outputs, manifest, token_list, states_num, output_prefix="my_little_lexer",
+                                    memo_states_num=0):
+    guard = header_guard(output_prefix)
+    with outputs.open(output_prefix + ".h") as header:
         # emit header guards and includes
         header.writelines([
-            "#ifndef __MY_LITTLE_LEXER_H\n"
-            "#define __MY_LITTLE_LEXER_H\n"
+            "#ifndef " + guard + "\n"
+            "#define " + guard + "\n"
             "\n"
             "#include <string>\n"
             "#include <fstream>\n"
@@ -21,6 +49,9 @@ def create_header_and_emit_manifest(manifest, token_list, states_num):
             "#include <stack>\n"
             "#include <memory>\n"
             "#include <functional>\n"
+            "#include <stdexcept>\n"
+            "#include <vector>\n"
+            "#include <mutex>\n"
             "#include <cstdint>\n\n"
         ])
 
@@ -39,6 +70,39 @@ def create_header_and_emit_manifest(manifest, token_list, states_num):
 
         # emit manifest code
         header.writelines(manifest)
+
+        # emit LineIndex class
+        header.writelines([
+            "\n// Index of the newline positions of the input, used to compute line and column\n"
+            "// numbers of tokens. It is built lazily, only as far into the input as the\n"
+            "// positions which were asked for, so the lexer itself only has to track offsets.\n"
+            "class LineIndex {\n"
+            "\t// Input file, if the input is not in memory.\n"
+            "\tstd::ifstream filestream;\n"
+            "\t// In-memory input, which must outlive the index.\n"
+            "\tconst char* buf;\n"
+            "\tuint64_t size;\n"
+            "\t// Offsets of all the newlines before the scanned_to offset.\n"
+            "\tstd::vector<uint64_t> newlines;\n"
+            "\tuint64_t scanned_to;\n"
+            "\tbool done;\n"
+            "\tstd::mutex mutex;\n"
+            "\t// Extend the index at least up to the provided offset.\n"
+            "\tvoid scan_to(uint64_t offset);\n"
+            "public:\n"
+            "\tLineIndex(const char* input_file)\n"
+            "\t\t: filestream(input_file), buf(nullptr), size(0), scanned_to(0), done(false) {}\n"
+            "\tLineIndex(const char* buf, uint64_t size)\n"
+            "\t\t: buf(buf), size(size), scanned_to(0), done(false) {}\n"
+            "\tLineIndex(const LineIndex&) = delete;\n"
+            "\tLineIndex& operator=(const LineIndex&) = delete;\n\n"
+            "\t// Line (starting from 1) of the character at the provided offset.\n"
+            "\tuint64_t get_line(uint64_t offset);\n"
+            "\t// Column (starting from 1) of the character at the provided offset.\n"
+            "\tuint64_t get_column(uint64_t offset);\n"
+            "};\n"
+        ])
+
         header.write("\n// Token class, which represents one lexeme of the input file.\n")
 
         # emit Token class
@@ -46,23 +110,28 @@ def create_header_and_emit_manifest(manifest, token_list, states_num):
             "class Token {\n"
             "\tTokenType token_type;\n"
             "\tstd::string lexeme;\n"
-            "\t// Line in input file which contains this lexeme. Currently only used for\n"
-            "\t// error reporting.\n"
-            "\tint16_t line;\n"
+            "\t// Offset of this lexeme in the input file.\n"
+            "\tuint64_t offset;\n"
             "\t// Whether this token should be ignored.\n"
             "\tbool ignore;\n"
+            "\t// Used to compute the line and column of this lexeme on demand.\n"
+            "\tstd::shared_ptr<LineIndex> line_index;\n"
             "public:\n"
             "\tToken() = delete;\n"
-            "\tToken(std::string lexeme = \"\", TokenType token_type = TokenType::DEFAULT, int16_t line = "
-            "0, bool ignore = false)\n "
-            "\t\t: lexeme(lexeme), token_type(token_type), line(line), ignore(ignore) {}\n\n"
+            "\tToken(std::string lexeme = \"\", TokenType token_type = TokenType::DEFAULT, uint64_t offset = 0,\n"
+            "\t\t\tbool ignore = false, std::shared_ptr<LineIndex> line_index = nullptr)\n"
+            "\t\t: token_type(token_type), lexeme(lexeme), offset(offset), ignore(ignore), line_index(line_index) {}\n\n"
             "\tvoid set_token_type(TokenType token_type) { this->token_type = token_type; }\n"
             "\tvoid set_ignore(bool ignore) { this->ignore = ignore; }\n"
             "\tvoid set_lexeme(std::string lexeme) { this->lexeme = lexeme; }\n\n"
             "\tconst std::string& get_lexeme() const { return this->lexeme; }\n"
             "\tTokenType get_token_type() const { return this->token_type; }\n"
             "\tbool is_ignore() const { return this->ignore; }\n"
-            "\tint16_t get_line() const { return this->line; }\n"
+            "\tuint64_t get_offset() const { return this->offset; }\n"
+            "\tuint64_t get_line() const { return this->line_index ? this->line_index->get_line(this->offset) : 0; }\n"
+            "\tuint64_t get_column() const {\n"
+            "\t\treturn this->line_index ? this->line_index->get_column(this->offset) : 0;\n"
+            "\t}\n"
             "};\n\n"
         ])
 
@@ -86,6 +155,98 @@ def create_header_and_emit_manifest(manifest, token_list, states_num):
             "};\n\n"
         ])
 
+        # emit the LexerStats struct
+        # the counters are plain integers, since every lexer instance is used by a single thread
+        header.writelines([
+            "#ifdef MY_LITTLE_LEXER_STATS\n"
+            "// Runtime counters of a lexer, see Lexer::get_stats.\n"
+            "struct LexerStats {\n"
+            "\t// Tokens created, by token type (ignored, LAST and ERROR tokens included).\n"
+            "\tuint64_t tokens[" + str(token_num + 3) + "];\n"
+            "\t// Bytes of the input consumed (skipped matches included).\n"
+            "\tuint64_t bytes;\n"
+            "\t// Characters read past the end of a token and read again by the next one. Every\n"
+            "\t// token costs at least one (its lookahead character), more is backtracking.\n"
+            "\tuint64_t backtracked;\n"
+            "\t// ERROR tokens created.\n"
+            "\tuint64_t errors;\n\n"
+            "\tuint64_t get_tokens(TokenType token_type) const {\n"
+            "\t\treturn this->tokens[static_cast<uint16_t>(token_type)];\n"
+            "\t}\n"
+            "};\n"
+            "#endif\n\n"
+        ])
+
+        # emit FailureMemo class
+        # bits of the positions before the current token start are dropped in whole words, once they make up at least
+        # half of the memo, so the memo only spans the input which is being backtracked over
+        header.writelines([
+            "// Failed (DFA state, input position) pairs of the states which can loop without\n"
+            "// accepting. Once such a state has failed to reach an accepting state from some\n"
+            "// position, the scanner does not try again, which keeps the scanning time linear\n"
+            "// in the input size (Reps, \"Maximal-Munch\" Tokenization in Linear Time, 1998).\n"
+            "class FailureMemo {\n"
+            "\tstatic constexpr uint64_t STATES_NUM = " + str(memo_states_num) + ";\n"
+            "\t// Bit (pos - base) * STATES_NUM + state is set if the state failed at pos.\n"
+            "\tstd::vector<uint64_t> bits;\n"
+            "\tuint64_t base;\n"
+            "public:\n"
+            "\t// States entered since the last accepting state, with the positions at which they\n"
+            "\t// were entered (a range of them, for the states which skip runs of the input).\n"
+            "\tstruct TrailEntry {\n"
+            "\t\tuint32_t state;\n"
+            "\t\tuint64_t first;\n"
+            "\t\tuint64_t last;\n"
+            "\t\tTrailEntry(uint32_t state, uint64_t first, uint64_t last)\n"
+            "\t\t\t: state(state), first(first), last(last) {}\n"
+            "\t};\n"
+            "\tstd::vector<TrailEntry> trail;\n\n"
+            "\tFailureMemo() : base(0) {}\n"
+            "\tbool failed(uint32_t state, uint64_t pos) const {\n"
+            "\t\tuint64_t bit{(pos - this->base) * STATES_NUM + state};\n"
+            "\t\treturn (bit >> 6) < this->bits.size() && ((this->bits[bit >> 6] >> (bit & 63)) & 1);\n"
+            "\t}\n"
+            "\tvoid set_failed(uint32_t state, uint64_t pos) {\n"
+            "\t\tuint64_t bit{(pos - this->base) * STATES_NUM + state};\n"
+            "\t\tif ((bit >> 6) >= this->bits.size())\n"
+            "\t\t\tthis->bits.resize((bit >> 6) + 1);\n"
+            "\t\tthis->bits[bit >> 6] |= uint64_t(1) << (bit & 63);\n"
+            "\t}\n"
+            "\t// Mark all the states of the trail as failed.\n"
+            "\tvoid fail_trail() {\n"
+            "\t\tfor (const auto& entry : this->trail)\n"
+            "\t\t\tfor (uint64_t pos = entry.first; pos <= entry.last; pos++)\n"
+            "\t\t\t\tthis->set_failed(entry.state, pos);\n"
+            "\t\tthis->trail.clear();\n"
+            "\t}\n"
+            "\t// Forget the positions before pos, which will not be scanned again.\n"
+            "\tvoid advance(uint64_t pos) {\n"
+            "\t\tuint64_t shift{(pos - this->base) / 64 * 64};\n"
+            "\t\tuint64_t words{shift / 64 * STATES_NUM};\n"
+            "\t\tif (shift == 0 || words * 2 < this->bits.size())\n"
+            "\t\t\treturn;\n"
+            "\t\tif (words >= this->bits.size())\n"
+            "\t\t\tthis->bits.clear();\n"
+            "\t\telse\n"
+            "\t\t\tthis->bits.erase(this->bits.begin(), this->bits.begin() + words);\n"
+            "\t\tthis->base += shift;\n"
+            "\t}\n"
+            "};\n\n"
+        ])
+
+        # emit TokenColumns struct
+        header.writelines([
+            "#ifndef MY_LITTLE_LEXER_NO_BUFFER_SCANNER\n"
+            "// Token types and spans of a whole buffer, in parallel arrays (see Lexer::tokenize_all).\n"
+            "struct TokenColumns {\n"
+            "\t// TokenType values.\n"
+            "\tstd::vector<uint16_t> types;\n"
+            "\tstd::vector<uint64_t> starts;\n"
+            "\tstd::vector<uint64_t> lengths;\n"
+            "};\n"
+            "#endif\n\n"
+        ])
+
         # emit Lexer class
         header.writelines([
             "// Takes a stream of characters from the input file and tokenizes them\n"
@@ -94,55 +255,475 @@ def create_header_and_emit_manifest(manifest, token_list, states_num):
 
         header.writelines([
             "class Lexer {\n"
-            "\tstatic uint32_t token_class;\n"
-            "\tstatic bool is_last_token;\n"
             "\t// Input file.\n"
             "\tstd::ifstream filestream;\n"
+            "\t// Offset of the next lexeme in the input file.\n"
+            "\tuint64_t offset;\n"
+            "\tstd::shared_ptr<LineIndex> line_index;\n"
+            "\t// User-provided object which is passed to the pattern code.\n"
+            "\tvoid* context;\n"
             "\t// Current DFA state.\n"
             "\tStates state;\n"
             "\t// A stack of states used for backtracking.\n"
             "\tstd::stack<States> states_stack;\n"
+            "\t// Failures of the looping states, used to avoid scanning the same input twice.\n"
+            "\tFailureMemo memo;\n"
+            "#ifdef MY_LITTLE_LEXER_STATS\n"
+            "\tLexerStats stats{};\n"
+            "#endif\n"
             "\t// Return the next character of the input file.\n"
             "\tchar next_char() { return static_cast<char>(this->filestream.get()); }\n"
-            "\t// Roll back the filestream one character.\n"
-            "\tvoid rollback() { this->filestream.seekg(-1, std::ios_base::cur); }\n\n"
+            "\t// Roll back the filestream one character. If the last read hit the end of the\n"
+            "\t// file, nothing was consumed, so just clear the stream state.\n"
+            "\tvoid rollback() {\n"
+            "\t\tif (this->filestream.eof())\n"
+            "\t\t\tthis->filestream.clear();\n"
+            "\t\telse\n"
+            "\t\t\tthis->filestream.seekg(-1, std::ios_base::cur);\n"
+            "\t}\n\n"
+            "#ifndef MY_LITTLE_LEXER_NO_BUFFER_SCANNER\n"
+            "\t// The longest match of the DFA found in an in-memory buffer.\n"
+            "\tstruct Match {\n"
+            "\t\tuint64_t start;\n"
+            "\t\t// Zero if no pattern matches at the start position.\n"
+            "\t\tuint64_t length;\n"
+            "\t\t// Accepting state in which the match ended.\n"
+            "\t\tStates state;\n"
+            "\t\t// End of the input which was read to find the match, one past the end of the\n"
+            "\t\t// buffer if the scanner hit it.\n"
+            "\t\tuint64_t scan_end;\n"
+            "\t};\n"
+            "\t// Find the longest match which starts at the provided position of the buffer.\n"
+            "\t// The memo must only be shared by the calls on the same buffer, with increasing positions.\n"
+            "\tstatic Match match(const char* buf, uint64_t size, uint64_t pos, FailureMemo& memo);\n"
+            "\t// Speculatively tokenize the [begin, end) chunk of the buffer, assuming that a\n"
+            "\t// token starts at begin. The last match may extend past the end of the chunk.\n"
+            "\tstatic std::vector<Match> scan_chunk(const char* buf, uint64_t size, uint64_t begin, uint64_t end);\n"
+            "\t// Write the tokens as tokenize_all does, with a memo shared by consecutive calls.\n"
+            "\tstatic uint64_t tokenize_columns(const char* buf, uint64_t size, uint64_t& pos, uint16_t* types,\n"
+            "\t\t\tuint64_t* starts, uint64_t* lengths, uint64_t capacity, FailureMemo& memo);\n"
+            "#endif\n"
+            "\t// Call the user-provided code of the pattern recognized by the accepting state.\n"
+            "\tstatic void run_action(States state, std::shared_ptr<Token> tok, void* context);\n\n"
             "\t// Whether the provided state is an accepting state.\n"
             "\tstatic constexpr bool is_accepting_state(States);\n"
-            "\t// Whether the provided character is newline.\n"
-            "\tstatic constexpr bool is_newline(char c) { return c == 10 || c == 13; }\n"
+            "\t// Whether the provided state recognizes a pattern whose matches are skipped.\n"
+            "\tstatic constexpr bool is_skip_state(States);\n"
             "\t// Try to tokenize next word from the input file. This is the heart of the\n"
             "\t// lexer. This method implements a table-driven, direct-coded scanning algorithm\n"
             "\t// described in 'Engineering a Compiler' by Cooper and Torczon (2nd edition, p. 60).\n"
-            "\tstd::shared_ptr<Token> next_word();\n"
+            "\tstd::shared_ptr<Token> next_word();\n\n"
+            "\tfriend class IncrementalLexer;\n"
+            "\tfriend class PushLexer;\n"
             "public:\n"
             "\tLexer() = delete;\n"
             "\tLexer(const Lexer&) = delete;\n"
             "\tLexer(Lexer&&) = delete;\n"
-            "\tLexer(const char* input_file) { \n"
+            "\tLexer(const char* input_file, void* context = nullptr)\n"
+            "\t\t: offset(0), line_index(std::make_shared<LineIndex>(input_file)), context(context) {\n"
             "\t\tthis->filestream.open(input_file);\n"
-            "\t\tif (!this->filestream.is_open()) {\n"
-            "\t\t\tstd::cout << \"Input file not opened correctly!\" << std::endl;\n"
-            "\t\t\texit(1);\n"
-            "\t\t}\n"
+            "\t\tif (!this->filestream.is_open())\n"
+            "\t\t\tthrow std::runtime_error(\"Input file not opened correctly!\");\n"
             "\t}\n"
             "\t~Lexer() { this->filestream.close(); }\n"
             "\tLexer& operator=(Lexer&) = delete;\n"
             "\tLexer& operator=(Lexer&&) = delete;\n"
+            "\tvoid set_context(void* context) { this->context = context; }\n"
+            "\tvoid* get_context() const { return this->context; }\n"
             "\tstd::shared_ptr<Token> get_next_word();\n"
+            "#ifdef MY_LITTLE_LEXER_STATS\n"
+            "\t// Counters of this lexer, updated as get_next_word tokenizes the input.\n"
+            "\t// tokenize_parallel does not use a lexer instance, so it is not counted.\n"
+            "\tconst LexerStats& get_stats() const { return this->stats; }\n"
+            "\t// Copy of the counters, to be compared with a later snapshot.\n"
+            "\tLexerStats snapshot() const { return this->stats; }\n"
+            "\tvoid reset_stats() { this->stats = LexerStats{}; }\n"
+            "#endif\n"
+            "#ifndef MY_LITTLE_LEXER_NO_BUFFER_SCANNER\n"
+            "\t// Tokenize the whole input using num_threads threads (all available cores if 0).\n"
+            "\t// The input is split into chunks which are tokenized speculatively and then\n"
+            "\t// stitched together, so the returned tokens (ending with a LAST or an ERROR token)\n"
+            "\t// are exactly the ones get_next_word would return. Pattern code runs in input order.\n"
+            "\t// The input must outlive the line and column queries of the returned tokens.\n"
+            "\tstatic std::vector<std::shared_ptr<Token>> tokenize_parallel(const std::string& input,\n"
+            "\t\t\tunsigned num_threads = 0, void* context = nullptr);\n"
+            "\t// Tokenize the whole buffer into parallel arrays of token types, starts and lengths,\n"
+            "\t// ending with a LAST or an ERROR token. No pattern code is run: the type of a token\n"
+            "\t// is the one its pattern code sets, if that is all the code does, and DEFAULT\n"
+            "\t// otherwise. Matches of the skipped patterns are left out.\n"
+            "\tstatic TokenColumns tokenize_all(const char* buf, uint64_t size);\n"
+            "\t// Same as above, but write at most capacity tokens into the caller's arrays, starting\n"
+            "\t// from the offset pos of the buffer, and advance pos past them. Returns the number of\n"
+            "\t// tokens written, the last one being LAST or ERROR once the tokens have ended.\n"
+            "\tstatic uint64_t tokenize_all(const char* buf, uint64_t size, uint64_t& pos, uint16_t* types,\n"
+            "\t\t\tuint64_t* starts, uint64_t* lengths, uint64_t capacity);\n"
+            "#endif\n"
+            "#ifdef MY_LITTLE_LEXER_PROFILE\n"
+            "\t// Write the hit counts of the DFA states and transitions, summed over all lexers\n"
+            "\t// of the process, to the profile file. Pass the profile to the generator to lay\n"
+            "\t// out the scanner for the recorded input.\n"
+            "\tstatic void dump_profile(const char* filename);\n"
+            "#endif\n"
+            "};\n\n"
+        ])
+
+        # emit TokenSpan struct and IncrementalLexer class
+        header.writelines([
+            "#ifndef MY_LITTLE_LEXER_NO_BUFFER_SCANNER\n"
+            "// Token recognized by the IncrementalLexer.\n"
+            "struct TokenSpan {\n"
+            "\tTokenType token_type;\n"
+            "\t// Offset and length of the lexeme in the input.\n"
+            "\tuint64_t start;\n"
+            "\tuint64_t length;\n"
+            "\t// The input before scan_end was read to recognize this token (and the ones\n"
+            "\t// before it), so an edit before scan_end may change it.\n"
+            "\tuint64_t scan_end;\n"
             "};\n\n"
+            "// Lexer of an in-memory input which is edited over time. After an edit, the tokens\n"
+            "// are lexed again from the first one the edit could have changed, only until the\n"
+            "// new tokens line up with the old ones past the edit, so the scanning work depends\n"
+            "// on the size of the change rather than the size of the input. Tokens are the ones\n"
+            "// tokenize_parallel would return, and pattern code only runs for the new tokens, so\n"
+            "// it should only depend on the token itself.\n"
+            "// The input and the tokens are kept in gap buffers, with their gaps where the last\n"
+            "// edit was lexed, so an edit only moves the bytes and the tokens between it and\n"
+            "// the previous one, and the tokens after it are not updated.\n"
+            "class IncrementalLexer {\n"
+            "\t// The input is text[0, gap) followed by text[gap_end, text.size()).\n"
+            "\tstd::string text;\n"
+            "\tuint64_t gap;\n"
+            "\tuint64_t gap_end;\n"
+            "\t// Tokens of the input, ending with a LAST or an ERROR token, which are\n"
+            "\t// tokens[0, token_gap) followed by tokens[token_gap_end, tokens.size()). The\n"
+            "\t// tokens after the gap keep their offsets from the end of the input (start from\n"
+            "\t// its size, scan_end from one past it), which edits before them do not change.\n"
+            "\tstd::vector<TokenSpan> tokens;\n"
+            "\tsize_t token_gap;\n"
+            "\tsize_t token_gap_end;\n"
+            "\tvoid* context;\n"
+            "\t// Move the gap of the input to offset.\n"
+            "\tvoid move_gap(uint64_t offset);\n"
+            "\t// Make the gap of the input at least length bytes long.\n"
+            "\tvoid reserve_gap(uint64_t length);\n"
+            "\t// Move the gap of the tokens to the token at index.\n"
+            "\tvoid move_token_gap(size_t index);\n"
+            "\t// Lex the input again from the token at first, which is right after the gap of the\n"
+            "\t// tokens, until the new tokens line up with the old ones at or after edit_end.\n"
+            "\tstd::pair<size_t, size_t> relex(size_t first, uint64_t edit_end);\n"
+            "public:\n"
+            "\tIncrementalLexer(std::string input, void* context = nullptr);\n"
+            "\tuint64_t get_input_size() const { return this->text.size() - (this->gap_end - this->gap); }\n"
+            "\t// The length bytes of the input at offset.\n"
+            "\tstd::string get_text(uint64_t offset, uint64_t length) const;\n"
+            "\t// Copy of the whole input.\n"
+            "\tstd::string get_input() const { return this->get_text(0, this->get_input_size()); }\n"
+            "\tsize_t get_token_count() const {\n"
+            "\t\treturn this->tokens.size() - (this->token_gap_end - this->token_gap);\n"
+            "\t}\n"
+            "\tTokenSpan get_token(size_t index) const;\n"
+            "\t// Copy of all the tokens.\n"
+            "\tstd::vector<TokenSpan> get_tokens() const;\n"
+            "\tstd::string get_lexeme(const TokenSpan& token) const {\n"
+            "\t\treturn this->get_text(token.start, token.length);\n"
+            "\t}\n"
+            "\tvoid set_context(void* context) { this->context = context; }\n"
+            "\t// Replace deleted bytes at offset with the inserted text, and update the tokens.\n"
+            "\t// Returns the range [first, last) of the new tokens. The tokens after it are the\n"
+            "\t// old ones, moved by the change of the input size.\n"
+            "\tstd::pair<size_t, size_t> edit(uint64_t offset, uint64_t deleted, const std::string& inserted);\n"
+            "};\n"
+            "#endif\n\n"
+        ])
+
+        # emit PushLexer class
+        header.writelines([
+            "#ifndef MY_LITTLE_LEXER_NO_PUSH_SCANNER\n"
+            "// Lexer of an input which arrives in chunks (eg. from the network). The DFA state\n"
+            "// and the bytes of the token which is being scanned are kept between the chunks,\n"
+            "// so a token may span any number of chunks, and feeding a chunk never blocks.\n"
+            "// Tokens only know their offsets, their line and column are not tracked.\n"
+            "class PushLexer {\n"
+            "\t// Offset of the token which is being scanned.\n"
+            "\tuint64_t start;\n"
+            "\t// The input from carry_base (at most start) to the end of the last chunk.\n"
+            "\tuint64_t carry_base;\n"
+            "\tstd::string carry;\n"
+            "\t// DFA state in which the scanner stopped at the end of the last chunk.\n"
+            "\tStates state;\n"
+            "\t// Last accepting state seen since start, and the end of its match.\n"
+            "\tStates accepted;\n"
+            "\tuint64_t accepted_end;\n"
+            "\tFailureMemo memo;\n"
+            "\tvoid* context;\n"
+            "\t// Whether the scanner is skipping the bytes of an error token.\n"
+            "\tbool failed;\n"
+            "\t// Whether the LAST or an ERROR token has been returned.\n"
+            "\tbool done;\n"
+            "\t// Run the DFA from the saved state over [p, end) of the buf segment of the input,\n"
+            "\t// whose first byte is at offset base. Stops at the end, or at a dead end in SE.\n"
+            "\tconst char* scan(const char* buf, const char* p, const char* const end, uint64_t base);\n"
+            "\t// The input from start to end, from the carry and the chunk at offset chunk_base.\n"
+            "\tstd::string lexeme(const char* buf, uint64_t chunk_base, uint64_t end) const;\n"
+            "\t// Tokenize the chunk, and at the end of the input, the rest of the carry.\n"
+            "\tstd::vector<std::shared_ptr<Token>> lex(const char* buf, uint64_t len, bool eof);\n"
+            "public:\n"
+            "\tPushLexer(void* context = nullptr)\n"
+            "\t\t: start(0), carry_base(0), state(States::S0), accepted(States::BAD), accepted_end(0),\n"
+            "\t\tcontext(context), failed(false), done(false) {}\n"
+            "\tvoid set_context(void* context) { this->context = context; }\n"
+            "\tvoid* get_context() const { return this->context; }\n"
+            "\t// Tokenize the next chunk of the input, and return the tokens which are complete,\n"
+            "\t// that is the ones the rest of the input can not change. The chunk is not kept,\n"
+            "\t// only the bytes of the unfinished token are copied.\n"
+            "\tstd::vector<std::shared_ptr<Token>> feed(const char* buf, uint64_t len) {\n"
+            "\t\treturn this->lex(buf, len, false);\n"
+            "\t}\n"
+            "\t// Tokenize the rest of the input once it has ended, ending with a LAST or an\n"
+            "\t// ERROR token. Once either is returned, feed and finish return no more tokens.\n"
+            "\tstd::vector<std::shared_ptr<Token>> finish() { return this->lex(nullptr, 0, true); }\n"
+            "\t// Offset of the input up to which the tokens have been returned.\n"
+            "\tuint64_t get_offset() const { return this->start; }\n"
+            "};\n"
+            "#endif\n\n"
         ])
 
         # emit guard end
-        header.write("#endif //__MY_LITTLE_LEXER_H")
+        header.write("#endif //" + guard)
+
+
+# emit the tables of the computed goto backend into the scanner function, one table of 256 label addresses for every
+# state, indexed by the input character, with dead_label for the missing transitions
+# states with the same transitions share the table
+# returns the dictionary of the table names by states
+def emit_dispatch_tables(body, dtran, states, dead_label):
+    body.write("#ifdef MY_LITTLE_LEXER_COMPUTED_GOTO\n")
+    tables = {}
+    names = {}
+    for state in states:
+        targets = [dead_label] * 256
+        for (sym, target) in dtran.transitions(state):
+            targets[sym] = "S" + str(target)
+        key = tuple(targets)
+        if key not in tables:
+            tables[key] = "dispatch_" + str(len(tables))
+            body.write("\tstatic void* const " + tables[key] + "[256]{\n")
+            for row in range(0, 256, 8):
+                body.write("\t\t" + ", ".join("&&" + target for target in targets[row:row + 8]) + ",\n")
+            body.write("\t};\n")
+        names[state] = tables[key]
+    body.write("#endif\n\n")
+    return names
+
+
+# emit the switch over the input character c which makes the transitions of the DFA state
+# every transition counts its hits when profiling, and the ones which were not taken fall through to default_code
+# if a Profile is provided, the cases are ordered from the hottest one, and a transition which takes most of the exits
+# of the state is tested before the switch
+# if the name of the dispatch table of the state is provided (computed goto backend), the switch is only the fallback
+# for the compilers which do not support computed goto, and for profiling, which has to count the transitions
+def emit_transitions(body, dtran, state, default_code, profile, dispatch=None):
+    if dispatch is not None:
+        body.writelines([
+            "#ifdef MY_LITTLE_LEXER_COMPUTED_GOTO\n"
+            "\tgoto *" + dispatch + "[static_cast<unsigned char>(c)];\n"
+            "#else\n"
+        ])
+
+    transitions = dtran.transitions(state)
+    # indexes of the transitions in the transition matrix, by their input symbols
+    indexes = {sym: dtran.offsets[state] + j for (j, (sym, target)) in enumerate(transitions)}
+
+    if profile is not None:
+        hot = profile.hot_transition(state, transitions)
+        transitions = profile.order_transitions(state, transitions)
+        if hot is not None:
+            (sym, target) = hot
+            body.writelines([
+                "\tif (c == " + char_literal(sym) + ") {\n"
+                "\t\tPROFILE_TRANSITION(" + str(indexes[sym]) + ");\n"
+                "\t\tgoto S" + str(target) + ";\n"
+                "\t}\n"
+            ])
+            transitions.remove(hot)
+
+    body.write("\tswitch (c) {\n")
+    for (sym, target) in transitions:
+        body.writelines([
+            "\tcase " + char_literal(sym) + ":\n"
+            "\t\tPROFILE_TRANSITION(" + str(indexes[sym]) + ");\n"
+            "\t\tgoto S" + str(target) + ";\n"
+        ])
+    body.writelines([
+        "\tdefault:\n",
+        default_code,
+        "\t}\n"
+    ])
+    body.write("#endif\n\n" if dispatch is not None else "\n")
+
+
+# return the list of (first, last) ranges of consecutive input symbols which make up the sorted list of symbols
+def symbol_ranges(syms):
+    ranges = []
+    for sym in syms:
+        if len(ranges) > 0 and ranges[-1][1] == sym - 1:
+            ranges[-1] = (ranges[-1][0], sym)
+        else:
+            ranges.append((sym, sym))
+    return ranges
+
+
+# emit the static table of 256 bools which is true for the provided input symbols
+def emit_symbol_table(body, name, syms):
+    sym_set = set(syms)
+    entries = ["1" if sym in sym_set else "0" for sym in range(256)]
+    body.write("static const bool " + name + "[256]{\n")
+    for row in range(0, 256, 32):
+        body.write("\t" + ", ".join(entries[row:row + 32]) + ",\n")
+    body.write("};\n\n")
+
+
+# return the sorted list of the bytes whose input symbols are the provided ones, through the fold table if there is one
+def symbol_bytes(syms, case_fold):
+    if case_fold is None:
+        return sorted(syms)
+    sym_set = set(syms)
+    return [byte for byte in range(256) if case_fold[byte] in sym_set]
+
+
+# return the C++ expression of the input symbol of the byte, which is looked up in the fold table if there is one
+def input_symbol(byte, case_fold):
+    if case_fold is None:
+        return byte
+    return "static_cast<char>(case_fold[static_cast<unsigned char>(" + byte + ")])"
+
+
+# emit the function which skips the run of the loop symbols (eg. the ones on which a DFA state loops), and returns the
+# first symbol which is not one of them (or the end of the buffer)
+# the run is searched for using memchr if there is only one symbol which does not loop, and using SSE2 if there are
+# only a few of them, or if the loop symbols make up only a few ranges, always followed by a scalar loop over the 256
+# entry table of loop symbols, which also handles the rest of the buffer which is too short for an SSE2 load
+def emit_skip_function(body, name, loop_syms, table):
+    stop_syms = sorted(set(range(256)) - set(loop_syms))
+    ranges = symbol_ranges(loop_syms)
+
+    body.write("static inline const char* " + name + "(const char* p, const char* const end) {\n")
+    if len(stop_syms) == 1:
+        body.writelines([
+            "\tconst void* stop{std::memchr(p, " + char_literal(stop_syms[0]) + ", end - p)};\n"
+            "\treturn stop ? static_cast<const char*>(stop) : end;\n"
+            "}\n\n"
+        ])
+        return
+
+    if 0 < len(stop_syms) <= 4 or 0 < len(ranges) <= 3:
+        body.write("#if defined(__SSE2__) && defined(__GNUC__)\n")
+        if 0 < len(stop_syms) <= 4:
+            # a byte stops the run if it is equal to one of the stop symbols
+            for (k, sym) in enumerate(stop_syms):
+                body.write("\tconst __m128i stop" + str(k) + "{_mm_set1_epi8(" + char_literal(sym) + ")};\n")
+            compares = ["_mm_cmpeq_epi8(x, stop" + str(k) + ")" for k in range(len(stop_syms))]
+            stops = compares[0]
+            for compare in compares[1:]:
+                stops = "_mm_or_si128(" + stops + ",\n\t\t\t\t" + compare + ")"
+            mask = "_mm_movemask_epi8(" + stops + ")"
+        else:
+            # a byte continues the run if it is in one of the ranges, that is if (byte - first) <= (last - first) as
+            # unsigned bytes, which is tested as max(byte - first, last - first) == last - first
+            compares = []
+            for (k, (first, last)) in enumerate(ranges):
+                body.write("\tconst __m128i first" + str(k) + "{_mm_set1_epi8(" + char_literal(first) + ")};\n")
+                if first == last:
+                    compares.append("_mm_cmpeq_epi8(x, first" + str(k) + ")")
+                    continue
+                body.write("\tconst __m128i width" + str(k) + "{_mm_set1_epi8(" + char_literal(last - first) + ")};\n")
+                compares.append("_mm_cmpeq_epi8(_mm_max_epu8(_mm_sub_epi8(x, first" + str(k) + "), width" + str(k) +
+                                "), width" + str(k) + ")")
+            loops = compares[0]
+            for compare in compares[1:]:
+                loops = "_mm_or_si128(" + loops + ",\n\t\t\t\t" + compare + ")"
+            mask = "~_mm_movemask_epi8(" + loops + ") & 0xffff"
+        body.writelines([
+            "\tfor (; end - p >= 16; p += 16) {\n"
+            "\t\tconst __m128i x{_mm_loadu_si128(reinterpret_cast<const __m128i*>(p))};\n"
+            "\t\tconst int mask{" + mask + "};\n"
+            "\t\tif (mask != 0)\n"
+            "\t\t\treturn p + __builtin_ctz(mask);\n"
+            "\t}\n"
+            "#endif\n"
+        ])
+
+    body.writelines([
+        "\twhile (p < end && " + table + "[static_cast<unsigned char>(*p)])\n"
+        "\t\tp++;\n"
+        "\treturn p;\n"
+        "}\n\n"
+    ])
 
 
 # open the source file and emit class method definitions
-def create_body(dstates, dtran, dfa_acc_states, pattern_descs, token_list):
-    with open("my_little_lexer.cpp", 'w') as body:
+# the source file is named output_prefix.cpp, and it is opened in the provided OutputFiles
+# if a Profile is provided, the state blocks and transitions of the scanners are laid out according to it
+# memo_states is the list of DFA states whose failures are memoized (see backtracking_states), and skip_states maps
+# the self-looping states which skip runs of input in the buffer scanner to their loop symbols (see self_loop_states)
+# the transitions of the states are made by a switch over the input character (backend 'switch'), or by a jump through
+# the table of label addresses of the state (backend 'goto'), with the switch as the fallback for the compilers which do
+# not support computed goto
+# if a fold table is provided (see fold_patterns), the scanners make the transitions on the input symbols of the bytes
+# it maps them to, and the lexemes keep the bytes of the input
+def create_body(outputs, dstates, dtran, dfa_acc_states, pattern_descs, token_list, output_prefix="my_little_lexer",
+                profile=None, memo_states=(), skip_states=None, backend="switch", case_fold=None):
+    skip_states = skip_states if skip_states is not None else {}
+    computed_goto = backend == "goto"
+    # order of the state blocks in the scanners
+    state_order = list(range(len(dstates))) if profile is None else profile.state_order()
+    # indexes of the memoized states in the FailureMemo
+    memo_indexes = {state: index for (index, state) in enumerate(memo_states)}
+
+    with outputs.open(output_prefix + ".cpp") as body:
         # emit includes
         body.writelines([
             "#include <type_traits>\n"
-            "#include \"my_little_lexer.h\"\n\n"
+            "#include <algorithm>\n"
+            "#include <cstring>\n"
+            "#include <future>\n"
+            "#include <thread>\n"
+            "#include \"" + os.path.basename(output_prefix) + ".h\"\n\n"
+        ])
+        body.writelines([
+            "#if defined(__SSE2__) && defined(__GNUC__)\n"
+            "#include <emmintrin.h>\n"
+            "#endif\n\n"
+        ])
+        # profiling counts the transitions in the cases of the switches, so it always uses them
+        if computed_goto:
+            body.writelines([
+                "#if defined(__GNUC__) && !defined(MY_LITTLE_LEXER_PROFILE) && \\\n"
+                "\t\t!defined(MY_LITTLE_LEXER_NO_COMPUTED_GOTO)\n"
+                "#define MY_LITTLE_LEXER_COMPUTED_GOTO\n"
+                "#endif\n\n"
+            ])
+
+        # emit the profiling counters
+        # they are atomic, since tokenize_parallel runs the scanner on many threads at once
+        transitions_num = dtran.transition_count()
+        body.writelines([
+            "#ifdef MY_LITTLE_LEXER_PROFILE\n"
+            "#include <atomic>\n\n"
+            "// Hit counts of the DFA states and transitions, see Lexer::dump_profile.\n"
+            "static std::atomic<uint64_t> profile_state_hits[" + str(len(dstates)) + "];\n"
+            "static std::atomic<uint64_t> profile_transition_hits[" + str(max(transitions_num, 1)) + "];\n"
+            "#define PROFILE_STATE(s) profile_state_hits[s].fetch_add(1, std::memory_order_relaxed)\n"
+            "#define PROFILE_TRANSITION(t) profile_transition_hits[t].fetch_add(1, std::memory_order_relaxed)\n"
+            "#else\n"
+            "#define PROFILE_STATE(s)\n"
+            "#define PROFILE_TRANSITION(t)\n"
+            "#endif\n\n"
+            "#ifdef MY_LITTLE_LEXER_STATS\n"
+            "#define STATS(stmt) stmt\n"
+            "#else\n"
+            "#define STATS(stmt)\n"
+            "#endif\n\n"
         ])
 
         # emit overloaded << operator for Token class
@@ -158,10 +739,57 @@ def create_body(dstates, dtran, dfa_acc_states, pattern_descs, token_list):
             "}\n\n"
         ])
 
+        # emit LineIndex class methods
+        # newlines are searched for using memchr, which is usually vectorized by the C library
+        body.writelines([
+            "void LineIndex::scan_to(uint64_t offset) {\n"
+            "\tchar block[1 << 16];\n"
+            "\twhile (this->scanned_to < offset && !this->done) {\n"
+            "\t\tconst char* data;\n"
+            "\t\tuint64_t n;\n"
+            "\t\tif (this->buf) {\n"
+            "\t\t\tdata = this->buf + this->scanned_to;\n"
+            "\t\t\tn = std::min<uint64_t>(this->size - this->scanned_to, sizeof(block));\n"
+            "\t\t}\n"
+            "\t\telse {\n"
+            "\t\t\tthis->filestream.read(block, sizeof(block));\n"
+            "\t\t\tdata = block;\n"
+            "\t\t\tn = this->filestream.gcount();\n"
+            "\t\t}\n"
+            "\t\tif (n == 0) {\n"
+            "\t\t\tthis->done = true;\n"
+            "\t\t\tbreak;\n"
+            "\t\t}\n\n"
+            "\t\tconst char* p = data;\n"
+            "\t\tconst char* const end = data + n;\n"
+            "\t\twhile ((p = static_cast<const char*>(std::memchr(p, '\\n', end - p))) != nullptr) {\n"
+            "\t\t\tthis->newlines.push_back(this->scanned_to + (p - data));\n"
+            "\t\t\tp++;\n"
+            "\t\t}\n"
+            "\t\tthis->scanned_to += n;\n"
+            "\t}\n"
+            "}\n\n"
+            "uint64_t LineIndex::get_line(uint64_t offset) {\n"
+            "\tstd::lock_guard<std::mutex> lock(this->mutex);\n"
+            "\tthis->scan_to(offset);\n"
+            "\treturn 1 + (std::lower_bound(this->newlines.begin(), this->newlines.end(), offset) -\n"
+            "\t\t\tthis->newlines.begin());\n"
+            "}\n\n"
+            "uint64_t LineIndex::get_column(uint64_t offset) {\n"
+            "\tstd::lock_guard<std::mutex> lock(this->mutex);\n"
+            "\tthis->scan_to(offset);\n"
+            "\tauto it = std::lower_bound(this->newlines.begin(), this->newlines.end(), offset);\n"
+            "\tuint64_t line_start{it == this->newlines.begin() ? 0 : *(it - 1) + 1};\n"
+            "\treturn offset - line_start + 1;\n"
+            "}\n\n"
+        ])
+
         # emit the functions which contain the user-provided code for each pattern
+        # the context parameter is left unnamed if the code does not use it, so that it is not reported as unused
         for patt_desc in pattern_descs:
             if patt_desc.code != '':
-                body.write("void " + patt_desc.name + "__(std::shared_ptr<Token> token)\n")
+                context = " context" if re.search(r"\bcontext\b", patt_desc.code) else ""
+                body.write("void " + patt_desc.name + "__(std::shared_ptr<Token> token, void*" + context + ")\n")
                 for token in token_list:
                     if token in patt_desc.code:
                         patt_desc.code = patt_desc.code.replace(token, "TokenType::" + token)
@@ -181,6 +809,93 @@ def create_body(dstates, dtran, dfa_acc_states, pattern_descs, token_list):
 
         body.write("}\n\n")
 
+        # emit the is_skip_state Lexer class method
+        body.writelines([
+            "// Whether the provided state recognizes a pattern whose matches are skipped.\n"
+            "constexpr bool Lexer::is_skip_state(States s) {\n"
+            "\treturn (false\n"
+        ])
+
+        for patt_desc in pattern_descs:
+            if patt_desc.skip:
+                for state in patt_desc.dfa_acc_states:
+                    body.write("\t\t\t|| s == States::S" + str(state) + "\n")
+        body.write("\t\t\t);\n")
+
+        body.write("}\n\n")
+
+        # emit the run_action Lexer method
+        # each DFA accepting states recognize exactly one pattern, so just iterate through the list of patterns
+        # and emit calls to its user-provided code
+        body.writelines([
+            "void Lexer::run_action(States state, std::shared_ptr<Token> tok, void* context) {\n"
+            "\tswitch(state) {\n"
+        ])
+        for patt_desc in pattern_descs:
+            for dfa_acc_state in patt_desc.dfa_acc_states:
+                body.write("\tcase States::S" + str(dfa_acc_state) + ":\n")
+                if patt_desc.code != '':
+                    body.write("\t\t" + patt_desc.name + "__(tok, context);\n")
+                body.write("\t\tbreak;\n")
+        body.writelines([
+            "\tdefault:\n"
+            "\t\tbreak;\n"
+            "\t}\n"
+            "}\n\n"
+        ])
+
+        # emit the function which maps the memoized states to their indexes in the FailureMemo
+        if len(memo_states) > 0:
+            body.writelines([
+                "// Index of the state in the FailureMemo, or -1 if its failures are not memoized.\n"
+                "static int32_t failure_memo_index(States state) {\n"
+                "\tswitch (state) {\n"
+            ])
+            for state in memo_states:
+                body.writelines([
+                    "\tcase States::S" + str(state) + ":\n"
+                    "\t\treturn " + str(memo_indexes[state]) + ";\n"
+                ])
+            body.writelines([
+                "\tdefault:\n"
+                "\t\treturn -1;\n"
+                "\t}\n"
+                "}\n\n"
+            ])
+
+        # emit the fold table
+        if case_fold is not None:
+            body.writelines([
+                "// Input symbols of the bytes, the upper case letters which no pattern tells apart\n"
+                "// from the lower case ones are folded to them.\n"
+                "static const unsigned char case_fold[256]{\n"
+            ])
+            for row in range(0, 256, 16):
+                body.write("\t" + ", ".join(map(str, case_fold[row:row + 16])) + ",\n")
+            body.write("};\n\n")
+
+        # emit the skip functions of the self-looping states, and the tables of their loop symbols (the bytes of the
+        # symbols, which the skip functions read without folding them)
+        # states which loop on the same symbols share the table
+        tables = {}
+        for (state, loop_syms) in sorted(skip_states.items()):
+            loop_bytes = symbol_bytes(loop_syms, case_fold)
+            key = tuple(loop_bytes)
+            if key not in tables:
+                tables[key] = "loop_table_" + str(len(tables))
+                emit_symbol_table(body, tables[key], loop_bytes)
+            emit_skip_function(body, "skip_S" + str(state), loop_bytes, tables[key])
+
+        # emit the table of the bytes which can not start a token (the ones S0 has no transitions on), and the function
+        # which skips their runs
+        # an error token is made of the byte at which no pattern matches, and the run of these bytes after it, so that
+        # the scanners skip binary junk in one go, instead of failing at every one of its bytes
+        first_syms = {sym for (sym, target) in dtran.transitions(0)}
+        error_bytes = symbol_bytes([sym for sym in range(256) if sym not in first_syms], case_fold)
+        body.write("// Bytes which can not start a token.\n")
+        emit_symbol_table(body, "error_bytes", error_bytes)
+        emit_skip_function(body, "skip_error_bytes", error_bytes, "error_bytes")
+
         # emit the get_next_word Lexer method
         body.writelines([
             "std::shared_ptr<Token> Lexer::get_next_word() {\n"
@@ -193,75 +908,752 @@ def create_body(dstates, dtran, dfa_acc_states, pattern_descs, token_list):
         # emit the next_word Lexer method
         body.writelines([
             "std::shared_ptr<Token> Lexer::next_word() {\n"
-            "Init:\n"
-            "\tstatic int16_t line{1};\n"
             "\tstd::string lexeme{""};\n"
-            "\tchar c;\n"
-            "\tthis->state = States::S0;\n\n"
+            "\tstd::shared_ptr<Token> tok;\n"
+            "\tstd::char_traits<char>::int_type next;\n"
+            "\tchar c;\n\n"
+            "Init:\n"
+            "\tthis->state = States::S0;\n"
+            "\tthis->memo.advance(this->offset);\n\n"
             "\twhile (!this->states_stack.empty())\n"
             "\t\tthis->states_stack.pop();\n"
             "\tthis->states_stack.push(States::BAD);\n\n"
+            "\t// A byte which can not start a token is an error right away.\n"
+            "\tnext = this->filestream.peek();\n"
+            "\tif (next != std::char_traits<char>::eof() && error_bytes[static_cast<unsigned char>(next)])\n"
+            "\t\tgoto Error;\n\n"
         ])
+        dispatch = emit_dispatch_tables(body, dtran, state_order, "SDead") if computed_goto else {}
+        # the lexeme keeps the byte, and the transitions are made on its input symbol
+        read_symbol = "\tc = " + input_symbol("c", case_fold) + ";\n" if case_fold is not None else ""
 
-        for i in range(len(dstates)):
+        if state_order[0] != 0:
+            body.write("\tgoto S0;\n\n")
+
+        for i in state_order:
             body.writelines([
                 "S" + str(i) + ":\n"
-                "\tthis->state = States::S" + str(i) + ";\n\n"
-                "\tc = this->next_char();\n"
-                "\tif (this->is_newline(c))\n"
-                "\t\tline++;\n\n"
-                "\tlexeme.push_back(c);\n\n"
-                "\tif (this->is_accepting_state(this->state))\n"
-                "\t\twhile (!this->states_stack.empty())\n"
-                "\t\t\tthis->states_stack.pop();\n"
-                "\tthis->states_stack.push(this->state);\n\n"
+                "\tPROFILE_STATE(" + str(i) + ");\n"
             ])
-
-            body.write("\tswitch (c) {\n")
-            state = dtran[i]
-            for in_sym in state:
+            # a looping state which has already failed at this position is treated as a dead end
+            if i in memo_indexes:
                 body.writelines([
-                    "\tcase " + repr(in_sym[0]) + ":\n"
-                    "\t\tgoto S" + str(in_sym[1]) + ";\n"
+                    "\tif (this->memo.failed(" + str(memo_indexes[i]) + ", this->offset + lexeme.size())) {\n"
+                    "\t\tthis->state = States::SE;\n"
+                    "\t\tgoto SOut;\n"
+                    "\t}\n"
                 ])
-            body.writelines(["\tdefault:\n",
+            # the computed goto backend also leaves out the store of the current state, which is only needed for the
+            # accepting state test, as it is known here
+            if not computed_goto:
+                body.writelines([
+                    "\tthis->state = States::S" + str(i) + ";\n\n"
+                    "\tc = this->next_char();\n"
+                    "\tlexeme.push_back(c);\n",
+                    read_symbol,
+                    "\n"
+                    "\tif (this->is_accepting_state(this->state))\n"
+                    "\t\twhile (!this->states_stack.empty())\n"
+                    "\t\t\tthis->states_stack.pop();\n"
+                    "\tthis->states_stack.push(this->state);\n\n"
+                ])
+            else:
+                body.writelines([
+                    "\tc = this->next_char();\n"
+                    "\tlexeme.push_back(c);\n",
+                    read_symbol,
+                    "\n"
+                ])
+                if i in dfa_acc_states:
+                    body.writelines([
+                        "\twhile (!this->states_stack.empty())\n"
+                        "\t\tthis->states_stack.pop();\n"
+                    ])
+                body.write("\tthis->states_stack.push(States::S" + str(i) + ");\n\n")
+
+            emit_transitions(body, dtran, i,
                              "\t\tthis->state = States::SE;\n"
-                             "\t\tgoto SOut;\n"])
+                             "\t\tgoto SOut;\n", profile, dispatch.get(i))
 
-            body.write("\t}\n\n")
+        if computed_goto:
+            body.writelines([
+                "SDead:\n"
+                "\tthis->state = States::SE;\n\n"
+            ])
 
+        # all the states which are popped off the stack, except the accepting one, have failed at the positions at
+        # which they were entered
         body.writelines([
             "SOut:\n"
             "\twhile (!this->is_accepting_state(this->state) && this->state != States::BAD) {\n"
             "\t\tthis->state = this->states_stack.top();\n"
             "\t\tthis->states_stack.pop();\n\n"
-            "\t\tif (this->is_newline(lexeme.back()))\n"
-            "\t\t\tline--;\n\n"
-            "\t\tif (!lexeme.empty())\n"
+            "\t\tif (!lexeme.empty()) {\n"
+        ])
+        if len(memo_states) > 0:
+            body.writelines([
+                "\t\t\tint32_t memo_index{failure_memo_index(this->state)};\n"
+                "\t\t\tif (memo_index >= 0)\n"
+                "\t\t\t\tthis->memo.set_failed(memo_index, this->offset + lexeme.size() - 1);\n"
+            ])
+        body.writelines([
             "\t\t\tlexeme.pop_back();\n"
-            "\t\tthis->rollback();\n"
+            "\t\t\tthis->rollback();\n"
+            "\t\t\tSTATS(this->stats.backtracked++);\n"
+            "\t\t}\n"
             "\t}\n\n"
-            "\tstd::shared_ptr<Token> tok{std::make_shared<Token>(lexeme, TokenType::DEFAULT, line, false)};\n"
-            "\tif (this->is_accepting_state(this->state)) {\n"
+            "\tSTATS(this->stats.bytes += lexeme.size());\n\n"
+            "\t// Matches of the skipped patterns are consumed without creating tokens.\n"
+            "\tif (this->is_skip_state(this->state)) {\n"
+            "\t\tthis->offset += lexeme.size();\n"
+            "\t\tlexeme.clear();\n"
+            "\t\tgoto Init;\n"
+            "\t}\n"
+            "\t// Unless the token was about to start at the end of the input, nothing matches.\n"
+            "\tif (!this->is_accepting_state(this->state) &&\n"
+            "\t\t\tthis->filestream.peek() != std::char_traits<char>::eof())\n"
+            "\t\tgoto Error;\n\n"
+            "\ttok = std::make_shared<Token>(lexeme, TokenType::DEFAULT, this->offset, false, this->line_index);\n"
+            "\tthis->offset += lexeme.size();\n"
+            "\tif (this->is_accepting_state(this->state))\n"
+            "\t\tthis->run_action(this->state, tok, this->context);\n"
+            "\telse\n"
+            "\t\ttok->set_token_type(TokenType::LAST);\n\n"
+            "\tSTATS(this->stats.tokens[static_cast<uint16_t>(tok->get_token_type())]++);\n"
+            "\treturn tok;\n\n"
+            "\t// The byte at which no pattern matches, and the bytes after it which can not start\n"
+            "\t// a token, make up the error token, so the lexer can go on from the next byte\n"
+            "\t// which can.\n"
+            "Error:\n"
+            "\tlexeme.push_back(this->next_char());\n"
+            "\twhile ((next = this->filestream.peek()) != std::char_traits<char>::eof() &&\n"
+            "\t\t\terror_bytes[static_cast<unsigned char>(next)])\n"
+            "\t\tlexeme.push_back(this->next_char());\n"
+            "\tSTATS(this->stats.bytes += lexeme.size());\n"
+            "\tSTATS(this->stats.errors++);\n"
+            "\tSTATS(this->stats.tokens[static_cast<uint16_t>(TokenType::ERROR)]++);\n"
+            "\ttok = std::make_shared<Token>(lexeme, TokenType::ERROR, this->offset, false, this->line_index);\n"
+            "\tthis->offset += lexeme.size();\n"
+            "\treturn tok;\n"
         ])
 
-        # each DFA accepting states recognize exactly one pattern, so just iterate through the list of patterns
-        # and emit calls to its user-provided code
-        body.write("\t\tswitch(this->state) {\n")
+        body.write("}\n\n")
+
+        # emit the match Lexer method
+        # it is the same direct-coded scanner as next_word, only working on an in-memory buffer, so instead of
+        # keeping a stack of states for backtracking, we just remember the last accepting state we have seen
+        # the memoized states entered since then are kept in the trail of the memo, and marked as failed when the
+        # scanner hits a dead end
+        body.writelines([
+            "#ifndef MY_LITTLE_LEXER_NO_BUFFER_SCANNER\n"
+            "Lexer::Match Lexer::match(const char* buf, uint64_t size, uint64_t pos, FailureMemo& memo) {\n"
+            "\tconst char* p = buf + pos;\n"
+            "\tconst char* const end = buf + size;\n"
+            "\tMatch m{pos, 0, States::BAD, 0};\n"
+            "\tchar c;\n"
+            "\tmemo.advance(pos);\n"
+            "\tmemo.trail.clear();\n\n"
+        ])
+        if any(state in memo_indexes for state in skip_states):
+            body.write("\tconst char* run;\n\n")
+        dead_end = "\t\tgoto Fail;\n"
+        dispatch = emit_dispatch_tables(body, dtran, state_order, "Fail") if computed_goto else {}
+
+        if state_order[0] != 0:
+            body.write("\tgoto S0;\n\n")
+
+        for i in state_order:
+            body.writelines([
+                "S" + str(i) + ":\n"
+                "\tPROFILE_STATE(" + str(i) + ");\n"
+            ])
+            # a self-looping state skips the whole run of its loop symbols at once
+            # if its failures are memoized, all the positions of the run are in the trail, and if the state has already
+            # failed at the end of the run, it has failed anywhere in the run, as it could not have left it earlier
+            if i in memo_indexes and i in skip_states:
+                body.writelines([
+                    "\tif (memo.failed(" + str(memo_indexes[i]) + ", p - buf))\n"
+                    "\t\tgoto Fail;\n"
+                    "\trun = p;\n"
+                    "\tp = skip_S" + str(i) + "(p, end);\n"
+                    "\tif (p != run && memo.failed(" + str(memo_indexes[i]) + ", p - buf))\n"
+                    "\t\tgoto Fail;\n"
+                    "\tmemo.trail.emplace_back(" + str(memo_indexes[i]) + ", run - buf, p - buf);\n"
+                ])
+            elif i in memo_indexes:
+                body.writelines([
+                    "\tif (memo.failed(" + str(memo_indexes[i]) + ", p - buf))\n"
+                    "\t\tgoto Fail;\n"
+                    "\tmemo.trail.emplace_back(" + str(memo_indexes[i]) + ", p - buf, p - buf);\n"
+                ])
+            elif i in skip_states:
+                body.write("\tp = skip_S" + str(i) + "(p, end);\n")
+            if i in dfa_acc_states:
+                body.writelines([
+                    "\tm.length = p - buf - pos;\n"
+                    "\tm.state = States::S" + str(i) + ";\n"
+                ])
+                if len(memo_states) > 0:
+                    body.write("\tmemo.trail.clear();\n")
+            body.writelines([
+                "\tif (p == end)\n",
+                dead_end,
+                "\tc = " + input_symbol("*p++", case_fold) + ";\n\n"
+            ])
+
+            emit_transitions(body, dtran, i, dead_end, profile, dispatch.get(i))
+
+        body.write("Fail:\n")
+        if len(memo_states) > 0:
+            body.write("\tmemo.fail_trail();\n")
+        body.writelines([
+            "\tm.scan_end = p == end ? size + 1 : p - buf;\n"
+            "\treturn m;\n"
+        ])
+
+        body.write("}\n\n")
+
+        # emit the scan_chunk Lexer method
+        body.writelines([
+            "std::vector<Lexer::Match> Lexer::scan_chunk(const char* buf, uint64_t size, uint64_t begin,\n"
+            "\t\tuint64_t end) {\n"
+            "\tstd::vector<Match> matches;\n"
+            "\tFailureMemo memo;\n"
+            "\tuint64_t pos = begin;\n"
+            "\twhile (pos < end) {\n"
+            "\t\tMatch m{match(buf, size, pos, memo)};\n"
+            "\t\tmatches.push_back(m);\n"
+            "\t\tif (m.length == 0)\n"
+            "\t\t\tbreak;\n"
+            "\t\tpos += m.length;\n"
+            "\t}\n"
+            "\treturn matches;\n"
+            "}\n\n"
+        ])
+
+        # emit the tokenize_parallel Lexer method
+        # every chunk except the first one is tokenized speculatively, as if a token started at its beginning
+        # since the scanner always starts from S0, once the real token stream hits a position at which some
+        # speculative match starts, all the following speculative matches of that chunk are the real ones too
+        # until that happens (usually on the first token of the chunk), the real stream is tokenized sequentially
+        body.writelines([
+            "std::vector<std::shared_ptr<Token>> Lexer::tokenize_parallel(const std::string& input,\n"
+            "\t\tunsigned num_threads, void* context) {\n"
+            "\tconst char* buf = input.data();\n"
+            "\tconst uint64_t size = input.size();\n"
+            "\tif (num_threads == 0)\n"
+            "\t\tnum_threads = std::max(1u, std::thread::hardware_concurrency());\n\n"
+            "\t// Splitting small inputs is not worth the thread overhead.\n"
+            "\tconst uint64_t chunk_size = std::max<uint64_t>(size / num_threads + 1, 1 << 16);\n"
+            "\tstd::vector<uint64_t> bounds;\n"
+            "\tfor (uint64_t b = 0; b < size; b += chunk_size)\n"
+            "\t\tbounds.push_back(b);\n"
+            "\tbounds.push_back(size);\n\n"
+            "\tstd::vector<std::future<std::vector<Match>>> futures;\n"
+            "\tfor (size_t k = 1; k + 1 < bounds.size(); k++)\n"
+            "\t\tfutures.push_back(std::async(std::launch::async, scan_chunk, buf, size, bounds[k],\n"
+            "\t\t\t\tbounds[k + 1]));\n"
+            "\tstd::vector<std::vector<Match>> chunks;\n"
+            "\tchunks.push_back(scan_chunk(buf, size, 0, bounds[1]));\n"
+            "\tfor (auto& f : futures)\n"
+            "\t\tchunks.push_back(f.get());\n\n"
+            "\tstd::vector<std::shared_ptr<Token>> tokens;\n"
+            "\tstd::shared_ptr<LineIndex> line_index{std::make_shared<LineIndex>(buf, size)};\n"
+            "\tFailureMemo memo;\n"
+            "\tuint64_t pos{0};\n"
+            "\tsize_t k{0}, i{0};\n"
+            "\twhile (pos < size) {\n"
+            "\t\twhile (pos >= bounds[k + 1]) {\n"
+            "\t\t\tk++;\n"
+            "\t\t\ti = 0;\n"
+            "\t\t}\n"
+            "\t\tconst std::vector<Match>& spec = chunks[k];\n"
+            "\t\twhile (i < spec.size() && spec[i].start < pos)\n"
+            "\t\t\ti++;\n"
+            "\t\tMatch m{(i < spec.size() && spec[i].start == pos) ? spec[i++] : match(buf, size, pos, memo)};\n\n"
+
+            "\t\tif (m.length == 0) {\n"
+            "\t\t\tconst uint64_t error_end = skip_error_bytes(buf + pos + 1, buf + size) - buf;\n"
+            "\t\t\ttokens.push_back(std::make_shared<Token>(std::string(buf + pos, error_end - pos),\n"
+            "\t\t\t\t\tTokenType::ERROR, pos, false, line_index));\n"
+            "\t\t\treturn tokens;\n"
+            "\t\t}\n\n"
+            "\t\tif (is_skip_state(m.state)) {\n"
+            "\t\t\tpos += m.length;\n"
+            "\t\t\tcontinue;\n"
+            "\t\t}\n\n"
+            "\t\tstd::shared_ptr<Token> tok{std::make_shared<Token>(std::string(buf + pos, m.length),\n"
+            "\t\t\t\tTokenType::DEFAULT, pos, false, line_index)};\n"
+            "\t\trun_action(m.state, tok, context);\n"
+            "\t\tif (!tok->is_ignore())\n"
+            "\t\t\ttokens.push_back(tok);\n"
+            "\t\tpos += m.length;\n"
+            "\t}\n\n"
+            "\ttokens.push_back(std::make_shared<Token>(\"\", TokenType::LAST, pos, false, line_index));\n"
+            "\treturn tokens;\n"
+            "}\n\n"
+        ])
+
+        # emit the tokenize_all Lexer methods
+        # the token type of every accepting state is looked up in a table instead of running the pattern code, so the
+        # scanning loop never calls into the user code
+        column_types = ["TOKEN_SKIPPED"] * len(dstates)
         for patt_desc in pattern_descs:
-            for dfa_acc_state in patt_desc.dfa_acc_states:
-                body.write("\t\tcase States::S" + str(dfa_acc_state) + ":\n")
-                body.write("\t\t\t" + patt_desc.name + "__(tok);\n")
-                body.write("\t\t\tbreak;\n")
-        body.write("\t\t}\n")
+            token_type = static_token_type(patt_desc.code, token_list)
+            for state in patt_desc.dfa_acc_states:
+                if not patt_desc.skip:
+                    column_types[state] = "uint16_t(TokenType::" + (token_type or "DEFAULT") + ")"
+        body.writelines([
+            "// Token types of the accepting states for tokenize_all, TOKEN_SKIPPED for the\n"
+            "// states whose matches are skipped (and the states which do not accept).\n"
+            "static constexpr uint16_t TOKEN_SKIPPED{0xffff};\n"
+            "static const uint16_t column_token_types[" + str(len(dstates)) + "]{\n"
+        ])
+        for row in range(0, len(dstates), 4):
+            body.write("\t" + ", ".join(column_types[row:row + 4]) + ",\n")
+        body.writelines([
+            "};\n\n"
+            "uint64_t Lexer::tokenize_columns(const char* buf, uint64_t size, uint64_t& pos, uint16_t* types,\n"
+            "\t\tuint64_t* starts, uint64_t* lengths, uint64_t capacity, FailureMemo& memo) {\n"
+            "\tuint64_t n{0};\n"
+            "\twhile (n < capacity) {\n"
+            "\t\tif (pos == size) {\n"
+            "\t\t\ttypes[n] = uint16_t(TokenType::LAST);\n"
+            "\t\t\tstarts[n] = pos;\n"
+            "\t\t\tlengths[n++] = 0;\n"
+            "\t\t\tbreak;\n"
+            "\t\t}\n"
+            "\t\tMatch m{match(buf, size, pos, memo)};\n"
+            "\t\tif (m.length == 0) {\n"
+            "\t\t\ttypes[n] = uint16_t(TokenType::ERROR);\n"
+            "\t\t\tstarts[n] = pos;\n"
+            "\t\t\tlengths[n++] = skip_error_bytes(buf + pos + 1, buf + size) - buf - pos;\n"
+            "\t\t\tbreak;\n"
+            "\t\t}\n\n"
+            "\t\tconst uint16_t type{column_token_types[static_cast<uint32_t>(m.state)]};\n"
+            "\t\tif (type != TOKEN_SKIPPED) {\n"
+            "\t\t\ttypes[n] = type;\n"
+            "\t\t\tstarts[n] = pos;\n"
+            "\t\t\tlengths[n++] = m.length;\n"
+            "\t\t}\n"
+            "\t\tpos += m.length;\n"
+            "\t}\n"
+            "\treturn n;\n"
+            "}\n\n"
+            "uint64_t Lexer::tokenize_all(const char* buf, uint64_t size, uint64_t& pos, uint16_t* types,\n"
+            "\t\tuint64_t* starts, uint64_t* lengths, uint64_t capacity) {\n"
+            "\tFailureMemo memo;\n"
+            "\treturn tokenize_columns(buf, size, pos, types, starts, lengths, capacity, memo);\n"
+            "}\n\n"
+            "// The arrays grow geometrically, and are cut down to the number of tokens at the end.\n"
+            "TokenColumns Lexer::tokenize_all(const char* buf, uint64_t size) {\n"
+            "\tTokenColumns columns;\n"
+            "\tFailureMemo memo;\n"
+            "\tuint64_t pos{0};\n"
+            "\tuint64_t n{0};\n"
+            "\tdo {\n"
+            "\t\tconst uint64_t capacity{std::max<uint64_t>(2 * n, 1024)};\n"
+            "\t\tcolumns.types.resize(capacity);\n"
+            "\t\tcolumns.starts.resize(capacity);\n"
+            "\t\tcolumns.lengths.resize(capacity);\n"
+            "\t\tn += tokenize_columns(buf, size, pos, columns.types.data() + n, columns.starts.data() + n,\n"
+            "\t\t\t\tcolumns.lengths.data() + n, capacity - n, memo);\n"
+            "\t} while (columns.types[n - 1] != uint16_t(TokenType::LAST) &&\n"
+            "\t\t\tcolumns.types[n - 1] != uint16_t(TokenType::ERROR));\n"
+            "\tcolumns.types.resize(n);\n"
+            "\tcolumns.starts.resize(n);\n"
+            "\tcolumns.lengths.resize(n);\n"
+            "\treturn columns;\n"
+            "}\n\n"
+        ])
 
+        # emit the IncrementalLexer methods
+        # scan_end of every token includes the scan ends of the previous tokens, as the failures they have left in the
+        # memo depend on the input they have read, so it never decreases, and the first token which an edit may change
+        # is found by binary search
+        # the new tokens line up with the old ones when the scanner is about to start a token at the same position of
+        # the unchanged input after the edit as the one at which an old token starts, as everything from there on is
+        # lexed in the same way
+        # the scanner needs the input to be contiguous, which it is up to the gap, so when the scanner reaches the gap,
+        # the gap is moved on and the token is scanned again, without the failures memoized when the input seemed to
+        # end at the gap
         body.writelines([
+            "IncrementalLexer::IncrementalLexer(std::string input, void* context)\n"
+            "\t\t: text(std::move(input)), gap(this->text.size()), gap_end(this->text.size()), token_gap(0),\n"
+            "\t\ttoken_gap_end(0), context(context) {\n"
+            "\tthis->relex(0, 0);\n"
+            "}\n\n"
+            "std::string IncrementalLexer::get_text(uint64_t offset, uint64_t length) const {\n"
+            "\tstd::string result;\n"
+            "\tresult.reserve(length);\n"
+            "\tif (offset < this->gap)\n"
+            "\t\tresult.append(this->text, offset, std::min(length, this->gap - offset));\n"
+            "\tif (offset + length > this->gap) {\n"
+            "\t\tconst uint64_t from{std::max(offset, this->gap)};\n"
+            "\t\tresult.append(this->text, from + (this->gap_end - this->gap), offset + length - from);\n"
             "\t}\n"
-            "\telse if (c == std::char_traits<char>::eof())\n"
-            "\t\ttok->set_token_type(TokenType::LAST);\n"
-            "\telse\n"
-            "\t\ttok->set_token_type(TokenType::ERROR);\n\n"
-            "\treturn tok;\n"
+            "\treturn result;\n"
+            "}\n\n"
+            "TokenSpan IncrementalLexer::get_token(size_t index) const {\n"
+            "\tif (index < this->token_gap)\n"
+            "\t\treturn this->tokens[index];\n"
+            "\tconst TokenSpan& token{this->tokens[index + (this->token_gap_end - this->token_gap)]};\n"
+            "\tconst uint64_t size{this->get_input_size()};\n"
+            "\treturn TokenSpan{token.token_type, size - token.start, token.length, size + 1 - token.scan_end};\n"
+            "}\n\n"
+            "std::vector<TokenSpan> IncrementalLexer::get_tokens() const {\n"
+            "\tstd::vector<TokenSpan> result;\n"
+            "\tresult.reserve(this->get_token_count());\n"
+            "\tfor (size_t i = 0; i < this->get_token_count(); i++)\n"
+            "\t\tresult.push_back(this->get_token(i));\n"
+            "\treturn result;\n"
+            "}\n\n"
+            "void IncrementalLexer::move_gap(uint64_t offset) {\n"
+            "\tchar* data{&this->text[0]};\n"
+            "\tif (offset < this->gap) {\n"
+            "\t\tconst uint64_t n{this->gap - offset};\n"
+            "\t\tstd::memmove(data + this->gap_end - n, data + offset, n);\n"
+            "\t\tthis->gap -= n;\n"
+            "\t\tthis->gap_end -= n;\n"
+            "\t}\n"
+            "\telse if (offset > this->gap) {\n"
+            "\t\tconst uint64_t n{offset - this->gap};\n"
+            "\t\tstd::memmove(data + this->gap, data + this->gap_end, n);\n"
+            "\t\tthis->gap += n;\n"
+            "\t\tthis->gap_end += n;\n"
+            "\t}\n"
+            "}\n\n"
+            "void IncrementalLexer::reserve_gap(uint64_t length) {\n"
+            "\tif (this->gap_end - this->gap >= length)\n"
+            "\t\treturn;\n"
+            "\t// The gap grows along with the input, so that the input is only copied a few times.\n"
+            "\tconst uint64_t gap_length{length + std::max<uint64_t>(4096, this->get_input_size() / 2)};\n"
+            "\tconst uint64_t after{this->text.size() - this->gap_end};\n"
+            "\tstd::string grown(this->gap + gap_length + after, '\\0');\n"
+            "\tstd::memcpy(&grown[0], this->text.data(), this->gap);\n"
+            "\tstd::memcpy(&grown[0] + this->gap + gap_length, this->text.data() + this->gap_end, after);\n"
+            "\tthis->text = std::move(grown);\n"
+            "\tthis->gap_end = this->gap + gap_length;\n"
+            "}\n\n"
+            "void IncrementalLexer::move_token_gap(size_t index) {\n"
+            "\t// Offsets from the start of the input become offsets from its end, and the other\n"
+            "\t// way around.\n"
+            "\tconst uint64_t size{this->get_input_size()};\n"
+            "\twhile (this->token_gap > index) {\n"
+            "\t\tconst TokenSpan token{this->tokens[--this->token_gap]};\n"
+            "\t\tthis->tokens[--this->token_gap_end] = TokenSpan{token.token_type, size - token.start, token.length,\n"
+            "\t\t\t\tsize + 1 - token.scan_end};\n"
+            "\t}\n"
+            "\twhile (this->token_gap < index) {\n"
+            "\t\tconst TokenSpan token{this->tokens[this->token_gap_end++]};\n"
+            "\t\tthis->tokens[this->token_gap++] = TokenSpan{token.token_type, size - token.start, token.length,\n"
+            "\t\t\t\tsize + 1 - token.scan_end};\n"
+            "\t}\n"
+            "}\n\n"
+            "std::pair<size_t, size_t> IncrementalLexer::edit(uint64_t offset, uint64_t deleted,\n"
+            "\t\tconst std::string& inserted) {\n"
+            "\toffset = std::min<uint64_t>(offset, this->get_input_size());\n"
+            "\tdeleted = std::min<uint64_t>(deleted, this->get_input_size() - offset);\n\n"
+            "\t// The tokens which were recognized without reading the edited input stay.\n"
+            "\tsize_t first{0};\n"
+            "\tsize_t last{this->get_token_count()};\n"
+            "\twhile (first < last) {\n"
+            "\t\tconst size_t middle{first + (last - first) / 2};\n"
+            "\t\tif (offset < this->get_token(middle).scan_end)\n"
+            "\t\t\tlast = middle;\n"
+            "\t\telse\n"
+            "\t\t\tfirst = middle + 1;\n"
+            "\t}\n"
+            "\t// An ERROR token before the edit ends the tokens anyway.\n"
+            "\tconst bool ended{first == this->get_token_count() && first > 0};\n"
+            "\tthis->move_token_gap(first);\n\n"
+            "\t// The inserted bytes replace the deleted ones at the gap of the input.\n"
+            "\tthis->move_gap(offset);\n"
+            "\tthis->gap_end += deleted;\n"
+            "\tthis->reserve_gap(inserted.size());\n"
+            "\tstd::copy(inserted.begin(), inserted.end(), this->text.begin() + this->gap);\n"
+            "\tthis->gap += inserted.size();\n"
+            "\tif (ended)\n"
+            "\t\treturn {first, first};\n"
+            "\treturn this->relex(first, this->gap);\n"
+            "}\n\n"
+            "std::pair<size_t, size_t> IncrementalLexer::relex(size_t first, uint64_t edit_end) {\n"
+            "\tconst uint64_t size{this->get_input_size()};\n"
+            "\tuint64_t pos{first == 0 ? 0 : this->tokens[first - 1].start + this->tokens[first - 1].length};\n"
+            "\tuint64_t scan_end{first == 0 ? 0 : this->tokens[first - 1].scan_end};\n\n"
+            "\tstd::vector<TokenSpan> fresh;\n"
+            "\tFailureMemo memo;\n"
+            "\tsize_t old{this->token_gap_end};\n"
+            "\twhile (true) {\n"
+            "\t\t// The old tokens start at pos if their offsets from the end are size - pos.\n"
+            "\t\tif (pos >= edit_end) {\n"
+            "\t\t\twhile (old < this->tokens.size() && this->tokens[old].start > size - pos)\n"
+            "\t\t\t\told++;\n"
+            "\t\t\tif (old < this->tokens.size() && this->tokens[old].start == size - pos)\n"
+            "\t\t\t\tbreak;\n"
+            "\t\t}\n\n"
+            "\t\tif (pos == size) {\n"
+            "\t\t\tfresh.push_back(TokenSpan{TokenType::LAST, pos, 0, size + 1});\n"
+            "\t\t\told = this->tokens.size();\n"
+            "\t\t\tbreak;\n"
+            "\t\t}\n"
+            "\t\tconst char* buf = this->text.data();\n"
+            "\t\tconst uint64_t end{this->gap};\n"
+            "\t\tLexer::Match m{Lexer::match(buf, end, pos, memo)};\n"
+            "\t\tuint64_t error_end{0};\n"
+            "\t\tif (m.length == 0 && pos < end)\n"
+            "\t\t\terror_end = skip_error_bytes(buf + pos + 1, buf + end) - buf;\n"
+            "\t\tif (end < size && (m.scan_end > end || (m.length == 0 && error_end == end))) {\n"
+            "\t\t\tthis->move_gap(std::min(size, end + std::max<uint64_t>(4096, 2 * (end - pos))));\n"
+            "\t\t\tmemo = FailureMemo();\n"
+            "\t\t\tcontinue;\n"
+            "\t\t}\n\n"
+            "\t\tscan_end = std::max(scan_end, m.scan_end);\n"
+            "\t\tif (m.length == 0) {\n"
+            "\t\t\tscan_end = std::max(scan_end, error_end == size ? size + 1 : error_end + 1);\n"
+            "\t\t\tfresh.push_back(TokenSpan{TokenType::ERROR, pos, error_end - pos, scan_end});\n"
+            "\t\t\told = this->tokens.size();\n"
+            "\t\t\tbreak;\n"
+            "\t\t}\n\n"
+            "\t\tif (!Lexer::is_skip_state(m.state)) {\n"
+            "\t\t\tstd::shared_ptr<Token> tok{std::make_shared<Token>(std::string(buf + pos, m.length),\n"
+            "\t\t\t\t\tTokenType::DEFAULT, pos)};\n"
+            "\t\t\tLexer::run_action(m.state, tok, this->context);\n"
+            "\t\t\tif (!tok->is_ignore())\n"
+            "\t\t\t\tfresh.push_back(TokenSpan{tok->get_token_type(), pos, m.length, scan_end});\n"
+            "\t\t}\n"
+            "\t\tpos += m.length;\n"
+            "\t}\n\n"
+            "\t// Replace the tokens which were lexed again, before the gap of the tokens. The old\n"
+            "\t// tokens after it do not move, as their offsets are kept from the end.\n"
+            "\tthis->token_gap_end = old;\n"
+            "\tif (this->token_gap_end - this->token_gap < fresh.size()) {\n"
+            "\t\tconst size_t grow{fresh.size() + std::max<size_t>(64, this->get_token_count() / 2)};\n"
+            "\t\tthis->tokens.insert(this->tokens.begin() + this->token_gap_end, grow, TokenSpan{});\n"
+            "\t\tthis->token_gap_end += grow;\n"
+            "\t}\n"
+            "\tstd::copy(fresh.begin(), fresh.end(), this->tokens.begin() + this->token_gap);\n"
+            "\tthis->token_gap += fresh.size();\n"
+            "\t// Only the old tokens which start before scan_end can have scanned less of the input.\n"
+            "\tfor (size_t i = this->token_gap_end; i < this->tokens.size() && size + 1 - this->tokens[i].scan_end <\n"
+            "\t\t\tscan_end; i++)\n"
+            "\t\tthis->tokens[i].scan_end = size + 1 - scan_end;\n"
+            "\treturn {first, first + fresh.size()};\n"
+            "}\n"
+            "#endif\n\n"
         ])
 
-        body.write("}\n\n")
+        # emit the scan PushLexer method
+        # it is the same direct-coded scanner as match, except that it can stop at the end of a chunk of the input in
+        # any state, and continue from that state with the next chunk
+        # a state block can be entered again at the position at which it has stopped, which gives the same result as
+        # before, so the scanner is resumed by jumping to the block of the saved state
+        body.writelines([
+            "#ifndef MY_LITTLE_LEXER_NO_PUSH_SCANNER\n"
+            "const char* PushLexer::scan(const char* buf, const char* p, const char* const end, uint64_t base) {\n"
+            "\tchar c;\n"
+        ])
+        if any(state in memo_indexes for state in skip_states):
+            body.write("\tconst char* run;\n")
+        body.write("\n")
+        dispatch = emit_dispatch_tables(body, dtran, state_order, "Fail") if computed_goto else {}
+        body.write("\tswitch (this->state) {\n")
+        for i in range(len(dstates)):
+            body.writelines([
+                "\tcase States::S" + str(i) + ":\n"
+                "\t\tgoto S" + str(i) + ";\n"
+            ])
+        body.writelines([
+            "\tdefault:\n"
+            "\t\tgoto Fail;\n"
+            "\t}\n\n"
+        ])
+
+        for i in state_order:
+            body.writelines([
+                "S" + str(i) + ":\n"
+                "\tPROFILE_STATE(" + str(i) + ");\n"
+            ])
+            if i in memo_indexes and i in skip_states:
+                body.writelines([
+                    "\tif (this->memo.failed(" + str(memo_indexes[i]) + ", base + (p - buf)))\n"
+                    "\t\tgoto Fail;\n"
+                    "\trun = p;\n"
+                    "\tp = skip_S" + str(i) + "(p, end);\n"
+                    "\tif (p != run && this->memo.failed(" + str(memo_indexes[i]) + ", base + (p - buf)))\n"
+                    "\t\tgoto Fail;\n"
+                    "\tthis->memo.trail.emplace_back(" + str(memo_indexes[i]) + ", base + (run - buf),\n"
+                    "\t\t\tbase + (p - buf));\n"
+                ])
+            elif i in memo_indexes:
+                body.writelines([
+                    "\tif (this->memo.failed(" + str(memo_indexes[i]) + ", base + (p - buf)))\n"
+                    "\t\tgoto Fail;\n"
+                    "\tthis->memo.trail.emplace_back(" + str(memo_indexes[i]) + ", base + (p - buf),\n"
+                    "\t\t\tbase + (p - buf));\n"
+                ])
+            elif i in skip_states:
+                body.write("\tp = skip_S" + str(i) + "(p, end);\n")
+            if i in dfa_acc_states:
+                body.writelines([
+                    "\tthis->accepted = States::S" + str(i) + ";\n"
+                    "\tthis->accepted_end = base + (p - buf);\n"
+                ])
+                if len(memo_states) > 0:
+                    body.write("\tthis->memo.trail.clear();\n")
+            body.writelines([
+                "\tif (p == end) {\n"
+                "\t\tthis->state = States::S" + str(i) + ";\n"
+                "\t\treturn p;\n"
+                "\t}\n"
+                "\tc = " + input_symbol("*p++", case_fold) + ";\n\n"
+            ])
+
+            emit_transitions(body, dtran, i, "\t\tgoto Fail;\n", profile, dispatch.get(i))
+
+        body.write("Fail:\n")
+        if len(memo_states) > 0:
+            body.write("\tthis->memo.fail_trail();\n")
+        body.writelines([
+            "\tthis->state = States::SE;\n"
+            "\treturn p;\n"
+            "}\n\n"
+        ])
+
+        # emit the lexeme PushLexer method
+        body.writelines([
+            "std::string PushLexer::lexeme(const char* buf, uint64_t chunk_base, uint64_t end) const {\n"
+            "\tstd::string lexeme;\n"
+            "\tif (this->start < chunk_base)\n"
+            "\t\tlexeme.assign(this->carry, this->start - this->carry_base, std::min(end, chunk_base) - this->start);\n"
+            "\tif (end > chunk_base) {\n"
+            "\t\tconst uint64_t from{std::max(this->start, chunk_base)};\n"
+            "\t\tlexeme.append(buf + (from - chunk_base), end - from);\n"
+            "\t}\n"
+            "\treturn lexeme;\n"
+            "}\n\n"
+        ])
+
+        # emit the lex PushLexer method
+        # the carry holds the input from (at most) the start of the current token to the end of the last chunk, and the
+        # saved DFA state is the one the scanner has reached at its end, so the next chunk continues where the last one
+        # ended
+        # at a dead end, the token ends with the last accepting state, and the scanner backtracks to its end, which can
+        # be in the carry or in the chunk, and starts the next token from there
+        body.writelines([
+            "std::vector<std::shared_ptr<Token>> PushLexer::lex(const char* buf, uint64_t len, bool eof) {\n"
+            "\tstd::vector<std::shared_ptr<Token>> tokens;\n"
+            "\tif (this->done)\n"
+            "\t\treturn tokens;\n\n"
+            "\t// Offsets of the chunk, and of the end of the input seen so far.\n"
+            "\tconst uint64_t chunk_base{this->carry_base + this->carry.size()};\n"
+            "\tconst uint64_t total{chunk_base + len};\n"
+            "\tuint64_t pos{chunk_base};\n"
+            "\twhile (true) {\n"
+            "\t\tif (this->failed) {\n"
+            "\t\t\twhile (pos < total && error_bytes[static_cast<unsigned char>(pos < chunk_base ?\n"
+            "\t\t\t\t\tthis->carry[pos - this->carry_base] : buf[pos - chunk_base])])\n"
+            "\t\t\t\tpos++;\n"
+            "\t\t\tif (pos == total && !eof)\n"
+            "\t\t\t\tbreak;\n"
+            "\t\t\ttokens.push_back(std::make_shared<Token>(this->lexeme(buf, chunk_base, pos), TokenType::ERROR,\n"
+            "\t\t\t\t\tthis->start));\n"
+            "\t\t\tthis->done = true;\n"
+            "\t\t\tbreak;\n"
+            "\t\t}\n\n"
+            "\t\tif (pos == total) {\n"
+            "\t\t\tif (!eof)\n"
+            "\t\t\t\tbreak;\n"
+            "\t\t\tif (this->start == total) {\n"
+            "\t\t\t\ttokens.push_back(std::make_shared<Token>(\"\", TokenType::LAST, total));\n"
+            "\t\t\t\tthis->done = true;\n"
+            "\t\t\t\tbreak;\n"
+            "\t\t\t}\n"
+            "\t\t\t// The end of the input is a dead end.\n"
+        ])
+        if len(memo_states) > 0:
+            body.write("\t\t\tthis->memo.fail_trail();\n")
+        body.writelines([
+            "\t\t\tthis->state = States::SE;\n"
+            "\t\t}\n"
+            "\t\telse {\n"
+            "\t\t\t// Scan the rest of the carry, or of the chunk.\n"
+            "\t\t\tconst char* segment{pos < chunk_base ? this->carry.data() : buf};\n"
+            "\t\t\tconst uint64_t base{pos < chunk_base ? this->carry_base : chunk_base};\n"
+            "\t\t\tconst uint64_t segment_end{pos < chunk_base ? chunk_base : total};\n"
+            "\t\t\tpos = base + (this->scan(segment, segment + (pos - base), segment + (segment_end - base), base) -\n"
+            "\t\t\t\t\tsegment);\n"
+            "\t\t\tif (this->state != States::SE)\n"
+            "\t\t\t\tcontinue;\n"
+            "\t\t}\n\n"
+            "\t\t// The error token also takes the bytes after the failed one which can not start\n"
+            "\t\t// a token, which may be in the next chunks.\n"
+            "\t\tif (this->accepted == States::BAD || this->accepted_end == this->start) {\n"
+            "\t\t\tthis->failed = true;\n"
+            "\t\t\tpos = this->start + 1;\n"
+            "\t\t\tcontinue;\n"
+            "\t\t}\n\n"
+            "\t\tif (!Lexer::is_skip_state(this->accepted)) {\n"
+            "\t\t\tstd::shared_ptr<Token> tok{std::make_shared<Token>(this->lexeme(buf, chunk_base,\n"
+            "\t\t\t\t\tthis->accepted_end), TokenType::DEFAULT, this->start)};\n"
+            "\t\t\tLexer::run_action(this->accepted, tok, this->context);\n"
+            "\t\t\tif (!tok->is_ignore())\n"
+            "\t\t\t\ttokens.push_back(tok);\n"
+            "\t\t}\n\n"
+            "\t\t// Backtrack to the end of the token, and start the next one. The carry before\n"
+            "\t\t// it is dropped once it makes up half of the carry, so that every byte is only\n"
+            "\t\t// moved a constant number of times.\n"
+            "\t\tif (this->accepted_end >= chunk_base) {\n"
+            "\t\t\tthis->carry.clear();\n"
+            "\t\t\tthis->carry_base = chunk_base;\n"
+            "\t\t}\n"
+            "\t\telse if ((this->accepted_end - this->carry_base) * 2 >= this->carry.size()) {\n"
+            "\t\t\tthis->carry.erase(0, this->accepted_end - this->carry_base);\n"
+            "\t\t\tthis->carry_base = this->accepted_end;\n"
+            "\t\t}\n"
+            "\t\tpos = this->start = this->accepted_end;\n"
+            "\t\tthis->state = States::S0;\n"
+            "\t\tthis->accepted = States::BAD;\n"
+            "\t\tthis->memo.advance(this->start);\n"
+            "\t\tthis->memo.trail.clear();\n"
+            "\t}\n\n"
+            "\t// Keep the bytes of the unfinished token.\n"
+            "\tif (this->start < chunk_base)\n"
+            "\t\tthis->carry.append(buf, len);\n"
+            "\telse {\n"
+            "\t\tthis->carry.assign(buf + (this->start - chunk_base), len - (this->start - chunk_base));\n"
+            "\t\tthis->carry_base = this->start;\n"
+            "\t}\n"
+            "\treturn tokens;\n"
+            "}\n"
+            "#endif\n\n"
+        ])
+
+        # emit the dump_profile Lexer method
+        # the profile header identifies the DFA, so that the generator can reject profiles of other DFAs
+        body.writelines([
+            "#ifdef MY_LITTLE_LEXER_PROFILE\n"
+            "void Lexer::dump_profile(const char* filename) {\n"
+            "\tstd::ofstream out(filename);\n"
+            "\tif (!out.is_open())\n"
+            "\t\tthrow std::runtime_error(\"Profile file not opened correctly!\");\n\n"
+            "\tout << \"" + PROFILE_MAGIC + " " + str(len(dstates)) + " " + str(transitions_num) + " " +
+            str(dfa_fingerprint(dtran, dfa_acc_states)) + "\\n\";\n"
+            "\tfor (size_t s = 0; s < " + str(len(dstates)) + "; s++)\n"
+            "\t\tout << \"S \" << s << ' ' << profile_state_hits[s].load() << '\\n';\n"
+        ])
+        if transitions_num > 0:
+            # states and input symbol codes of the transitions, in the order of the transition matrix
+            transition_states = [str(i) for i in range(len(dtran))
+                                 for t in range(dtran.offsets[i], dtran.offsets[i + 1])]
+            body.writelines([
+                "\tstatic const uint32_t transition_states[]{" + ", ".join(transition_states) + "};\n"
+                "\tstatic const uint32_t transition_syms[]{" + ", ".join(map(str, dtran.syms)) + "};\n"
+                "\tfor (size_t t = 0; t < " + str(transitions_num) + "; t++)\n"
+                "\t\tout << \"T \" << transition_states[t] << ' ' << transition_syms[t] << ' '\n"
+                "\t\t\t\t<< profile_transition_hits[t].load() << '\\n';\n"
+            ])
+        body.writelines([
+            "}\n"
+            "#endif\n\n"
+        ])
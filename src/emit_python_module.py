@@ -0,0 +1,171 @@
+import os
+import re
+
+# generation of a CPython extension module around the generated lexer, so that it can be called from Python directly
+# the module has a single function, tokenize, which takes any object supporting the buffer protocol (eg. bytes,
+# bytearray, memoryview or mmap), tokenizes it in place using Lexer::tokenize_all, with the GIL released, and returns
+# the token types, starts and lengths as arrays (array.array, or NumPy arrays sharing their memory if asked for)
+# the module is built by the setup script emitted next to it, using the local compiler and setuptools:
+#   python3 output_prefix_setup.py build_ext --inplace
+# NumPy is only imported when NumPy arrays are asked for, so neither building nor using the module requires it
+
+
+# return the name of the Python module of the lexer with the provided output prefix
+def module_name(output_prefix):
+    return re.sub(r"\W", "_", os.path.basename(output_prefix))
+
+
+# emit the source of the extension module to output_prefix_python.cpp, and its setup script to output_prefix_setup.py
+# both files are opened in the provided OutputFiles
+def create_python_module(outputs, token_list, output_prefix="my_little_lexer"):
+    name = module_name(output_prefix)
+    token_names = token_list + ["LAST", "ERROR", "DEFAULT"]
+
+    with outputs.open(output_prefix + "_python.cpp") as source:
+        source.writelines([
+            "// Python extension module of the generated lexer.\n"
+            "#define PY_SSIZE_T_CLEAN\n"
+            "#include <Python.h>\n"
+            "#include <new>\n"
+            "#include \"" + os.path.basename(output_prefix) + ".h\"\n\n"
+            "#ifdef MY_LITTLE_LEXER_NO_BUFFER_SCANNER\n"
+            "#error \"The Python module tokenizes with Lexer::tokenize_all, which needs the buffer scanner.\"\n"
+            "#endif\n\n"
+            "static PyStructSequence_Field tokens_fields[]{\n"
+            "\t{const_cast<char*>(\"types\"), const_cast<char*>(\"token types (array of uint16)\")},\n"
+            "\t{const_cast<char*>(\"starts\"), const_cast<char*>(\"token offsets (array of uint64)\")},\n"
+            "\t{const_cast<char*>(\"lengths\"), const_cast<char*>(\"token lengths (array of uint64)\")},\n"
+            "\t{nullptr, nullptr}\n"
+            "};\n\n"
+            "static PyStructSequence_Desc tokens_desc{\n"
+            "\tconst_cast<char*>(\"" + name + ".Tokens\"),\n"
+            "\tconst_cast<char*>(\"Token types, starts and lengths, ending with a LAST or an ERROR token.\"),\n"
+            "\ttokens_fields,\n"
+            "\t3\n"
+            "};\n\n"
+            "static PyTypeObject* tokens_type{nullptr};\n\n"
+            "// Return a new array.array of the typecode with a copy of the values, or a NumPy\n"
+            "// array on top of it if the numpy module is provided.\n"
+            "template <typename T>\n"
+            "static PyObject* to_array(const char* typecode, const std::vector<T>& values, PyObject* numpy) {\n"
+            "\tPyObject* array_module{PyImport_ImportModule(\"array\")};\n"
+            "\tif (!array_module)\n"
+            "\t\treturn nullptr;\n"
+            "\tPyObject* array{PyObject_CallMethod(array_module, \"array\", \"s\", typecode)};\n"
+            "\tPy_DECREF(array_module);\n"
+            "\tif (!array)\n"
+            "\t\treturn nullptr;\n\n"
+            "\tchar* data{const_cast<char*>(reinterpret_cast<const char*>(values.data()))};\n"
+            "\tPyObject* view{PyMemoryView_FromMemory(data, values.size() * sizeof(T), PyBUF_READ)};\n"
+            "\tPyObject* result{view ? PyObject_CallMethod(array, \"frombytes\", \"O\", view) : nullptr};\n"
+            "\tPy_XDECREF(view);\n"
+            "\tif (!result) {\n"
+            "\t\tPy_DECREF(array);\n"
+            "\t\treturn nullptr;\n"
+            "\t}\n"
+            "\tPy_DECREF(result);\n"
+            "\tif (!numpy)\n"
+            "\t\treturn array;\n\n"
+            "\t// The NumPy array shares the memory of the array.array, which it keeps alive.\n"
+            "\tPyObject* ndarray{PyObject_CallMethod(numpy, \"frombuffer\", \"Os\", array,\n"
+            "\t\t\tsizeof(T) == 2 ? \"uint16\" : \"uint64\")};\n"
+            "\tPy_DECREF(array);\n"
+            "\treturn ndarray;\n"
+            "}\n\n"
+            "static PyObject* tokenize(PyObject* self, PyObject* args, PyObject* kwargs) {\n"
+            "\tstatic const char* keywords[]{\"input\", \"numpy\", nullptr};\n"
+            "\tPy_buffer input;\n"
+            "\tint as_numpy{0};\n"
+            "\tif (!PyArg_ParseTupleAndKeywords(args, kwargs, \"y*|p:tokenize\", const_cast<char**>(keywords),\n"
+            "\t\t\t&input, &as_numpy))\n"
+            "\t\treturn nullptr;\n\n"
+            "\tPyObject* numpy{nullptr};\n"
+            "\tif (as_numpy && !(numpy = PyImport_ImportModule(\"numpy\"))) {\n"
+            "\t\tPyBuffer_Release(&input);\n"
+            "\t\treturn nullptr;\n"
+            "\t}\n\n"
+            "\t// The input is scanned in place, without holding the GIL.\n"
+            "\tTokenColumns columns;\n"
+            "\tbool failed{false};\n"
+            "\tPy_BEGIN_ALLOW_THREADS\n"
+            "\ttry {\n"
+            "\t\tcolumns = Lexer::tokenize_all(static_cast<const char*>(input.buf), input.len);\n"
+            "\t}\n"
+            "\tcatch (const std::bad_alloc&) {\n"
+            "\t\tfailed = true;\n"
+            "\t}\n"
+            "\tPy_END_ALLOW_THREADS\n"
+            "\tPyBuffer_Release(&input);\n"
+            "\tif (failed) {\n"
+            "\t\tPy_XDECREF(numpy);\n"
+            "\t\treturn PyErr_NoMemory();\n"
+            "\t}\n\n"
+            "\tPyObject* tokens{PyStructSequence_New(tokens_type)};\n"
+            "\tPyObject* types{tokens ? to_array(\"H\", columns.types, numpy) : nullptr};\n"
+            "\tPyObject* starts{types ? to_array(\"Q\", columns.starts, numpy) : nullptr};\n"
+            "\tPyObject* lengths{starts ? to_array(\"Q\", columns.lengths, numpy) : nullptr};\n"
+            "\tPy_XDECREF(numpy);\n"
+            "\tif (!lengths) {\n"
+            "\t\tPy_XDECREF(tokens);\n"
+            "\t\tPy_XDECREF(types);\n"
+            "\t\tPy_XDECREF(starts);\n"
+            "\t\treturn nullptr;\n"
+            "\t}\n"
+            "\tPyStructSequence_SET_ITEM(tokens, 0, types);\n"
+            "\tPyStructSequence_SET_ITEM(tokens, 1, starts);\n"
+            "\tPyStructSequence_SET_ITEM(tokens, 2, lengths);\n"
+            "\treturn tokens;\n"
+            "}\n\n"
+            "static PyMethodDef methods[]{\n"
+            "\t{\"tokenize\", reinterpret_cast<PyCFunction>(reinterpret_cast<void(*)(void)>(tokenize)),\n"
+            "\t\t\tMETH_VARARGS | METH_KEYWORDS,\n"
+            "\t\t\t\"tokenize(input, numpy=False)\\n--\\n\\n\"\n"
+            "\t\t\t\"Tokenize a bytes-like object, and return its token types, starts and lengths as arrays\\n\"\n"
+            "\t\t\t\"(NumPy arrays if numpy is true). Token types index TOKEN_NAMES. No pattern code is run.\"},\n"
+            "\t{nullptr, nullptr, 0, nullptr}\n"
+            "};\n\n"
+            "static PyModuleDef module{\n"
+            "\tPyModuleDef_HEAD_INIT,\n"
+            "\t\"" + name + "\",\n"
+            "\t\"Generated lexer.\",\n"
+            "\t-1,\n"
+            "\tmethods\n"
+            "};\n\n"
+            "PyMODINIT_FUNC PyInit_" + name + "() {\n"
+            "\tif (!tokens_type && !(tokens_type = PyStructSequence_NewType(&tokens_desc)))\n"
+            "\t\treturn nullptr;\n"
+            "\tPyObject* m{PyModule_Create(&module)};\n"
+            "\tif (!m)\n"
+            "\t\treturn nullptr;\n\n"
+            "\t// Names of the token types, by their values.\n"
+            "\tPyObject* names{Py_BuildValue(\"(" + "s" * len(token_names) + ")\",\n"
+            "\t\t\t" + ", ".join("\"" + token + "\"" for token in token_names) + ")};\n"
+            "\tif (!names || PyModule_AddObject(m, \"TOKEN_NAMES\", names) < 0) {\n"
+            "\t\tPy_XDECREF(names);\n"
+            "\t\tPy_DECREF(m);\n"
+            "\t\treturn nullptr;\n"
+            "\t}\n"
+            "\tPy_INCREF(tokens_type);\n"
+            "\tif (PyModule_AddObject(m, \"Tokens\", reinterpret_cast<PyObject*>(tokens_type)) < 0) {\n"
+            "\t\tPy_DECREF(tokens_type);\n"
+            "\t\tPy_DECREF(m);\n"
+            "\t\treturn nullptr;\n"
+            "\t}\n"
+            "\treturn m;\n"
+            "}\n"
+        ])
+
+    base = os.path.basename(output_prefix)
+    with outputs.open(output_prefix + "_setup.py") as setup:
+        setup.writelines([
+            "# Build the Python extension module of the generated lexer, in this directory:\n"
+            "#   python3 " + base + "_setup.py build_ext --inplace\n"
+            "import os\n"
+            "from setuptools import setup, Extension\n\n"
+            "setup(\n"
+            "    name=\"" + name + "\",\n"
+            "    ext_modules=[Extension(\"" + name + "\", [\"" + base + ".cpp\", \"" + base + "_python.cpp\"],\n"
+            "                           language=\"c++\",\n"
+            "                           extra_compile_args=[\"-std=c++11\"] if os.name != \"nt\" else [])],\n"
+            ")\n"
+        ])
@@ -0,0 +1,142 @@
+import os
+import time
+from pattern_descriptor import PatternDesc
+
+# some combinations of patterns make the number of DFA states explode (in the worst case, it is exponential in the number
+# of NFA states), so the DFA creation can be limited by a budget of DFA states, transitions, time and memory
+# when the budget is exceeded, the DFA creation is aborted, and we try to find out which patterns and defines are to
+# blame by creating the DFA again, adding one pattern at a time, and tracking the number of states each one adds
+
+
+# the budget of the DFA creation was exceeded
+class BudgetError(Exception):
+    def __init__(self, message):
+        self.message = message
+
+    def __str__(self):
+        return self.message
+
+
+# return the memory currently used by the process (its resident set size) in bytes, or None if it can not be found out
+# only the current resident set size will do, as the memory limit applies to the growth of the memory since the start of
+# the DFA creation, and the peak resident set size (eg. from getrusage) does not go down between the DFA creations
+def current_memory():
+    try:
+        # resident set size in pages is the second field
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+# limits of the DFA creation, all of them are optional
+# time is given in seconds, and memory in megabytes, both of them measured from the start of the DFA creation
+# the memory limit needs /proc/self/statm (Linux), and BudgetError is raised right away if it is not available
+class Budget:
+    # time and memory are checked only once every this many calls to check() (starting with the first one), as it is
+    # more expensive
+    CHECK_INTERVAL = 64
+
+    def __init__(self, max_states=None, max_transitions=None, max_time=None, max_memory=None):
+        self.max_states = max_states
+        self.max_transitions = max_transitions
+        self.max_time = max_time
+        self.max_memory = max_memory
+        self.start_time = None
+        self.start_memory = None
+        self.checks = 0
+        self.restart()
+
+    # start measuring the time and the memory of a new DFA creation
+    def restart(self):
+        self.start_time = time.monotonic()
+        self.checks = 0
+        if self.max_memory is not None:
+            self.start_memory = current_memory()
+            if self.start_memory is None:
+                raise BudgetError("The memory limit is not supported on this platform!")
+
+    # raise BudgetError if the DFA creation has exceeded any of the limits
+    def check(self, states, transitions):
+        if self.max_states is not None and states > self.max_states:
+            raise BudgetError("The limit of " + str(self.max_states) + " DFA states was exceeded!")
+        if self.max_transitions is not None and transitions > self.max_transitions:
+            raise BudgetError("The limit of " + str(self.max_transitions) + " DFA transitions was exceeded!")
+
+        self.checks += 1
+        if (self.checks - 1) % Budget.CHECK_INTERVAL != 0:
+            return
+
+        if self.max_time is not None and time.monotonic() - self.start_time > self.max_time:
+            raise BudgetError("The time limit of " + str(self.max_time) + " seconds was exceeded!")
+        if self.max_memory is not None:
+            memory = current_memory()
+            if memory is not None and memory - self.start_memory > self.max_memory * 1024 * 1024:
+                raise BudgetError("The memory limit of " + str(self.max_memory) + " MB was exceeded!")
+
+
+# return the names of the defines which are used by the AST
+# defines are found by identity, since every use of a define refers to the very same AST
+def used_defines(root, defines):
+    nodes = set()
+    stack = [root]
+    while len(stack) > 0:
+        node = stack.pop()
+        if id(node) not in nodes:
+            nodes.add(id(node))
+            stack += node.children
+    return [name for (name, define_root) in defines.items() if id(define_root) in nodes]
+
+
+# create the DFA for copies of the provided patterns, within a fresh budget
+# return the number of DFA states, or None if the budget was exceeded
+def count_states(pattern_descs, create_dfa, budget):
+    copies = [PatternDesc(patt_desc.name, patt_desc.code, patt_desc.root, None) for patt_desc in pattern_descs]
+    budget.restart()
+    try:
+        (dstates, dtran, dfa_acc_states, copies) = create_dfa(copies, budget)
+    except BudgetError:
+        return None
+    return len(dstates)
+
+
+# find out which patterns and defines are responsible for exceeding the budget
+# patterns are added to the DFA one at a time, and the number of states added by each of them is reported, until the
+# one which makes the DFA creation exceed the budget
+# that pattern is then reported along with the sizes of the DFAs of the defines it uses
+# create_dfa(pattern_descs, budget) should create the DFA of the patterns in the same way the original attempt did
+# parsed_roots are the ASTs of the patterns as they were parsed, since only those share the ASTs of the defines they use
+# (the case folding and the simplification rewrite the ASTs of the patterns)
+def blame_patterns(pattern_descs, parsed_roots, defines, create_dfa, budget):
+    report = ["States added by each pattern (in the order of the patterns section):"]
+
+    prev_states = 0
+    culprit = None
+    culprit_root = None
+    for i in range(len(pattern_descs)):
+        states = count_states(pattern_descs[0:i + 1], create_dfa, budget)
+        if states is None:
+            culprit = pattern_descs[i]
+            culprit_root = parsed_roots[i]
+            report.append("\t" + culprit.name + ": over the limit")
+            break
+        report.append("\t" + pattern_descs[i].name + ": " + str(states - prev_states))
+        prev_states = states
+
+    if culprit is None:
+        return "\n".join(report)
+
+    # the culprit may be fine on its own, in which case it is its combination with the previous patterns which explodes
+    alone = count_states([culprit], create_dfa, budget)
+    report.append("Pattern " + culprit.name + " alone: " + ("over the limit" if alone is None else
+                                                           str(alone) + " states"))
+
+    culprit_defines = used_defines(culprit_root, defines)
+    if len(culprit_defines) > 0:
+        report.append("Defines used by pattern " + culprit.name + ", alone:")
+        for name in culprit_defines:
+            define = PatternDesc(name, '', defines[name], None)
+            states = count_states([define], create_dfa, budget)
+            report.append("\t" + name + ": " + ("over the limit" if states is None else str(states) + " states"))
+
+    return "\n".join(report)
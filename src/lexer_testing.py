@@ -0,0 +1,37 @@
+import os
+import shutil
+import subprocess
+from parse_input_file import generate_lexer
+
+# helpers of the tests which generate a lexer from a language specification, and run it compiled along with a small
+# driver program
+# the C++ compiler is the one named by the CXX environment variable (g++ by default), and the tests which need it are
+# skipped if it is not installed
+
+COMPILER = shutil.which(os.environ.get("CXX", "g++"))
+
+
+# write the language specification to the directory, generate the lexer with the provided generate_lexer options,
+# compile it along with the driver source, and return the path of the binary
+def build_lexer(spec, driver, directory, **options):
+    spec_file = os.path.join(directory, "lexer.mll")
+    with open(spec_file, 'w') as file:
+        file.write(spec)
+    prefix = os.path.join(directory, "lexer")
+    generate_lexer(spec_file, prefix, **options)
+    driver_file = os.path.join(directory, "driver.cpp")
+    with open(driver_file, 'w') as file:
+        file.write(driver)
+    binary = os.path.join(directory, "driver")
+    subprocess.run([COMPILER, "-std=c++11", "-pthread", prefix + ".cpp", driver_file, "-o", binary], check=True)
+    return binary
+
+
+# encode the strings the way the drivers read them: the length of each string on its own line, followed by its bytes
+def encode_strings(strings):
+    return "".join(str(len(string)) + "\n" + string for string in strings)
+
+
+# run the binary with the provided standard input, and return the lines of its output
+def run_lexer(binary, stdin):
+    return subprocess.run([binary], input=stdin, check=True, capture_output=True, text=True).stdout.splitlines()
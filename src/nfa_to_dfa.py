@@ -1,4 +1,7 @@
-import copy
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain
+from automata import DFATransitions, EPS, NONE, encode_states, decode_states
 
 
 # after the creation of a combined NFA, there are two path that could be taken
@@ -19,8 +22,8 @@ def print_dfa(dstates, dtran, dfa_acc_states):
     i = 0
     for state in dstates:
         print("State " + str(i))
-        print(state)
-        print(dtran[i])
+        print(decode_states(state))
+        print(dtran.transitions(i))
         if i in dfa_acc_states:
             print("Accepting")
         print()
@@ -31,95 +34,191 @@ def print_dfa(dstates, dtran, dfa_acc_states):
 # essentially a DFS algorithm
 # states are provided as a list of indexes into the NFA transition matrix
 def eps_closure(states, nfa):
-    stack = copy.deepcopy(states)
-    eps_cl = copy.deepcopy(states)
+    syms = nfa.syms
+    out1 = nfa.out1
+    out2 = nfa.out2
+    stack = list(states)
+    eps_cl = set(states)
     while len(stack) > 0:
         # current state
         t = stack.pop()
-        t_state = nfa[t]
-        # get all of the outgoing states on epsilon transition from the current state
-        eps_transition = None
-        for in_sym in t_state:
-            if in_sym[0] == 'eps':
-                eps_transition = in_sym[1:len(in_sym)]
+        if syms[t] != EPS:
+            continue
         # since the outgoing states can also have epsilon transitions, push them on the stack to be considered later
-        for out_state in eps_transition:
-            if out_state not in eps_cl:
-                eps_cl.append(out_state)
+        for out_state in (out1[t], out2[t]):
+            if out_state != NONE and out_state not in eps_cl:
+                eps_cl.add(out_state)
                 stack.append(out_state)
     return eps_cl
 
 
-# computes every state which is reachable on symbol transition from the provided set of states
-def move(states, sym, nfa):
-    move_set = []
+# computes every state which is reachable on symbol transition from the provided set of states, for every input symbol
+# (excluding epsilon) for which the provided NFA states have outgoing transitions
+# input symbols are ordered by the first state which has a transition on them
+def compute_moves(states, nfa):
+    syms = nfa.syms
+    out1 = nfa.out1
+    moves = {}
     for state_index in states:
-        nfa_state = nfa[state_index]
-        for in_sym in nfa_state:
-            if in_sym[0] == sym:
-                move_set.append(in_sym[1])
-    return move_set
+        sym = syms[state_index]
+        if sym != EPS:
+            moves.setdefault(sym, []).append(out1[state_index])
+    return moves
 
 
-# return the set of input symbols (excluding epsilon) for which the provided NFA states have outgoing transitions
-def compute_possible_in_syms(states, nfa):
-    syms = []
-    for state_index in states:
-        state = nfa[state_index]
-        for in_sym in state:
-            if in_sym[0] != 'eps' and in_sym[0] not in syms:
-                syms.append(in_sym[0])
-    return syms
+# return the dictionary which maps every accepting NFA state to the index of its pattern
+def accepting_patterns(pattern_descs):
+    nfa_acc_states = {}
+    for (index, patt_desc) in enumerate(pattern_descs):
+        nfa_acc_states[patt_desc.nfa_acc_state] = index
+    return nfa_acc_states
+
+
+# return the index of the pattern recognized by the DFA state which corresponds to the provided set of NFA states, or
+# None if it is not an accepting state
+# if at least one NFA state from the set of NFA states that represent the DFA state is an accepting state, then the DFA
+# state should be marked as accepting too
+# since some accepting DFA states contain more than one accepting NFA state, we associate that DFA state with the
+# earliest pattern whose NFA state it contains
+def recognized_pattern(states, nfa_acc_states):
+    patterns = [nfa_acc_states[nfa_state] for nfa_state in states if nfa_state in nfa_acc_states]
+    return min(patterns) if len(patterns) > 0 else None
 
 
 # perform NFA to DFA conversion using the subset creation algorithm
 # it requires an NFA transition matrix and a list of PatternDesc objects as input
 # returns the set of new DFA states, DFA transition matrix, the list of accepting DFA states and the list of
 # PatternDesc objects to which we have attached lists of accepting DFA states which recognize them
-def nfa_to_dfa(nfa, pattern_descs):
+# DFA states are returned as sets of NFA states encoded by encode_states
+# if a Budget is provided, BudgetError is raised as soon as the DFA exceeds it
+def nfa_to_dfa(nfa, pattern_descs, budget=None):
+    # index of the pattern of every accepting NFA state
+    nfa_acc_states = accepting_patterns(pattern_descs)
+
     # list of DFA states
-    dstates = [eps_closure([0], nfa)]
-    # additional list which contains 'marked' flags for each DFA state
-    marked = [False]
+    dstates = [encode_states(eps_closure([nfa.start], nfa))]
+    # indexes of the DFA states, by their encoded sets of NFA states
+    dstates_index = {dstates[0]: 0}
     # DFA transition matrix
-    dtran = []
+    dtran = DFATransitions()
     # list of accepting DFA states
     acc_states = []
-    while True:
-        curr_index = 0
-        curr_state = None
-        # check whether there are unmarked states in the list
-        if marked.count(False) > 0:
-            curr_index = marked.index(False)
-            curr_state = dstates[curr_index]
-            marked[curr_index] = True
-        else:
-            break
-
-        dtran.append([])
-        input_syms = compute_possible_in_syms(curr_state, nfa)
-        for sym in input_syms:
-            new_state = eps_closure(move(curr_state, sym, nfa), nfa)
-            new_state.sort()
-            if dstates.count(new_state) == 0:
+    # DFA states are numbered in the order of discovery, and the earliest unmarked state is always processed first,
+    # so the list of states doubles as the list of unmarked states
+    # the states are decoded in sorted order, so the order of discovery does not depend on the iteration order of sets
+    curr_index = 0
+    while curr_index < len(dstates):
+        curr_state = decode_states(dstates[curr_index])
+
+        dtran.add_state()
+        for (sym, move_set) in compute_moves(curr_state, nfa).items():
+            new_state = encode_states(eps_closure(move_set, nfa))
+            if new_state not in dstates_index:
+                dstates_index[new_state] = len(dstates)
                 dstates.append(new_state)
-                marked.append(False)
-                # if at least one NFA state from the set of NFA states that represent this DFA state is an accepting
-                # state, then this DFA state should be marked as accepting too
-                for nfa_state in new_state:
-                    for patt_desc in pattern_descs:
-                        if nfa_state == patt_desc.nfa_acc_state:
-                            acc_states.append(dstates.index(new_state))
-                            # since some accepting DFA states contain more than one accepting NFA state, we associate
-                            # that DFA state with the earliest pattern whose NFA state it contains
-                            # we exploit the fact that the NFA states in new_state are ordered beginning from the
-                            # earliest, so we can associate new_state DFA state with the pattern of the first accepting
-                            # NFA state it contains
-                            patt_desc.dfa_acc_states.append(dstates.index(new_state))
-                            break
-                    else:
-                        continue
-                    break
-            dtran[curr_index].append([sym, dstates.index(new_state)])
+                pattern = recognized_pattern(decode_states(new_state), nfa_acc_states)
+                if pattern is not None:
+                    acc_states.append(dstates_index[new_state])
+                    pattern_descs[pattern].dfa_acc_states.append(dstates_index[new_state])
+            dtran.add_transition(sym, dstates_index[new_state])
+
+        if budget is not None:
+            budget.check(len(dstates), dtran.transition_count())
+        curr_index += 1
+
+    return dstates, dtran, acc_states, pattern_descs
+
+
+# the subset construction can also be run on many worker processes, for very large NFAs
+# all the unmarked DFA states which were discovered by processing the previous ones (the frontier of the breadth-first
+# search) are processed at once: their transitions are computed by the workers, in batches, and sent back to the main
+# process, which looks them up in the central index of DFA states
+# the main process goes through the results in the order of the states and of their transitions, exactly as the
+# sequential algorithm does, so the new DFA states get the same numbers as they would have got without the workers
+# DFA states are sent back and forth encoded by encode_states, and the NFA is sent to every worker only once
+
+# frontiers with fewer states than this are processed by the main process, as the workers would not pay off
+PARALLEL_FRONTIER = 64
+# every worker gets about this many batches of each frontier, so that the load is balanced
+BATCHES_PER_WORKER = 4
+
+# NFA of the worker process, and the index of the pattern of every accepting NFA state
+worker_nfa = None
+worker_nfa_acc_states = None
+
+
+# initialize the worker process
+def init_worker(nfa, nfa_acc_states):
+    global worker_nfa, worker_nfa_acc_states
+    worker_nfa = nfa
+    worker_nfa_acc_states = nfa_acc_states
+
+
+# compute the transitions of the provided DFA states (sets of NFA states encoded by encode_states)
+# returns a list with the transitions of every state, as (input symbol, encoded outgoing DFA state, index of the pattern
+# recognized by the outgoing DFA state or None) triples
+def expand_states(dstates, nfa, nfa_acc_states):
+    result = []
+    for dstate in dstates:
+        transitions = []
+        for (sym, move_set) in compute_moves(decode_states(dstate), nfa).items():
+            new_state = eps_closure(move_set, nfa)
+            transitions.append((sym, encode_states(new_state), recognized_pattern(new_state, nfa_acc_states)))
+        result.append(transitions)
+    return result
+
+
+# expand_states, for the worker processes
+def expand_states_in_worker(dstates):
+    return expand_states(dstates, worker_nfa, worker_nfa_acc_states)
+
+
+# perform NFA to DFA conversion using the subset creation algorithm, on the provided number of worker processes (all
+# available cores if None)
+# the arguments and the results are the same as the ones of nfa_to_dfa, and so is the numbering of DFA states
+def nfa_to_dfa_parallel(nfa, pattern_descs, jobs=None, budget=None):
+    jobs = jobs if jobs is not None else os.cpu_count() or 1
+    # index of the pattern of every accepting NFA state
+    nfa_acc_states = accepting_patterns(pattern_descs)
+
+    # list of DFA states
+    dstates = [encode_states(eps_closure([nfa.start], nfa))]
+    # indexes of the DFA states, by their encoded sets of NFA states
+    dstates_index = {dstates[0]: 0}
+    # DFA transition matrix
+    dtran = DFATransitions()
+    # list of accepting DFA states
+    acc_states = []
+
+    executor = ProcessPoolExecutor(max_workers=jobs, initializer=init_worker, initargs=(nfa, nfa_acc_states))
+    try:
+        frontier_start = 0
+        while frontier_start < len(dstates):
+            frontier = dstates[frontier_start:]
+            if len(frontier) < PARALLEL_FRONTIER:
+                results = expand_states(frontier, nfa, nfa_acc_states)
+            else:
+                batch_size = -(-len(frontier) // (jobs * BATCHES_PER_WORKER))
+                batches = [frontier[i:i + batch_size] for i in range(0, len(frontier), batch_size)]
+                results = chain.from_iterable(executor.map(expand_states_in_worker, batches))
+
+            for transitions in results:
+                dtran.add_state()
+                for (sym, new_state, pattern) in transitions:
+                    if new_state not in dstates_index:
+                        dstates_index[new_state] = len(dstates)
+                        dstates.append(new_state)
+                        if pattern is not None:
+                            acc_states.append(dstates_index[new_state])
+                            pattern_descs[pattern].dfa_acc_states.append(dstates_index[new_state])
+                    dtran.add_transition(sym, dstates_index[new_state])
+
+                if budget is not None:
+                    budget.check(len(dstates), dtran.transition_count())
+
+            frontier_start += len(frontier)
+    finally:
+        # do not wait for the batches which are not needed anymore, if the budget was exceeded
+        executor.shutdown(wait=True, cancel_futures=True)
 
     return dstates, dtran, acc_states, pattern_descs
@@ -0,0 +1,100 @@
+import os
+import stat
+
+# the generated files are only replaced when their contents change, so that build systems which go by modification
+# times (make, ninja) do not recompile the lexer, and everything that includes its header, after the lexer has been
+# generated again from an unchanged specification
+# the output is byte for byte the same for the same specification and options: the DFA states are numbered in the order
+# of discovery, going through the sets of NFA states (or positions) in sorted order, and nothing else that is emitted
+# depends on the iteration order of sets, or on the hash seed
+# the new contents are written to temporary files next to the output files, and once all the output files of a lexer
+# have been written, they are either removed, or atomically renamed over the output files (keeping the permissions of
+# the old ones), so a half-written output file is never seen, and if the generation fails, none of the output files is
+# replaced, so the header and the source always come from the same generation
+
+
+# output file which is written like the one open(path, 'w') returns, to a temporary file which then either replaces the
+# output file, if their contents differ, or is removed (see OutputFiles)
+class OutputFile:
+    __slots__ = ('path', 'temp_path', 'file', 'changed')
+
+    def __init__(self, path):
+        self.path = path
+        # the process id keeps apart the temporary files of the lexers generated in parallel
+        self.temp_path = path + "." + str(os.getpid()) + ".tmp"
+        self.file = open(self.temp_path, 'w')
+        # whether the contents differ from the ones of the output file, known once the file is closed
+        self.changed = None
+
+    def write(self, text):
+        self.file.write(text)
+
+    def writelines(self, lines):
+        self.file.writelines(lines)
+
+    def __enter__(self):
+        return self
+
+    # close the temporary file, and compare its contents with the ones of the output file
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.file.close()
+        if exc_type is not None:
+            return False
+
+        with open(self.temp_path, 'rb') as new:
+            contents = new.read()
+        try:
+            with open(self.path, 'rb') as old:
+                self.changed = old.read() != contents
+        except FileNotFoundError:
+            self.changed = True
+        return False
+
+    # replace the output file with the temporary file if their contents differ, or remove the temporary file
+    def commit(self):
+        if not self.changed:
+            os.remove(self.temp_path)
+            return
+        try:
+            os.chmod(self.temp_path, stat.S_IMODE(os.stat(self.path).st_mode))
+        except FileNotFoundError:
+            pass
+        os.replace(self.temp_path, self.path)
+
+    # remove the temporary file
+    def discard(self):
+        self.file.close()
+        try:
+            os.remove(self.temp_path)
+        except FileNotFoundError:
+            pass
+
+
+# all the output files of a lexer, which are committed together at the end of the with block, or discarded if it raises
+class OutputFiles:
+    __slots__ = ('files', 'changed')
+
+    def __init__(self):
+        self.files = []
+        # whether any of the output files has been replaced, known at the end of the with block
+        self.changed = None
+
+    # return a new OutputFile which writes the output file at path
+    def open(self, path):
+        output = OutputFile(path)
+        self.files.append(output)
+        return output
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            for output in self.files:
+                output.discard()
+            return False
+
+        for output in self.files:
+            output.commit()
+        self.changed = any(output.changed for output in self.files)
+        return False
@@ -1,21 +1,44 @@
-import sys
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+from case_folding import fold_patterns
+from dfa_analysis import backtracking_states, self_loop_states
 from emit_lexer import create_header_and_emit_manifest, create_body
-from nfa_to_dfa import nfa_to_dfa
+from emit_python_module import create_python_module
+from generation_budget import Budget, BudgetError, blame_patterns
+from nfa_to_dfa import nfa_to_dfa, nfa_to_dfa_parallel
+from output_file import OutputFiles
 from pattern_descriptor import PatternDesc
-from regex_lexer import tokenize_regex, TokenType, LexerError
-from regex_parser import parse, add_id, ParserError
+from regex_lexer import tokenize_regex, LexerError
+from regex_parser import parse, ParserError
+from regex_simplifier import simplify_patterns
+from regex_to_dfa import regex_to_dfa
 from regex_to_nfa import regex_to_nfa, combine_nfas
+from scanner_profile import ProfileError, read_profiles
+
+
+# the lexer generator can be used as a library: generate_lexer turns a single input file into a lexer, and
+# generate_lexers does the same for many input files at once, in parallel worker processes
+# the command line interface at the bottom of this file is just a thin wrapper around them
+
+
+# error in the input file
+class SpecError(Exception):
+    def __init__(self, message, line_num):
+        self.message = message
+        self.line_num = line_num
+
+    def __str__(self):
+        return "Line " + str(self.line_num) + ": " + self.message
 
 
 # error reporting helper routine
 def report_error(error, line_num):
-    print("Line " + str(line_num) + ": ")
-    print(error)
-    exit(1)
+    raise SpecError(str(error), line_num)
 
 
 # extract the name and the pattern itself from the provided line of text from the input file
-def extract_name_and_pattern(line):
+def extract_name_and_pattern(line, line_num):
     # extract the name
     if line.count(' ') == 0:
         report_error("Ill-formed regex pattern!", line_num)
@@ -43,8 +66,27 @@ def extract_name_and_pattern(line):
     return name, pattern
 
 
+# attributes which can be given to a pattern between the pattern itself and its code fragment
+#   _skip - matches of the pattern are consumed by the lexer without creating tokens (the pattern can't have code)
+#   _nocase - the pattern matches the ASCII letters regardless of their case
+PATTERN_ATTRIBUTES = ["_skip", "_nocase"]
+
+
+# extract the attributes of the pattern from the provided line of text from the input file
+def extract_attributes(line, line_num):
+    ccparr_index = line.index('}%')
+    code_index = line.index('#{') if '#{' in line else len(line)
+    attributes = line[ccparr_index + 2:code_index].split()
+
+    for attribute in attributes:
+        if attribute not in PATTERN_ATTRIBUTES:
+            report_error("Unknown pattern attribute " + attribute + "!", line_num)
+
+    return attributes
+
+
 # extract the code fragment of the pattern from the provided line of text from the input file
-def extract_code(line):
+def extract_code(line, line_num):
     if line.count('#{') != 1:
         report_error("Ill-formed regex pattern!", line_num)
     ocuparr_index = line.index('#{')
@@ -75,6 +117,7 @@ def collect_manifest_code(file, line_num):
         line_num += 1
         if not line or "_tokens:" in line:
             file.seek(file_pos)
+            line_num -= 1
             break
         manifest_code += line
 
@@ -95,6 +138,7 @@ def collect_tokens(file, line_num):
         line_num += 1
         if not line or "_defines:" in line:
             file.seek(file_pos)
+            line_num -= 1
             break
 
         token_list.append(line.strip())
@@ -103,11 +147,11 @@ def collect_tokens(file, line_num):
 
 
 # populate the ID table of the regex parser
-# for every defined identifier, create a parse tree and add it to the dictionary
-def hash_identifiers(file, line_num):
-    defines = file.readline().strip()
+# for every defined identifier, create a parse tree and add it to the provided dictionary
+def hash_identifiers(file, line_num, defines):
+    label = file.readline().strip()
     line_num += 1
-    if defines != "_defines:":
+    if label != "_defines:":
         report_error("_defines: label not found!", line_num)
 
     while True:
@@ -116,10 +160,11 @@ def hash_identifiers(file, line_num):
         line_num += 1
         if not line or "_patterns:" in line:
             file.seek(file_pos)
+            line_num -= 1
             break
 
         line = line.strip()
-        (name, pattern) = extract_name_and_pattern(line)
+        (name, pattern) = extract_name_and_pattern(line, line_num)
 
         # try to tokenize the regex pattern
         token_list = None
@@ -131,18 +176,66 @@ def hash_identifiers(file, line_num):
         # try to parse the regex pattern
         root = None
         try:
-            root = parse(token_list)
+            root = parse(token_list, defines)
         except ParserError as pe:
             report_error(pe, line_num)
 
         # save the identifier and its AST in the dictionary
-        add_id(name, root)
+        defines[name] = root
 
     return line_num
 
 
+# create the DFA which recognizes the provided patterns within the budget
+# the DFA is created either through the Thompson NFA and the subset construction (engine 'nfa') or directly from
+# the ASTs of the patterns (engine 'direct')
+# the subset construction is run on the provided number of worker processes (all available cores if None)
+def create_dfa(pattern_descs, engine, budget, jobs=1):
+    if engine == "nfa":
+        # convert the ASTs to NFAs
+        for patt_desc in pattern_descs:
+            patt_desc.nfa = regex_to_nfa(patt_desc.root)
+
+        # combine the NFAs
+        (nfa, pattern_descs) = combine_nfas(pattern_descs)
+
+        # convert NFA to DFA
+        if jobs == 1:
+            return nfa_to_dfa(nfa, pattern_descs, budget)
+        return nfa_to_dfa_parallel(nfa, pattern_descs, jobs, budget)
+    else:
+        return regex_to_dfa(pattern_descs, budget)
+
+
+# summary of a successfully generated lexer
+class GenerationResult:
+    __slots__ = ('filename', 'header', 'source', 'states', 'transitions', 'nfa_states_saved', 'changed')
+
+    def __init__(self, filename, header, source, states, transitions, nfa_states_saved=0, changed=True):
+        self.filename = filename
+        self.header = header
+        self.source = source
+        self.states = states
+        self.transitions = transitions
+        # number of NFA states the simplification of the regex ASTs has saved
+        self.nfa_states_saved = nfa_states_saved
+        # whether any of the output files has been replaced, as they are left untouched if their contents are the same
+        self.changed = changed
+
+    def __str__(self):
+        return self.filename + ": " + str(self.states) + " DFA states, " + str(self.transitions) + \
+            " transitions (" + str(self.nfa_states_saved) + " NFA states saved by regex simplification), " + \
+            ("written to " + self.header + " and " + self.source if self.changed else
+             self.header + " and " + self.source + " are up to date")
+
+
 # parse the regex patterns and emit the finished lexical analyzer
-def do_the_magic(file, line_num, manifest_code, tokens):
+# the generated lexer is written to the output_prefix.h and output_prefix.cpp files, unless they are up to date
+# if a Profile is provided, the scanner is laid out according to it
+# the scanner makes the transitions using switches (backend 'switch') or computed goto (backend 'goto')
+# if python_module is set, a CPython extension module around the lexer and its setup script are emitted as well
+def do_the_magic(file, line_num, manifest_code, tokens, defines, engine, budget, output_prefix, profile, jobs, backend,
+                 python_module):
     patterns = file.readline().strip()
     line_num += 1
     if patterns != "_patterns:":
@@ -158,8 +251,15 @@ def do_the_magic(file, line_num, manifest_code, tokens):
             break
 
         line = line.strip()
-        (name, pattern) = extract_name_and_pattern(line)
-        code = extract_code(line)
+        (name, pattern) = extract_name_and_pattern(line, line_num)
+        attributes = extract_attributes(line, line_num)
+        skip = "_skip" in attributes
+        if skip:
+            if '#{' in line:
+                report_error("Skipped patterns can't have code!", line_num)
+            code = ''
+        else:
+            code = extract_code(line, line_num)
 
         # try to tokenize the regex pattern
         token_list = None
@@ -171,35 +271,63 @@ def do_the_magic(file, line_num, manifest_code, tokens):
         # try to parse the regex pattern
         root = None
         try:
-            root = parse(token_list)
+            root = parse(token_list, defines)
         except ParserError as pe:
             report_error(pe, line_num)
 
-        # convert the AST to nfa
-        nfa = regex_to_nfa(root)
-
         # create PatternDesc object and append it to the list
-        pattern_descs.append(PatternDesc(name, code, nfa))
-
-    # combine the NFAs
-    (nfa, pattern_descs) = combine_nfas(pattern_descs)
-
-    # convert NFA to DFA
-    (dstates, dtran, dfa_acc_states, pattern_descs) = nfa_to_dfa(nfa, pattern_descs)
+        pattern_descs.append(PatternDesc(name, code, root, None, skip, "_nocase" in attributes))
+
+    # the parsed ASTs, which share the ASTs of the defines, are kept for finding out which defines are to blame
+    parsed_roots = [patt_desc.root for patt_desc in pattern_descs]
+    # match the case-insensitive patterns on the input with its letters folded to lower case
+    case_fold = fold_patterns(pattern_descs)
+    # remove the redundant structure of the regexes before it turns into automaton states
+    nfa_states_saved = simplify_patterns(pattern_descs)
+
+    # create the DFA, and if it explodes, find out which patterns are to blame
+    try:
+        (dstates, dtran, dfa_acc_states, pattern_descs) = create_dfa(pattern_descs, engine, budget, jobs)
+    except BudgetError as be:
+        report = blame_patterns(pattern_descs, parsed_roots, defines, lambda descs, b: create_dfa(descs, engine, b),
+                                budget)
+        raise BudgetError("DFA creation aborted! " + str(be) + "\n" + report)
+
+    if profile is not None:
+        profile.check(len(dstates), dtran, dfa_acc_states)
+
+    # find the states which need failure memoization to keep the scanning linear
+    memo_states = backtracking_states(len(dstates), dtran, dfa_acc_states)
+    # find the states which can skip runs of input at once
+    skip_states = self_loop_states(len(dstates), dtran)
 
     # emit the actual lexer code
-    create_header_and_emit_manifest(manifest_code, tokens, len(dstates))
-    create_body(dstates, dtran, dfa_acc_states, pattern_descs, tokens)
-
-
-if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        report_error("Incorrect number of command line arguments! Should be only the input file name!", 0)
-
-    filename = sys.argv[1]
-    if ".mll" not in filename:
-        print("Input file name should have .mll extension!")
-        exit(1)
+    # the output files are only replaced once all of them have been written, and the ones whose contents are the same
+    # are not replaced at all, so that the lexer is not rebuilt needlessly
+    with OutputFiles() as outputs:
+        create_header_and_emit_manifest(outputs, manifest_code, tokens, len(dstates), output_prefix, len(memo_states))
+        create_body(outputs, dstates, dtran, dfa_acc_states, pattern_descs, tokens, output_prefix, profile, memo_states,
+                    skip_states, backend, case_fold)
+        if python_module:
+            create_python_module(outputs, tokens, output_prefix)
+
+    return GenerationResult(file.name, output_prefix + ".h", output_prefix + ".cpp", len(dstates),
+                            dtran.transition_count(), nfa_states_saved, outputs.changed)
+
+
+# generate the lexer described by the input file
+# returns a GenerationResult, or raises SpecError if the input file is ill-formed, BudgetError (along with the report
+# of the patterns to blame) if the DFA creation exceeded the budget, or ProfileError if the provided Profile was
+# recorded with a different DFA
+# with the nfa engine, the subset construction is run on the provided number of worker processes (all available cores
+# if None)
+def generate_lexer(filename, output_prefix="my_little_lexer", engine="nfa", budget=None, profile=None, jobs=1,
+                   backend="switch", python_module=False):
+    if not filename.endswith(".mll"):
+        raise SpecError("Input file name should have .mll extension!", 0)
+
+    if budget is not None:
+        budget.restart()
 
     with open(filename, 'r') as file:
         line_num = 0
@@ -210,7 +338,97 @@ if __name__ == "__main__":
         (token_list, line_num) = collect_tokens(file, line_num)
 
         # collect the defines
-        line_num = hash_identifiers(file, line_num)
+        defines = {}
+        line_num = hash_identifiers(file, line_num, defines)
 
         # parse the regex patterns and emit lexer code
-        do_the_magic(file, line_num, manifest_code, token_list)
+        return do_the_magic(file, line_num, manifest_code, token_list, defines, engine, budget, output_prefix,
+                            profile, jobs, backend, python_module)
+
+
+# generate_lexer wrapper for the worker processes, which reports errors as a part of the result
+def generate_lexer_or_error(filename, output_prefix, engine, budget, backend, python_module):
+    try:
+        return filename, generate_lexer(filename, output_prefix, engine, budget, backend=backend,
+                                        python_module=python_module), None
+    except (SpecError, BudgetError, OSError) as e:
+        return filename, None, str(e)
+
+
+# generate the lexers described by the input files, using up to the provided number of worker processes (all available
+# cores if None)
+# every lexer is written next to its input file (or to the output directory, if provided), with the same base name
+# returns a list of (input file name, GenerationResult or None, error message or None) tuples, one for each input file
+def generate_lexers(filenames, output_dir=None, engine="nfa", budget=None, jobs=None, backend="switch",
+                    python_module=False):
+    prefixes = []
+    for filename in filenames:
+        prefix = os.path.splitext(filename)[0]
+        if output_dir is not None:
+            prefix = os.path.join(output_dir, os.path.basename(prefix))
+        prefixes.append(prefix)
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        return list(executor.map(generate_lexer_or_error, filenames, prefixes, [engine] * len(filenames),
+                                 [budget] * len(filenames), [backend] * len(filenames),
+                                 [python_module] * len(filenames)))
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Generate a lexical analyzer from the .mll specification.")
+    arg_parser.add_argument("filenames", nargs='+', metavar="filename",
+                            help="input file with the language specification")
+    arg_parser.add_argument("-o", "--output-prefix", default="my_little_lexer",
+                            help="write the lexer to OUTPUT_PREFIX.h and OUTPUT_PREFIX.cpp (only for a single input "
+                                 "file)")
+    arg_parser.add_argument("--output-dir",
+                            help="with several input files, write every lexer to this directory instead of next to "
+                                 "its input file")
+    arg_parser.add_argument("-j", "--jobs", type=int,
+                            help="with several input files, the number of worker processes which generate the lexers "
+                                 "(all cores by default); with a single input file and the nfa engine, the number "
+                                 "of worker processes which run the subset construction (1 by default)")
+    arg_parser.add_argument("--engine", choices=["nfa", "direct"], default="nfa",
+                            help="create the DFA through the Thompson NFA and the subset construction (nfa), or "
+                                 "directly from the regex ASTs using followpos (direct)")
+    arg_parser.add_argument("--backend", choices=["switch", "goto"], default="switch",
+                            help="make the transitions of the scanner with a switch per state (switch), or with a jump "
+                                 "through a table of 256 label addresses per state, using the computed goto of GCC "
+                                 "and Clang, falling back to the switches with other compilers (goto)")
+    arg_parser.add_argument("--python", action="store_true",
+                            help="also emit a CPython extension module around the lexer (OUTPUT_PREFIX_python.cpp), "
+                                 "and its setup script (OUTPUT_PREFIX_setup.py)")
+    arg_parser.add_argument("--profile", action="append",
+                            help="lay out the scanner according to the profile written by Lexer::dump_profile of the "
+                                 "lexer built with MY_LITTLE_LEXER_PROFILE defined (can be given more than once, the "
+                                 "profiles are summed up)")
+    arg_parser.add_argument("--max-states", type=int, help="abort if the DFA has more states than this")
+    arg_parser.add_argument("--max-transitions", type=int, help="abort if the DFA has more transitions than this")
+    arg_parser.add_argument("--max-time", type=float, help="abort if creating the DFA takes more seconds than this")
+    arg_parser.add_argument("--max-memory", type=float,
+                            help="abort if creating the DFA takes more megabytes of memory than this")
+    args = arg_parser.parse_args()
+    budget = Budget(args.max_states, args.max_transitions, args.max_time, args.max_memory)
+
+    if len(args.filenames) == 1:
+        try:
+            profile = read_profiles(args.profile) if args.profile is not None else None
+            print(generate_lexer(args.filenames[0], args.output_prefix, args.engine, budget, profile,
+                                 args.jobs if args.jobs is not None else 1, args.backend, args.python))
+        except (SpecError, BudgetError, ProfileError, OSError) as e:
+            print(e)
+            exit(1)
+    elif args.profile is not None:
+        print("A profile can only be used with a single input file!")
+        exit(1)
+    else:
+        failed = False
+        for (filename, result, error) in generate_lexers(args.filenames, args.output_dir, args.engine, budget,
+                                                         args.jobs, args.backend, args.python):
+            if error is not None:
+                print(filename + ": " + error)
+                failed = True
+            else:
+                print(result)
+        if failed:
+            exit(1)
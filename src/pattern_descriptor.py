@@ -1,14 +1,20 @@
 # a class gathering all necessary information about a regex pattern
 # with every user defined pattern, we associate a name, a block of code which should execute if the pattern is
-# recognized, an NFA transition matrix for this pattern, an accepting state in the combined NFA,
-# as well as the list of DFA accepting states which recognize this pattern
+# recognized, the AST of the pattern, an NFA transition matrix for this pattern (only if the DFA is created through
+# an NFA), whether its matches should be skipped by the lexer, whether it is case-insensitive, an accepting state in
+# the combined NFA, as well as the list of DFA accepting states which recognize this pattern
 
 
 class PatternDesc:
-    def __init__(self, pat, code, nfa):
+    __slots__ = ('name', 'code', 'root', 'nfa', 'skip', 'nocase', 'nfa_acc_state', 'dfa_acc_states')
+
+    def __init__(self, pat, code, root, nfa, skip=False, nocase=False):
         self.name = pat
         self.code = code
+        self.root = root
         self.nfa = nfa
+        self.skip = skip
+        self.nocase = nocase
         self.nfa_acc_state = 0
         self.dfa_acc_states = []
 
@@ -24,6 +24,11 @@ class States(Enum):
     S13 = 14
     S14 = 15
     S15 = 16
+    S16 = 17
+    S17 = 18
+    S18 = 19
+    S19 = 20
+    S20 = 21
 
 
 # classes of expected input characters
@@ -40,50 +45,63 @@ class CharClass(Enum):
     union = 9
     kleene = 10
     escape = 11
+    plus = 12
+    question = 13
+    comma = 14
 
 
 # transition matrix of the regex lexical analyzer DFA
 # given the current state and the next input character, return the next DFA state
 transition_matrix = [
     [States.SE, States.SE, States.SE, States.SE, States.SE, States.SE, States.SE, States.SE, States.SE, States.SE,
-     States.SE, States.SE],
-    [States.S10, States.S10, States.S1, States.SE, States.S3, States.SE, States.SE, States.S11, States.S11, States.S11,
-     States.S11, States.S12],
+     States.SE, States.SE, States.SE, States.SE, States.SE],
+    [States.S10, States.S10, States.S20, States.SE, States.S3, States.SE, States.SE, States.S11, States.S11, States.S11,
+     States.S11, States.S12, States.S11, States.S11, States.S10],
     [States.S1, States.SE, States.SE, States.S2, States.SE, States.SE, States.SE, States.SE, States.SE, States.SE,
-     States.SE, States.SE],
+     States.SE, States.SE, States.S1, States.S1, States.S1],
     [States.SE, States.SE, States.SE, States.SE, States.SE, States.SE, States.SE, States.SE, States.SE, States.SE,
-     States.SE, States.SE],
+     States.SE, States.SE, States.SE, States.SE, States.SE],
     [States.S4, States.S7, States.SE, States.SE, States.SE, States.SE, States.SE, States.SE, States.SE, States.SE,
-     States.SE, States.SE],
+     States.SE, States.SE, States.S4, States.S4, States.S4],
     [States.SE, States.SE, States.SE, States.SE, States.SE, States.SE, States.S5, States.SE, States.SE, States.SE,
-     States.SE, States.SE],
+     States.SE, States.SE, States.SE, States.SE, States.SE],
     [States.S14, States.SE, States.SE, States.SE, States.SE, States.SE, States.SE, States.SE, States.SE, States.SE,
-     States.SE, States.SE],
+     States.SE, States.SE, States.S14, States.S14, States.S14],
     [States.SE, States.SE, States.SE, States.SE, States.SE, States.SE, States.SE, States.SE, States.SE, States.SE,
-     States.SE, States.SE],
+     States.SE, States.SE, States.SE, States.SE, States.SE],
     [States.SE, States.SE, States.SE, States.SE, States.SE, States.SE, States.S8, States.SE, States.SE, States.SE,
-     States.SE, States.SE],
+     States.SE, States.SE, States.SE, States.SE, States.SE],
     [States.SE, States.S15, States.SE, States.SE, States.SE, States.SE, States.SE, States.SE, States.SE, States.SE,
-     States.SE, States.SE],
+     States.SE, States.SE, States.SE, States.SE, States.SE],
     [States.SE, States.SE, States.SE, States.SE, States.SE, States.SE, States.SE, States.SE, States.SE, States.SE,
-     States.SE, States.SE],
+     States.SE, States.SE, States.SE, States.SE, States.SE],
     [States.SE, States.SE, States.SE, States.SE, States.SE, States.SE, States.SE, States.SE, States.SE, States.SE,
-     States.SE, States.SE],
+     States.SE, States.SE, States.SE, States.SE, States.SE],
     [States.SE, States.SE, States.SE, States.SE, States.SE, States.SE, States.SE, States.SE, States.SE, States.SE,
-     States.SE, States.SE],
+     States.SE, States.SE, States.SE, States.SE, States.SE],
     [States.SE, States.SE, States.S13, States.S13, States.S13, States.S13, States.S13, States.S13, States.S13,
-     States.S13, States.S13, States.S13],
+     States.S13, States.S13, States.S13, States.S13, States.S13, States.SE],
     [States.SE, States.SE, States.SE, States.SE, States.SE, States.SE, States.SE, States.SE, States.SE, States.SE,
-     States.SE, States.SE],
+     States.SE, States.SE, States.SE, States.SE, States.SE],
     [States.SE, States.SE, States.SE, States.SE, States.SE, States.S6, States.SE, States.SE, States.SE, States.SE,
-     States.SE, States.SE],
+     States.SE, States.SE, States.SE, States.SE, States.SE],
     [States.SE, States.SE, States.SE, States.SE, States.SE, States.S9, States.SE, States.SE, States.SE, States.SE,
-     States.SE, States.SE]
+     States.SE, States.SE, States.SE, States.SE, States.SE],
+    [States.SE, States.S16, States.SE, States.S19, States.SE, States.SE, States.SE, States.SE, States.SE, States.SE,
+     States.SE, States.SE, States.SE, States.SE, States.S17],
+    [States.SE, States.S18, States.SE, States.S19, States.SE, States.SE, States.SE, States.SE, States.SE, States.SE,
+     States.SE, States.SE, States.SE, States.SE, States.SE],
+    [States.SE, States.S18, States.SE, States.S19, States.SE, States.SE, States.SE, States.SE, States.SE, States.SE,
+     States.SE, States.SE, States.SE, States.SE, States.SE],
+    [States.SE, States.SE, States.SE, States.SE, States.SE, States.SE, States.SE, States.SE, States.SE, States.SE,
+     States.SE, States.SE, States.SE, States.SE, States.SE],
+    [States.S1, States.S16, States.SE, States.S2, States.SE, States.SE, States.SE, States.SE, States.SE, States.SE,
+     States.SE, States.SE, States.S1, States.S1, States.S1]
 ]
 
 
 def is_accepting_state(state):
-    return state in (States.S2, States.S6, States.S9, States.S10, States.S11, States.S13)
+    return state in (States.S2, States.S6, States.S9, States.S10, States.S11, States.S13, States.S19)
 
 
 def character_class(c):
@@ -111,6 +129,12 @@ def character_class(c):
         return CharClass.kleene
     elif c == '\\':
         return CharClass.escape
+    elif c == '+':
+        return CharClass.plus
+    elif c == '?':
+        return CharClass.question
+    elif c == ',':
+        return CharClass.comma
     else:
         return CharClass.char
 
@@ -127,16 +151,23 @@ class TokenType(Enum):
     CPAR = 7
     SPECIAL = 8
     ERROR = 9
+    PLUS = 10
+    OPTIONAL = 11
+    REPEAT = 12
 
 
 # given the DFA state, return ERROR if it is not an accepting state, else return the token type for the state
 token_type_table = [TokenType.ERROR, TokenType.ERROR, TokenType.ERROR, TokenType.ID, TokenType.ERROR, TokenType.ERROR,
                     TokenType.ERROR, TokenType.INTERVAL, TokenType.ERROR, TokenType.ERROR, TokenType.INTERVAL,
-                    TokenType.CHAR, TokenType.SPECIAL, TokenType.ERROR, TokenType.CHAR]
+                    TokenType.CHAR, TokenType.SPECIAL, TokenType.ERROR, TokenType.CHAR, TokenType.ERROR,
+                    TokenType.ERROR, TokenType.ERROR, TokenType.ERROR, TokenType.ERROR, TokenType.REPEAT,
+                    TokenType.ERROR]
 
 
 # token class for the regex lexical analyzer
 class Token:
+    __slots__ = ('type', 'lexeme', 'end')
+
     def __init__(self, type, lexeme, end):
         self.type = type
         self.lexeme = lexeme
@@ -165,6 +196,15 @@ def next_char(regex):
         return '', True, regex
 
 
+# return the (minimum, maximum) number of repetitions of the lexeme of a REPEAT token (without the braces), the maximum
+# being None if there is no upper bound
+def repeat_bounds(lexeme):
+    bounds = lexeme.split(',')
+    if len(bounds) == 1:
+        return int(bounds[0]), int(bounds[0])
+    return int(bounds[0]), int(bounds[1]) if bounds[1] != '' else None
+
+
 # finalize token
 def postprocess_token(token):
     # to reduce the number of DFA states, some special characters which should have different types were labeled as
@@ -176,6 +216,10 @@ def postprocess_token(token):
             token.type = TokenType.CPAR
         elif token.lexeme == '|':
             token.type = TokenType.UNION
+        elif token.lexeme == '+':
+            token.type = TokenType.PLUS
+        elif token.lexeme == '?':
+            token.type = TokenType.OPTIONAL
         else:
             token.type = TokenType.KLEENE
 
@@ -188,10 +232,16 @@ def postprocess_token(token):
                 (token.lexeme[1].isupper() and token.lexeme[3].islower()):
             raise LexerError("Ill-formed interval regex!")
 
-    # strip the ID and INTERVAL tokens of the unnecessary braces
-    if token.type in (TokenType.ID, TokenType.INTERVAL):
+    # strip the ID, INTERVAL and REPEAT tokens of the unnecessary braces
+    if token.type in (TokenType.ID, TokenType.INTERVAL, TokenType.REPEAT):
         token.lexeme = token.lexeme[1:-1]
 
+    # the bounds of a repetition ({m}, {m,n} or {m,}) must make up a non-empty range, other than {0}
+    if token.type == TokenType.REPEAT:
+        (low, high) = repeat_bounds(token.lexeme)
+        if high is not None and (low > high or high == 0):
+            raise LexerError("Ill-formed repetition regex!")
+
     # create a token list for an interval expression
     if token.type == TokenType.INTERVAL:
         end = token.end
@@ -255,7 +305,8 @@ def tokenize_regex(regex):
             prev = token_list[-1]
             first = token[0]
             if first.type in (TokenType.CHAR, TokenType.INTERVAL, TokenType.ID, TokenType.OPAR) and \
-                    prev.type in (TokenType.CHAR, TokenType.INTERVAL, TokenType.ID, TokenType.CPAR, TokenType.KLEENE):
+                    prev.type in (TokenType.CHAR, TokenType.INTERVAL, TokenType.ID, TokenType.CPAR, TokenType.KLEENE,
+                                  TokenType.PLUS, TokenType.OPTIONAL, TokenType.REPEAT):
                 token_list.append(Token(TokenType.CONCAT, '^', False))
         token_list += token
 
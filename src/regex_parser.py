@@ -1,4 +1,4 @@
-from regex_lexer import TokenType
+from regex_lexer import TokenType, repeat_bounds
 from enum import Enum
 
 
@@ -9,10 +9,17 @@ class NodeType(Enum):
     KLEENE = 2
     CONCAT = 3
     ERROR = 4
+    PLUS = 5
+    OPTIONAL = 6
+    # the value of a repetition node is the (minimum, maximum) number of repetitions, the maximum being None if there
+    # is no upper bound
+    REPEAT = 7
 
 
 # represents a node within the abstract syntax tree (AST)
 class Node:
+    __slots__ = ('type', 'value', 'children')
+
     def __init__(self, type, value, *children):
         self.type = type
         self.value = value
@@ -40,125 +47,125 @@ class ParserError(Exception):
         return self.message
 
 
-# dictionary of IDs
-# regex for every ID defined in the first stage should be hashed here, to be used in the second stage
-id_dict = {}
-
-
-# add a regex for an ID to the dictionary
-def add_id(id, regex):
-    global id_dict
-    id_dict[id] = regex
-
-
-# lookahead symbol for the parser
-lookahead = None
-# list of tokens acquired from the lexical analyzer
-token_list = None
-# AST is built using a stack-machine-like algorithm
-# productions which represent operands of a regex expression (eg. factor) push the AST node which corresponds
-# to the operand on the stack
-# productions which represent operators of a regex expression (eg. concat) pop the right number of operands off
-# the stack, create an operator AST node with popped operand nodes as children, and push the operator AST node
-# back to the stack
-stack = []
-
-
-# get the next lookahead symbol
-def peek():
-    global token_list, lookahead
-    if len(token_list) > 0:
-        lookahead = token_list[0]
-
-
-# check whether the expected symbol is indeed the next symbol of the token list
-# advance the lookahead symbol
-def match(type):
-    global token_list
-    if type == token_list[0].type:
-        token_list = token_list[1:len(token_list)]
-        peek()
-    else:
-        raise ParserError("Parse matching error!")
-
-
-# six following functions represent productions of the LL(1) regex grammar
-# recursive descent is used as parsing technique
-# grammar in use is essentially the classic regex grammar transformed to be right-recursive, which makes it
-# possible to implement it using recursive descent
-def factor():
-    global lookahead, stack
-    if lookahead.type == TokenType.OPAR:
-        match(TokenType.OPAR)
-        union()
-        match(TokenType.CPAR)
-    elif lookahead.type == TokenType.CHAR:
-        tmp = lookahead
-        match(TokenType.CHAR)
-        stack.append(Node(NodeType.CHAR, tmp.lexeme))
-    elif lookahead.type == TokenType.ID:
-        tmp = lookahead
-        match(TokenType.ID)
-        # check whether the ID was previously defined
-        global id_dict
-        if tmp.lexeme in id_dict.keys():
-            stack.append(id_dict[tmp.lexeme])
+# recursive descent parser of a single regex
+# all the state of a parse is kept in the parser object, so that regexes can be parsed in several threads at once
+class Parser:
+    __slots__ = ('id_dict', 'token_list', 'position', 'lookahead', 'stack')
+
+    def __init__(self, tokens, ids):
+        # dictionary of IDs which can be used by the regex being parsed
+        # regex for every ID defined in the first stage is hashed by the caller, and handed to the parser in the second
+        # stage
+        self.id_dict = ids
+        # list of tokens acquired from the lexical analyzer, and the position of the lookahead symbol in it
+        self.token_list = tokens
+        self.position = 0
+        # lookahead symbol for the parser
+        self.lookahead = None
+        # AST is built using a stack-machine-like algorithm
+        # productions which represent operands of a regex expression (eg. factor) push the AST node which corresponds
+        # to the operand on the stack
+        # productions which represent operators of a regex expression (eg. concat) pop the right number of operands off
+        # the stack, create an operator AST node with popped operand nodes as children, and push the operator AST node
+        # back to the stack
+        self.stack = []
+
+    # return whether there are tokens left to match
+    def tokens_left(self):
+        return self.position < len(self.token_list)
+
+    # get the next lookahead symbol
+    def peek(self):
+        if self.tokens_left():
+            self.lookahead = self.token_list[self.position]
+
+    # check whether the expected symbol is indeed the next symbol of the token list
+    # advance the lookahead symbol
+    def match(self, type):
+        if self.tokens_left() and type == self.token_list[self.position].type:
+            self.position += 1
+            self.peek()
+        else:
+            raise ParserError("Parse matching error!")
+
+    # six following methods represent productions of the LL(1) regex grammar
+    # recursive descent is used as parsing technique
+    # grammar in use is essentially the classic regex grammar transformed to be right-recursive, which makes it
+    # possible to implement it using recursive descent
+    def factor(self):
+        if self.lookahead.type == TokenType.OPAR:
+            self.match(TokenType.OPAR)
+            self.union()
+            self.match(TokenType.CPAR)
+        elif self.lookahead.type == TokenType.CHAR:
+            tmp = self.lookahead
+            self.match(TokenType.CHAR)
+            self.stack.append(Node(NodeType.CHAR, tmp.lexeme))
+        elif self.lookahead.type == TokenType.ID:
+            tmp = self.lookahead
+            self.match(TokenType.ID)
+            # check whether the ID was previously defined
+            if tmp.lexeme in self.id_dict.keys():
+                self.stack.append(self.id_dict[tmp.lexeme])
+            else:
+                raise ParserError("ID " + tmp.lexeme + " was not previously defined!")
         else:
-            raise ParserError("ID " + tmp.lexeme + " was not previously defined!")
-    else:
-        raise ParserError("Parse error!")
-
-
-def kleene():
-    global lookahead, stack
-    factor()
-    if lookahead.type == TokenType.KLEENE:
-        match(TokenType.KLEENE)
-        op = stack.pop()
-        stack.append(Node(NodeType.KLEENE, '*', op))
-
-
-def temp2():
-    global lookahead, stack
-    if lookahead.type == TokenType.CONCAT:
-        match(TokenType.CONCAT)
-        kleene()
-        op2 = stack.pop()
-        op1 = stack.pop()
-        stack.append(Node(NodeType.CONCAT, '^', op1, op2))
-        temp2()
-
-
-def concat():
-    kleene()
-    temp2()
-
-
-def temp1():
-    global lookahead, stack
-    if lookahead.type == TokenType.UNION:
-        match(TokenType.UNION)
-        concat()
-        op2 = stack.pop()
-        op1 = stack.pop()
-        stack.append(Node(NodeType.UNION, '|', op1, op2))
-        temp1()
-
-
-def union():
-    concat()
-    temp1()
-
-
-# parser driver
-# after the successful parse, the sole node on the stack is the AST root
-# after the unsuccessful parse, the sole node on the stack is an AST error node
-def parse(tokens):
-    global stack, token_list
-    stack = []
-    token_list = tokens
-    # load the first lookahead token
-    peek()
-    union()
-
-    return stack[0]
+            raise ParserError("Parse error!")
+
+    # the postfix operators (closures, optional and bounded repetition) can be applied one after another, eg. a{2}*
+    def kleene(self):
+        self.factor()
+        while self.tokens_left() and self.lookahead.type in (TokenType.KLEENE, TokenType.PLUS, TokenType.OPTIONAL,
+                                                             TokenType.REPEAT):
+            tmp = self.lookahead
+            self.match(tmp.type)
+            op = self.stack.pop()
+            if tmp.type == TokenType.KLEENE:
+                self.stack.append(Node(NodeType.KLEENE, '*', op))
+            elif tmp.type == TokenType.PLUS:
+                self.stack.append(Node(NodeType.PLUS, '+', op))
+            elif tmp.type == TokenType.OPTIONAL:
+                self.stack.append(Node(NodeType.OPTIONAL, '?', op))
+            else:
+                self.stack.append(Node(NodeType.REPEAT, repeat_bounds(tmp.lexeme), op))
+
+    def temp2(self):
+        if self.lookahead.type == TokenType.CONCAT:
+            self.match(TokenType.CONCAT)
+            self.kleene()
+            op2 = self.stack.pop()
+            op1 = self.stack.pop()
+            self.stack.append(Node(NodeType.CONCAT, '^', op1, op2))
+            self.temp2()
+
+    def concat(self):
+        self.kleene()
+        self.temp2()
+
+    def temp1(self):
+        if self.lookahead.type == TokenType.UNION:
+            self.match(TokenType.UNION)
+            self.concat()
+            op2 = self.stack.pop()
+            op1 = self.stack.pop()
+            self.stack.append(Node(NodeType.UNION, '|', op1, op2))
+            self.temp1()
+
+    def union(self):
+        self.concat()
+        self.temp1()
+
+    # parser driver
+    # after the successful parse, the sole node on the stack is the AST root
+    # after the unsuccessful parse, the sole node on the stack is an AST error node
+    def parse(self):
+        # load the first lookahead token
+        self.peek()
+        self.union()
+
+        return self.stack[0]
+
+
+# parse the list of regex tokens, using the provided dictionary of the ASTs of the IDs, and return the AST root
+def parse(tokens, ids):
+    return Parser(tokens, ids).parse()
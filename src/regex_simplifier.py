@@ -0,0 +1,227 @@
+from regex_parser import Node, NodeType
+
+# simplification of the regex ASTs, before they are transformed to automata
+# every operator of the regex becomes a few NFA states, which the subset construction has to go through, so redundant
+# structure of the regex is removed while preserving its language
+#   1. unions and concatenations are flattened into lists of alternatives and factors (they are associative)
+#   2. duplicate alternatives of a union are removed, and so are the alternatives r whose closure r* is an alternative
+#      too, as r | r* = r*
+#   3. nested closures are collapsed, as (r*)* = r*, and so are the closures of the alternatives of a closure, as
+#      (r* | s)* = (r | s)*, and the repeated closures of a concatenation, as r*r* = r*
+#      the same goes for the positive closures and the optional expressions, eg. (r+)? = r*, and for the repetitions
+#      which are one of them, eg. r{0,} = r*
+#   4. common prefixes of the alternatives are factored out, eg. then | this | throw = th(en | is | row)
+#      a prefix is only factored out of the alternatives which go on after it, so if | i stays as it is
+# the ASTs of the defines are shared between the patterns which use them, so the nodes are never changed, the
+# simplified subexpressions are new nodes (or the original ones, if there was nothing to simplify)
+
+
+# return whether the starting state of the NFA fragment the McNaughton-Yamada-Thompson algorithm creates for the AST has
+# incoming transitions, which is only the case for the positive closures (see transform_plus)
+def loops_to_start(root):
+    if root.type == NodeType.PLUS:
+        return True
+    elif root.type == NodeType.CONCAT:
+        return loops_to_start(root.children[0])
+    elif root.type == NodeType.REPEAT:
+        (low, high) = root.value
+        return low > 0 and (loops_to_start(root.children[0]) or (low, high) == (1, None))
+    return False
+
+
+# return the number of NFA states the McNaughton-Yamada-Thompson algorithm creates for the AST
+# concatenation merges the accepting state of its left operand with the starting state of the right one, unless the
+# latter has incoming transitions, and the positive closures and the optional expressions add one state
+# see transform_repeat for the bounded repetitions
+def nfa_states(root):
+    if root.type == NodeType.CHAR:
+        return 2
+    elif root.type == NodeType.KLEENE:
+        return nfa_states(root.children[0]) + 2
+    elif root.type in (NodeType.PLUS, NodeType.OPTIONAL):
+        return nfa_states(root.children[0]) + 1
+    elif root.type == NodeType.REPEAT:
+        (low, high) = root.value
+        inner = nfa_states(root.children[0])
+        # merged states of the concatenations of the copies which are followed by a copy
+        merged = 0 if loops_to_start(root.children[0]) else 1
+        if high is None:
+            return inner + 2 if low == 0 else low * inner + 1 - max(low - 2, 0) * merged
+        # the concatenations followed by the optional copies always merge
+        optional_merged = high - low if low > 0 else high - low - 1
+        return high * inner + (high - low) - optional_merged - max(low - 1, 0) * merged
+    elif root.type == NodeType.UNION:
+        return nfa_states(root.children[0]) + nfa_states(root.children[1]) + 2
+    else:
+        merged = 0 if loops_to_start(root.children[1]) else 1
+        return nfa_states(root.children[0]) + nfa_states(root.children[1]) - merged
+
+
+# return the list of the operands of the node if it is an associative operator of the provided type (without the
+# nested operators of the same type), or the node itself
+def operands(node, type):
+    if node.type != type:
+        return [node]
+    return operands(node.children[0], type) + operands(node.children[1], type)
+
+
+# types of the nodes whose languages contain the language of their operand
+CONTAINING_TYPES = (NodeType.KLEENE, NodeType.PLUS, NodeType.OPTIONAL)
+
+
+# simplifies the ASTs of the patterns
+# simplified subexpressions are remembered by their original nodes, so the shared ASTs of the defines are only
+# simplified once
+class Simplifier:
+    __slots__ = ('simplified', 'keys')
+
+    def __init__(self):
+        # (original node, simplified node) by the id of the original node
+        # the original node is kept alive, so that its id is not reused
+        self.simplified = {}
+        # (node, structural key) by the id of the node
+        self.keys = {}
+
+    # return the string which is equal for the structurally equal subexpressions
+    def key(self, node):
+        if id(node) not in self.keys:
+            if node.type == NodeType.CHAR:
+                key = repr(node.value)
+            else:
+                key = str(node.value) + "(" + ",".join(self.key(child) for child in node.children) + ")"
+            self.keys[id(node)] = (node, key)
+        return self.keys[id(node)][1]
+
+    # return the simplified AST
+    def simplify(self, root):
+        if id(root) in self.simplified:
+            return self.simplified[id(root)][1]
+
+        if root.type == NodeType.CHAR:
+            result = root
+        elif root.type == NodeType.KLEENE:
+            result = self.make_kleene(self.simplify(root.children[0]))
+        elif root.type == NodeType.PLUS:
+            result = self.make_plus(self.simplify(root.children[0]))
+        elif root.type == NodeType.OPTIONAL:
+            result = self.make_optional(self.simplify(root.children[0]))
+        elif root.type == NodeType.REPEAT:
+            result = self.make_repeat(self.simplify(root.children[0]), root.value)
+        elif root.type == NodeType.UNION:
+            result = self.make_union([self.simplify(alternative) for alternative in operands(root, NodeType.UNION)])
+        else:
+            result = self.make_concat([self.simplify(factor) for factor in operands(root, NodeType.CONCAT)])
+
+        # keep the original node if nothing has changed
+        if self.key(result) == self.key(root):
+            result = root
+        self.simplified[id(root)] = (root, result)
+        return result
+
+    # return the closure of the simplified node
+    def make_kleene(self, node):
+        if node.type in (NodeType.PLUS, NodeType.OPTIONAL):
+            node = node.children[0]
+        if node.type == NodeType.KLEENE:
+            return node
+        if node.type == NodeType.UNION:
+            alternatives = [alternative.children[0] if alternative.type in CONTAINING_TYPES else alternative
+                            for alternative in operands(node, NodeType.UNION)]
+            node = self.make_union(alternatives)
+        return Node(NodeType.KLEENE, '*', node)
+
+    # return the positive closure of the simplified node
+    def make_plus(self, node):
+        if node.type in (NodeType.KLEENE, NodeType.PLUS):
+            return node
+        if node.type == NodeType.OPTIONAL:
+            return self.make_kleene(node)
+        return Node(NodeType.PLUS, '+', node)
+
+    # return the optional simplified node
+    def make_optional(self, node):
+        if node.type in (NodeType.KLEENE, NodeType.OPTIONAL):
+            return node
+        if node.type == NodeType.PLUS:
+            return self.make_kleene(node)
+        return Node(NodeType.OPTIONAL, '?', node)
+
+    # return the bounded repetition of the simplified node
+    def make_repeat(self, node, bounds):
+        if bounds == (1, 1):
+            return node
+        elif bounds == (0, None):
+            return self.make_kleene(node)
+        elif bounds == (1, None):
+            return self.make_plus(node)
+        elif bounds == (0, 1):
+            return self.make_optional(node)
+        return Node(NodeType.REPEAT, bounds, node)
+
+    # return the union of the simplified nodes
+    def make_union(self, nodes):
+        alternatives = []
+        seen = set()
+        for node in nodes:
+            for alternative in operands(node, NodeType.UNION):
+                if self.key(alternative) not in seen:
+                    seen.add(self.key(alternative))
+                    alternatives.append(alternative)
+
+        # r | r* = r*, and the same goes for r+ and r?
+        closed = {self.key(alternative.children[0]) for alternative in alternatives
+                  if alternative.type in CONTAINING_TYPES}
+        alternatives = [alternative for alternative in alternatives if self.key(alternative) not in closed]
+
+        alternatives = self.factor(alternatives)
+        result = alternatives[0]
+        for alternative in alternatives[1:]:
+            result = Node(NodeType.UNION, '|', result, alternative)
+        return result
+
+    # return the concatenation of the simplified nodes
+    def make_concat(self, nodes):
+        factors = []
+        for node in nodes:
+            for factor in operands(node, NodeType.CONCAT):
+                # r*r* = r*
+                if len(factors) > 0 and factor.type == NodeType.KLEENE and self.key(factor) == self.key(factors[-1]):
+                    continue
+                factors.append(factor)
+
+        result = factors[0]
+        for factor in factors[1:]:
+            result = Node(NodeType.CONCAT, '^', result, factor)
+        return result
+
+    # factor the common first factors out of the alternatives of a union
+    # the factored alternative takes the place of the first alternative it was made of, so the alternatives keep their
+    # order
+    def factor(self, alternatives):
+        sequences = [operands(alternative, NodeType.CONCAT) for alternative in alternatives]
+        # sequences which go on after their first factor, by the key of the first factor
+        groups = {}
+        for sequence in sequences:
+            if len(sequence) > 1:
+                groups.setdefault(self.key(sequence[0]), []).append(sequence)
+
+        result = []
+        for (alternative, sequence) in zip(alternatives, sequences):
+            group = groups.get(self.key(sequence[0]), []) if len(sequence) > 1 else []
+            if len(group) < 2:
+                result.append(alternative)
+            elif group[0] is sequence:
+                rest = self.make_union([self.make_concat(member[1:]) for member in group])
+                result.append(self.make_concat([sequence[0], rest]))
+        return result
+
+
+# simplify the ASTs of the patterns (PatternDesc objects) in place, and return the number of NFA states it saves
+def simplify_patterns(pattern_descs):
+    simplifier = Simplifier()
+    saved = 0
+    for patt_desc in pattern_descs:
+        root = simplifier.simplify(patt_desc.root)
+        saved += nfa_states(patt_desc.root) - nfa_states(root)
+        patt_desc.root = root
+    return saved
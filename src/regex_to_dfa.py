@@ -0,0 +1,158 @@
+from array import array
+from automata import DFATransitions, EPS, encode_states, decode_states
+from regex_parser import NodeType
+
+# direct transformation of regex ASTs to a DFA, without building an NFA first [1]
+# every leaf of the AST (every occurrence of an input symbol in the regex) is called a position, and for every position
+# we compute the set of positions which can follow it in some string of the language (followpos)
+# this is done using three more functions of the AST nodes
+#   1. nullable - whether the language of the subexpression contains the empty string
+#   2. firstpos - the set of positions which can begin a string of the subexpression
+#   3. lastpos - the set of positions which can end a string of the subexpression
+# every pattern is then augmented with its own end marker position, and the DFA states are sets of positions
+# if a DFA state contains an end marker, it recognizes the pattern of that marker
+# compared to the Thompson NFA and the subset construction, there are no epsilon transitions, so there is no need for
+# epsilon closures
+#
+# [1] The Dragon Book, 2nd edition, p. 173
+
+
+# return nullable, firstpos and lastpos of the closure of the subexpression, setting followpos of its last positions
+# the positive closure is nullable only if the subexpression is
+def closure_positions(inner, followpos, positive=False):
+    (nullable, firstpos, lastpos) = inner
+    for pos in lastpos:
+        followpos[pos] |= firstpos
+    return nullable or not positive, firstpos, lastpos
+
+
+# return nullable, firstpos and lastpos of the concatenation of the subexpressions, setting followpos of the last
+# positions of the left one
+def concat_positions(left, right, followpos):
+    (nullable1, firstpos1, lastpos1) = left
+    (nullable2, firstpos2, lastpos2) = right
+    for pos in lastpos1:
+        followpos[pos] |= firstpos2
+    firstpos = firstpos1 | firstpos2 if nullable1 else firstpos1
+    lastpos = lastpos1 | lastpos2 if nullable2 else lastpos2
+    return nullable1 and nullable2, firstpos, lastpos
+
+
+# compute nullable, firstpos and lastpos of the AST node, registering the positions of its leaves on the way
+# since the ASTs of the defines are shared between all the patterns which use them, the same node can appear in the tree
+# more than once, so nothing is stored in the nodes themselves, and every occurrence gets its own positions
+# the repetitions of a bounded repetition are occurrences of their own too, so its subexpression is gone through once
+# for every repetition (nested as in r(r(r)?)?, see transform_repeat)
+# syms is the array of input symbol codes of the positions, and followpos the list of their followpos sets
+def compute_positions(root, syms, followpos):
+    if root.type == NodeType.CHAR:
+        pos = len(syms)
+        syms.append(ord(root.value))
+        followpos.append(set())
+        return False, {pos}, {pos}
+
+    if root.type == NodeType.REPEAT:
+        (low, high) = root.value
+        copies = [compute_positions(root.children[0], syms, followpos)
+                  for i in range(high if high is not None else max(low, 1))]
+        if high is None:
+            if low == 0:
+                return closure_positions(copies[0], followpos)
+            result = closure_positions(copies[low - 1], followpos, True)
+            for copy in reversed(copies[0:low - 1]):
+                result = concat_positions(copy, result, followpos)
+            return result
+
+        result = None
+        for copy in reversed(copies[low:]):
+            (nullable, firstpos, lastpos) = copy if result is None else concat_positions(copy, result, followpos)
+            result = (True, firstpos, lastpos)
+        for copy in reversed(copies[0:low]):
+            result = copy if result is None else concat_positions(copy, result, followpos)
+        return result
+
+    children = [compute_positions(child, syms, followpos) for child in root.children]
+
+    if root.type == NodeType.KLEENE:
+        return closure_positions(children[0], followpos)
+    elif root.type == NodeType.PLUS:
+        return closure_positions(children[0], followpos, True)
+    elif root.type == NodeType.OPTIONAL:
+        (nullable, firstpos, lastpos) = children[0]
+        return True, firstpos, lastpos
+    elif root.type == NodeType.UNION:
+        (nullable1, firstpos1, lastpos1) = children[0]
+        (nullable2, firstpos2, lastpos2) = children[1]
+        return nullable1 or nullable2, firstpos1 | firstpos2, lastpos1 | lastpos2
+    else:
+        return concat_positions(children[0], children[1], followpos)
+
+
+# perform the regex to DFA conversion for the ASTs of all the patterns
+# the result is the same as the one of nfa_to_dfa: the set of new DFA states, DFA transition matrix, the list of
+# accepting DFA states and the list of PatternDesc objects to which we have attached lists of accepting DFA states which
+# recognize them
+# DFA states are returned as sets of positions encoded by encode_states
+# if a Budget is provided, BudgetError is raised as soon as the DFA exceeds it
+def regex_to_dfa(pattern_descs, budget=None):
+    syms = array('i')
+    followpos = []
+    # pattern index of every end marker position
+    markers = {}
+
+    start_state = set()
+    for (index, patt_desc) in enumerate(pattern_descs):
+        (nullable, firstpos, lastpos) = compute_positions(patt_desc.root, syms, followpos)
+
+        # add the end marker position of the pattern, which has no input symbol
+        marker = len(syms)
+        syms.append(EPS)
+        followpos.append(set())
+        markers[marker] = index
+
+        for pos in lastpos:
+            followpos[pos].add(marker)
+        start_state |= firstpos
+        if nullable:
+            start_state.add(marker)
+
+    # list of DFA states
+    # the starting state is never looked up, as in the subset construction no transition can lead back to it (it is the
+    # only state which contains the starting state of the combined NFA)
+    dstates = [encode_states(start_state)]
+    # indexes of the DFA states, by their encoded sets of positions
+    dstates_index = {}
+    # DFA transition matrix
+    dtran = DFATransitions()
+    # list of accepting DFA states
+    acc_states = []
+    # DFA states are numbered in the order of discovery, so the list of states doubles as the list of unmarked states
+    # the states are decoded in sorted order, so the order of discovery does not depend on the iteration order of sets
+    curr_index = 0
+    while curr_index < len(dstates):
+        curr_state = decode_states(dstates[curr_index])
+
+        # group the followpos sets of the positions by their input symbols
+        moves = {}
+        for pos in curr_state:
+            if syms[pos] != EPS:
+                moves.setdefault(syms[pos], set()).update(followpos[pos])
+
+        dtran.add_state()
+        for (sym, positions) in moves.items():
+            new_state = encode_states(positions)
+            if new_state not in dstates_index:
+                dstates_index[new_state] = len(dstates)
+                dstates.append(new_state)
+                # the DFA state recognizes the earliest pattern whose end marker it contains
+                patterns = [markers[pos] for pos in positions if pos in markers]
+                if len(patterns) > 0:
+                    acc_states.append(dstates_index[new_state])
+                    pattern_descs[min(patterns)].dfa_acc_states.append(dstates_index[new_state])
+            dtran.add_transition(sym, dstates_index[new_state])
+
+        if budget is not None:
+            budget.check(len(dstates), dtran.transition_count())
+        curr_index += 1
+
+    return dstates, dtran, acc_states, pattern_descs
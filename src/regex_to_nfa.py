@@ -1,3 +1,4 @@
+from automata import NFA, EPS, NONE
 from regex_parser import NodeType
 
 # transformation of regex ASTs to non-deterministic finite automata (NFAs) using the McNaughton-Yamada-Thompson
@@ -10,150 +11,171 @@ from regex_parser import NodeType
 #   2. DFA has at most twice as many states as there are operators and operands in the regular expression
 #   3. each state of DFA other than the accepting state has either one outgoing transition on an input symbol
 #      or two outgoing transitions, both on epsilon
-# thus, the transition matrix is sparse so I decided to leave out the empty transitions and implement every state as
-# a list of tuples whose first element is the input symbol of the transition, while the other elements (one or two) are
-# the outgoing states
-# first row of the matrix always represents the starting state of the NFA, while the last row represents the
-# accepting state
+# thus, the transition matrix is sparse, and every state is described by the input symbol of its transition (or epsilon),
+# and one or two outgoing states (see the NFA class)
+# all the states of an NFA are created in a single NFA object, and every subexpression is transformed into a fragment
+# of it, represented by its starting and accepting state, so combining the fragments doesn't need to copy or renumber
+# any states
 #
 # [1] The Dragon Book, 2nd Ed, p. 161
 
 
 # helper function which prints the matrix
-def print_matrix(mat):
-    for state in mat:
-        print(state)
+def print_matrix(nfa):
+    for i in range(len(nfa)):
+        print(i, nfa.syms[i], nfa.out1[i], nfa.out2[i])
     print()
 
 
-# transform the simplest one-character expression (eg. 'a') to NFA
-def transform_simple_expression(expr):
-    lexeme = expr.value
-    return [
-        [[lexeme, 1], ['eps']],
-        [['eps']]
-    ]
+# transform the simplest one-character expression (eg. 'a') to NFA fragment
+def transform_simple_expression(nfa, expr):
+    start = nfa.add_state(ord(expr.value))
+    accept = nfa.add_state()
+    nfa.out1[start] = accept
+    return start, accept
 
 
-# helper function which offsets the outgoing states of the matrix by the desired value
-def offset_outgoing_states(mat, offset):
-    for state in mat:
-        for in_sym in state:
-            if in_sym[0] == 'eps':
-                if len(in_sym) == 1:
-                    continue
-                elif len(in_sym) == 3:
-                    in_sym[2] += offset
-                in_sym[1] += offset
-            else:
-                in_sym[1] += offset
+# create Kleene closure NFA fragment
+def transform_kleene(nfa, fragment):
+    (inner_start, inner_accept) = fragment
 
-    return mat
+    # insert new starting and accepting states
+    start = nfa.add_state()
+    accept = nfa.add_state()
+    nfa.out1[start] = inner_start
+    nfa.out2[start] = accept
 
+    # correct the old accepting state
+    nfa.out1[inner_accept] = inner_start
+    nfa.out2[inner_accept] = accept
 
-# create Kleene closure NFA
-def transform_kleene(mat):
-    # offset all the outgoing states by one, as we are inserting starting state as the first row of the matrix
-    mat = offset_outgoing_states(mat, 1)
+    return start, accept
 
-    # insert new starting and accepting states
-    mat.insert(0, [['eps', 1, len(mat) + 1]])
-    mat.append([['eps']])
 
-    # correct the old accepting state
-    mat[len(mat) - 2][0].append(1)
-    mat[len(mat) - 2][0].append(len(mat) - 1)
+def transform_concat(nfa, left, right):
+    # merge the right fragment starting state with the left fragment accepting state
+    # the right starting state has no incoming transitions, so it is simply left unused
+    nfa.copy_state(left[1], right[0])
+    return left[0], right[1]
 
-    return mat
 
+def transform_union(nfa, left, right):
+    # add the new starting and accepting state
+    start = nfa.add_state(EPS, left[0], right[0])
+    accept = nfa.add_state()
 
-def transform_concat(left, right):
-    # offset the outgoing states in the right DFA matrix, as we are removing the first (starting) state from it
-    # and appending it to the left NFA matrix
-    right = offset_outgoing_states(right, len(left) - 1)
+    # make the old accepting states point to the new accepting state
+    nfa.out1[left[1]] = accept
+    nfa.out1[right[1]] = accept
 
-    # remove the starting state from the right NFA matrix
-    start_state_right = right[0]
-    right.remove(right[0])
+    return start, accept
 
-    # merge the old right DFA matrix starting state with the old left NFA matrix accepting state
-    accept_index_left = len(left) - 1
-    left[accept_index_left].clear()
-    for in_sym in start_state_right:
-        left[accept_index_left].append(in_sym)
 
-    # append the states in the right NFA matrix to the left NFA matrix
-    for state in right:
-        left.append(state)
+# create positive closure NFA fragment
+# the old accepting state goes back to the old starting state, or on to the new accepting state, so unlike the Kleene
+# closure, the starting state of the fragment has incoming transitions, which is fine for concatenation, as the copy of
+# the starting state has the same outgoing transitions
+def transform_plus(nfa, fragment):
+    (inner_start, inner_accept) = fragment
 
-    return left
+    accept = nfa.add_state()
+    nfa.out1[inner_accept] = inner_start
+    nfa.out2[inner_accept] = accept
 
+    return inner_start, accept
 
-def transform_union(left, right):
-    # offset the outgoing states of the left NFA matrix, as we are adding the starting state of the new DFA matrix
-    # at the beginning
-    left = offset_outgoing_states(left, 1)
 
-    # offset the outgoing states of the right NFA matrix, as we are appending it to the left NFA matrix (and also
-    # adding the starting state at the beginning of the left NFA matrix)
-    right = offset_outgoing_states(right, len(left) + 1)
+# create optional NFA fragment
+# the new starting state skips to the old accepting state, which stays the accepting one
+def transform_optional(nfa, fragment):
+    (inner_start, inner_accept) = fragment
 
-    start_state_right = len(left) + 1
-    new_accept_state_index = len(left) + len(right) + 1
-    # make the old accepting states point to the new accepting state
-    left[-1][0].append(new_accept_state_index)
-    right[-1][0].append(new_accept_state_index)
+    start = nfa.add_state(EPS, inner_start, inner_accept)
 
-    # append the right NFA matrix to the left NFA matrix
-    for state in right:
-        left.append(state)
+    return start, inner_accept
 
-    # add the new starting and accepting state
-    left.insert(0, [['eps', 1, start_state_right]])
-    left.append([['eps']])
 
-    return left
+# create bounded repetition NFA fragment
+# instead of transforming the AST of the repeated expression again for every repetition, the states of its fragment
+# (which are created one after another, starting with state first) are copied, all of them before any of the copies is
+# changed by the concatenation
+# r{m,n} becomes m concatenated copies of r, followed by nested optional copies r(r(r)?)?, which the subset
+# construction goes through without the ambiguity of the equivalent r?r?r?
+# r{m,} becomes m - 1 copies of r followed by r+ (or r* if m is 0)
+def transform_repeat(nfa, first, fragment, bounds):
+    (low, high) = bounds
+    last = len(nfa)
+    copies = [fragment]
+    for i in range(1, high if high is not None else max(low, 1)):
+        offset = nfa.copy_fragment(first, last)
+        copies.append((fragment[0] + offset, fragment[1] + offset))
 
+    if high is None:
+        if low == 0:
+            return transform_kleene(nfa, copies[0])
+        result = transform_plus(nfa, copies[low - 1])
+        for copy in reversed(copies[0:low - 1]):
+            result = transform_concat(nfa, copy, result)
+        return result
 
-# regex to NFA transformation driver
+    result = None
+    for copy in reversed(copies[low:]):
+        result = transform_optional(nfa, copy if result is None else transform_concat(nfa, copy, result))
+    for copy in reversed(copies[0:low]):
+        result = copy if result is None else transform_concat(nfa, copy, result)
+    return result
+
+
+# transform the AST to a fragment of the NFA
 # essentially a postorder walk over the regex AST
-def regex_to_nfa(root):
-    child_nfa = [regex_to_nfa(child) for child in root.children]
+def transform(nfa, root):
+    first = len(nfa)
+    fragments = [transform(nfa, child) for child in root.children]
 
     if root.type == NodeType.CHAR:
-        return transform_simple_expression(root)
+        return transform_simple_expression(nfa, root)
     elif root.type == NodeType.KLEENE:
-        return transform_kleene(*child_nfa)
+        return transform_kleene(nfa, *fragments)
+    elif root.type == NodeType.PLUS:
+        return transform_plus(nfa, *fragments)
+    elif root.type == NodeType.OPTIONAL:
+        return transform_optional(nfa, *fragments)
+    elif root.type == NodeType.REPEAT:
+        return transform_repeat(nfa, first, *fragments, root.value)
     elif root.type == NodeType.UNION:
-        return transform_union(*child_nfa)
+        return transform_union(nfa, *fragments)
     else:
-        return transform_concat(*child_nfa)
+        return transform_concat(nfa, *fragments)
+
+
+# regex to NFA transformation driver
+def regex_to_nfa(root):
+    nfa = NFA()
+    (nfa.start, nfa.accept) = transform(nfa, root)
+    return nfa
 
 
 # since we generally have multiple regex pattern in the input program, describing different lexical categories,
 # we need a way to combine all the resulting NFAs into one, which will be transformed to DFA
 # we introduce a new starting state for the big NFA which has outgoing transitions on epsilon to starting states of
 # all the individual NFAs
+# since a state can only have two outgoing epsilon transitions, the new starting state is actually a chain of states,
+# one for every individual NFA
 # alongside the new NFA transition matrix, function also returns a list of PatternDesc objects with their respective
 # NFA accepting states calculated
 def combine_nfas(patt_descs):
-    combined_nfa = [[['eps']]]
-
     # if there is only one pattern in the list, don't bother
     if len(patt_descs) == 1:
-        patt_descs[0].nfa_acc_state = len(patt_descs[0].nfa) - 1
+        patt_descs[0].nfa_acc_state = patt_descs[0].nfa.accept
         return patt_descs[0].nfa, patt_descs
 
-    current_nfa_starting_state = 1
-    offset = 1
-    for patt_desc in patt_descs:
-        nfa = patt_desc.nfa
-        nfa = offset_outgoing_states(nfa, offset)
-        for state in nfa:
-            combined_nfa.append(state)
-        combined_nfa[0][0].append(current_nfa_starting_state)
-        current_nfa_starting_state += len(nfa)
-        offset += len(nfa)
-        patt_desc.nfa_acc_state = len(combined_nfa) - 1
+    combined_nfa = NFA()
+    for i in range(len(patt_descs)):
+        combined_nfa.add_state(EPS, NONE, i + 1 if i + 1 < len(patt_descs) else NONE)
+
+    for (i, patt_desc) in enumerate(patt_descs):
+        offset = combined_nfa.append(patt_desc.nfa)
+        combined_nfa.out1[i] = offset + patt_desc.nfa.start
+        patt_desc.nfa_acc_state = offset + patt_desc.nfa.accept
 
     return combined_nfa, patt_descs
@@ -0,0 +1,119 @@
+import zlib
+
+# profile-guided layout of the generated scanner
+# a lexer generated with profiling support and compiled with MY_LITTLE_LEXER_PROFILE defined counts how many times each
+# DFA state was entered and each DFA transition was taken, and Lexer::dump_profile writes these counts to a profile file
+# when the lexer is generated again with that profile, the blocks of the hot states are emitted first (so that they
+# share cache lines and pages), the cases of each switch are ordered from the hottest one, and if one transition takes
+# most of the exits of a state, it is tested before the switch, where the branch predictor can learn it
+# states are never renumbered, so the States enum (and the user code which relies on it) stays the same
+#
+# profile file format (text, one record per line):
+#   my_little_lexer_profile <number of DFA states> <number of DFA transitions> <DFA fingerprint>
+#   S <state> <hits>
+#   T <state> <input symbol code> <hits>
+
+PROFILE_MAGIC = "my_little_lexer_profile"
+
+# a transition is tested before the switch of its state if it takes at least this share of the state's exits
+HOT_TRANSITION_SHARE = 0.5
+
+
+# the profile file can not be used with the DFA being emitted
+class ProfileError(Exception):
+    def __init__(self, message):
+        self.message = message
+
+    def __str__(self):
+        return self.message
+
+
+# return a checksum of the DFA transition matrix and its accepting states
+# profiles are only valid for the exact DFA they were recorded with, so this is stored in the profile file
+def dfa_fingerprint(dtran, dfa_acc_states):
+    checksum = zlib.crc32(",".join(map(str, dtran.offsets)).encode())
+    checksum = zlib.crc32(",".join(map(str, dtran.syms)).encode(), checksum)
+    checksum = zlib.crc32(",".join(map(str, dtran.targets)).encode(), checksum)
+    return zlib.crc32(",".join(map(str, sorted(dfa_acc_states))).encode(), checksum)
+
+
+# hit counts of the DFA states and transitions
+class Profile:
+    __slots__ = ('states_num', 'transitions_num', 'fingerprint', 'state_hits', 'transition_hits')
+
+    def __init__(self, states_num, transitions_num, fingerprint):
+        self.states_num = states_num
+        self.transitions_num = transitions_num
+        self.fingerprint = fingerprint
+        # hits by state
+        self.state_hits = {}
+        # hits by (state, input symbol code)
+        self.transition_hits = {}
+
+    # add the hit counts of another profile of the same DFA (eg. one recorded on another part of the corpus)
+    def add(self, other):
+        if (self.states_num, self.transitions_num, self.fingerprint) != \
+                (other.states_num, other.transitions_num, other.fingerprint):
+            raise ProfileError("The profiles were recorded with different DFAs!")
+        for (state, hits) in other.state_hits.items():
+            self.state_hits[state] = self.state_hits.get(state, 0) + hits
+        for (transition, hits) in other.transition_hits.items():
+            self.transition_hits[transition] = self.transition_hits.get(transition, 0) + hits
+
+    # raise ProfileError if the profile was recorded with a different DFA
+    def check(self, dstates_num, dtran, dfa_acc_states):
+        if self.states_num != dstates_num or self.transitions_num != dtran.transition_count() or \
+                self.fingerprint != dfa_fingerprint(dtran, dfa_acc_states):
+            raise ProfileError("The profile was recorded with a different DFA, generate the instrumented lexer and "
+                               "record the profile again!")
+
+    # return the order in which the state blocks should be emitted
+    # the hottest states come first, the ones which were never entered keep their relative order at the end
+    def state_order(self):
+        return sorted(range(self.states_num), key=lambda state: -self.state_hits.get(state, 0))
+
+    # return the (input symbol, outgoing state) pairs of the state, hottest first
+    def order_transitions(self, state, transitions):
+        return sorted(transitions, key=lambda transition: -self.transition_hits.get((state, transition[0]), 0))
+
+    # return the transition of the state which should be tested before the switch, or None
+    def hot_transition(self, state, transitions):
+        if len(transitions) < 2:
+            return None
+        exits = self.state_hits.get(state, 0)
+        (sym, target) = self.order_transitions(state, transitions)[0]
+        hits = self.transition_hits.get((state, sym), 0)
+        if exits == 0 or hits < exits * HOT_TRANSITION_SHARE:
+            return None
+        return sym, target
+
+
+# read the profile file written by Lexer::dump_profile
+def read_profile(filename):
+    with open(filename, 'r') as file:
+        header = file.readline().split()
+        if len(header) != 4 or header[0] != PROFILE_MAGIC:
+            raise ProfileError(filename + " is not a lexer profile!")
+
+        try:
+            profile = Profile(int(header[1]), int(header[2]), int(header[3]))
+            for line in file:
+                record = line.split()
+                if len(record) == 3 and record[0] == "S":
+                    profile.state_hits[int(record[1])] = int(record[2])
+                elif len(record) == 4 and record[0] == "T":
+                    profile.transition_hits[(int(record[1]), int(record[2]))] = int(record[3])
+                elif len(record) > 0:
+                    raise ProfileError("Ill-formed record in the profile " + filename + "!")
+        except ValueError:
+            raise ProfileError("Ill-formed record in the profile " + filename + "!")
+
+    return profile
+
+
+# read the profile files written by Lexer::dump_profile, and sum up their hit counts
+def read_profiles(filenames):
+    profile = read_profile(filenames[0])
+    for filename in filenames[1:]:
+        profile.add(read_profile(filename))
+    return profile
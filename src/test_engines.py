@@ -0,0 +1,91 @@
+import os
+import random
+import tempfile
+import unittest
+from lexer_testing import COMPILER, build_lexer, encode_strings, run_lexer
+
+# checks that the lexers generated with the nfa engine (subset construction) and with the direct engine (followpos)
+# return the same tokens on random inputs
+# run from the src directory: python3 -m unittest test_engines
+
+# case-insensitive keywords, skipped whitespace and comments, and bounded repetitions (the character classes are
+# small, since the nfa engine distinguishes the characters of a class, so its DFA grows with them)
+SPEC = """_manifest:
+_tokens:
+    KW
+    ID
+    NUM
+    HEX
+    CODE
+_defines:
+    letter         %{[a-f]|[l-t]|[x-z]|[A-F]|[L-T]|[X-Z]}%
+    digit          %{[0-3]}%
+    hexdigit       %{[0-3]|[a-c]}%
+_patterns:
+    ws             %{( |\\n){1,}}%                  _skip
+    comment        %{;;(x| ){0,3}}%                 _skip
+    select         %{select}%                       _nocase #{ token->set_token_type(KW); }#
+    from           %{from}%                         _nocase #{ token->set_token_type(KW); }#
+    hex            %{0x{hexdigit}{2,4}}%            #{ token->set_token_type(HEX); }#
+    code           %{[A-Z]{2}{digit}{1,3}}%         #{ token->set_token_type(CODE); }#
+    num            %{{digit}{1,4}}%                 #{ token->set_token_type(NUM); }#
+    identifier     %{{letter}({letter}|{digit}){0,3}}%  #{ token->set_token_type(ID); }#
+"""
+
+# the driver reads the inputs, and prints the tokens of each one on a line
+DRIVER = """
+#include <cstdio>
+#include <iostream>
+#include <string>
+#include "lexer.h"
+
+// Read a string, given as its length on a line followed by its bytes.
+static bool read_string(std::string& text) {
+	size_t length;
+	if (!(std::cin >> length))
+		return false;
+	std::cin.get();
+	text.resize(length);
+	std::cin.read(&text[0], length);
+	return true;
+}
+
+int main() {
+	std::string input;
+	while (read_string(input)) {
+		for (const std::shared_ptr<Token>& token : Lexer::tokenize_parallel(input, 1))
+			std::printf("%d:%llu:%zu ", static_cast<int>(token->get_token_type()),
+					static_cast<unsigned long long>(token->get_offset()), token->get_lexeme().size());
+		std::printf("\\n");
+	}
+	return 0;
+}
+"""
+
+# pieces of the random inputs, which are close to the tokens and to the bounds of the repetitions
+PIECES = ["select", "SeLeCt", "sel", "from", "FROM", "fRoMs", "0x", "0xab", "0xabc1b", "AB", "Ab", "AB1230", "1",
+          "1230123", "a", "S3", ";;", ";;xx x"]
+SEPARATORS = ["", "", " ", "\n"]
+
+
+@unittest.skipIf(COMPILER is None, "no C++ compiler")
+class EnginesTest(unittest.TestCase):
+    def test_same_tokens(self):
+        rng = random.Random(29)
+        # the error token ends the tokens of an input at the first character no pattern starts with, so they are rare
+        inputs = ["".join(rng.choice(PIECES) + rng.choice(SEPARATORS) if rng.random() < 0.99 else "@"
+                          for _ in range(rng.randrange(40))) for _ in range(500)]
+        with tempfile.TemporaryDirectory() as directory:
+            outputs = {}
+            for engine in ["nfa", "direct"]:
+                os.mkdir(os.path.join(directory, engine))
+                binary = build_lexer(SPEC, DRIVER, os.path.join(directory, engine), engine=engine)
+                outputs[engine] = run_lexer(binary, encode_strings(inputs))
+
+        self.assertEqual(len(outputs["nfa"]), len(inputs))
+        for (text, nfa, direct) in zip(inputs, outputs["nfa"], outputs["direct"]):
+            self.assertEqual(nfa, direct, repr(text))
+
+
+if __name__ == "__main__":
+    unittest.main()
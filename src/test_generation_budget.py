@@ -0,0 +1,45 @@
+import os
+import tempfile
+import unittest
+from generation_budget import Budget, BudgetError
+from parse_input_file import generate_lexer
+
+# checks of the budget of the DFA creation and of the report of the patterns to blame, on the example specification
+# run from the src directory: python3 -m unittest test_generation_budget
+
+EXAMPLE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "example", "example.mll")
+
+
+class BlamePatternsTest(unittest.TestCase):
+    # return the report of generating the example lexer within the budget
+    def blame(self, budget):
+        with tempfile.TemporaryDirectory() as directory:
+            with self.assertRaises(BudgetError) as context:
+                generate_lexer(EXAMPLE, os.path.join(directory, "lexer"), budget=budget)
+        return str(context.exception)
+
+    def test_defines_of_the_culprit(self):
+        # the patterns are simplified before the DFA creation, but the defines they use are still found
+        report = self.blame(Budget(max_states=60))
+        self.assertIn("\tidentifier: over the limit\n", report)
+        self.assertIn("Defines used by pattern identifier, alone:\n\tletter: 53 states\n\tword: over the limit",
+                      report)
+
+    def test_time_limit_checked_at_once(self):
+        # the time is checked on the first state of every DFA creation, so the first pattern is the one to blame
+        report = self.blame(Budget(max_time=0))
+        self.assertIn("States added by each pattern (in the order of the patterns section):\n\tws: over the limit\n",
+                      report)
+
+
+class BudgetTest(unittest.TestCase):
+    def test_memory_limit_on_growth(self):
+        # the memory the process already uses does not count against the limit
+        budget = Budget(max_memory=1)
+        budget.check(1, 1)
+        budget.restart()
+        budget.check(1, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
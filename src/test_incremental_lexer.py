@@ -0,0 +1,117 @@
+import random
+import tempfile
+import unittest
+from lexer_testing import COMPILER, build_lexer, encode_strings, run_lexer
+
+# checks that the tokens the generated IncrementalLexer keeps up to date over random edits are the ones a new
+# IncrementalLexer finds in the edited input
+# run from the src directory: python3 -m unittest test_incremental_lexer
+
+# keywords which are prefixes of identifiers, and patterns which need the scanner to backtrack ("..", "1.")
+SPEC = """_manifest:
+_tokens:
+    ID
+    NUM
+    FLOAT
+    IF
+    EQ
+    ASSIGN
+    ELLIPSIS
+    DOT
+_defines:
+    letter         %{[a-z]}%
+    digit          %{[0-9]}%
+_patterns:
+    ws             %{( |\\n)( |\\n)*}%               _skip
+    if             %{if}%                           #{ token->set_token_type(IF); }#
+    identifier     %{{letter}({letter}|{digit})*}%  #{ token->set_token_type(ID); }#
+    num            %{{digit}{digit}*}%              #{ token->set_token_type(NUM); }#
+    float          %{{digit}{digit}*.{digit}{digit}*}%  #{ token->set_token_type(FLOAT); }#
+    eq             %{==}%                           #{ token->set_token_type(EQ); }#
+    assign         %{=}%                            #{ token->set_token_type(ASSIGN); }#
+    ellipsis       %{...}%                          #{ token->set_token_type(ELLIPSIS); }#
+    dot            %{.}%                            #{ token->set_token_type(DOT); }#
+"""
+
+# the driver reads the input, and then the edits (offset, number of deleted bytes, inserted text), and after every edit
+# prints the tokens of the edited lexer, the tokens of a new lexer of its input, and its input (in hex)
+DRIVER = """
+#include <cstdio>
+#include <iostream>
+#include <string>
+#include "lexer.h"
+
+// Read a string, given as its length on a line followed by its bytes.
+static bool read_string(std::string& text) {
+	size_t length;
+	if (!(std::cin >> length))
+		return false;
+	std::cin.get();
+	text.resize(length);
+	std::cin.read(&text[0], length);
+	return true;
+}
+
+static void print_tokens(const std::vector<TokenSpan>& tokens) {
+	for (const TokenSpan& token : tokens)
+		std::printf("%d:%llu:%llu ", static_cast<int>(token.token_type), static_cast<unsigned long long>(token.start),
+				static_cast<unsigned long long>(token.length));
+	std::printf("\\n");
+}
+
+int main() {
+	std::string input;
+	read_string(input);
+	IncrementalLexer lexer(input);
+	unsigned long long offset, deleted;
+	std::string inserted;
+	while (std::cin >> offset >> deleted && read_string(inserted)) {
+		lexer.edit(offset, deleted, inserted);
+		print_tokens(lexer.get_tokens());
+		print_tokens(IncrementalLexer(lexer.get_input()).get_tokens());
+		for (unsigned char c : lexer.get_input())
+			std::printf("%02x", c);
+		std::printf("\\n");
+	}
+	return 0;
+}
+"""
+
+# characters of the random inputs, and one which can not start a token, which is rare so that the tokens do not all end
+# with an error early on
+ALPHABET = "ab if1=.\n"
+ERROR_CHARACTER = "@"
+
+
+@unittest.skipIf(COMPILER is None, "no C++ compiler")
+class IncrementalLexerTest(unittest.TestCase):
+    def random_text(self, rng, max_length):
+        return "".join(ERROR_CHARACTER if rng.random() < 0.002 else rng.choice(ALPHABET)
+                       for _ in range(rng.randrange(max_length + 1)))
+
+    def test_edits_match_fresh_lexing(self):
+        rng = random.Random(39)
+        with tempfile.TemporaryDirectory() as directory:
+            binary = build_lexer(SPEC, DRIVER, directory)
+            for _ in range(20):
+                text = self.random_text(rng, 300)
+                stdin = encode_strings([text])
+                texts = []
+                for _ in range(50):
+                    # mostly typing around one place, sometimes replacing a larger part anywhere
+                    offset = rng.randrange(len(text) + 1)
+                    deleted = rng.randrange(min(len(text) - offset, 3 if rng.random() < 0.7 else 100) + 1)
+                    inserted = self.random_text(rng, 3 if rng.random() < 0.7 else 100)
+                    text = text[:offset] + inserted + text[offset + deleted:]
+                    texts.append(text)
+                    stdin += str(offset) + " " + str(deleted) + "\n" + encode_strings([inserted])
+
+                lines = run_lexer(binary, stdin)
+                self.assertEqual(len(lines), 3 * len(texts))
+                for (k, text) in enumerate(texts):
+                    self.assertEqual(bytes.fromhex(lines[3 * k + 2]).decode(), text)
+                    self.assertEqual(lines[3 * k], lines[3 * k + 1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+import unittest
+from regex_lexer import tokenize_regex, LexerError
+from regex_parser import parse, ParserError, NodeType
+
+# checks of the forms of the repetition and closure operators the regex grammar accepts, and of the ones it rejects
+# run from the src directory: python3 -m unittest test_regex_parser
+
+
+# return the AST of the regex as nested tuples of the type, the value and the children of every node
+def ast(regex):
+    def node_tuple(node):
+        return (node.type, node.value) + tuple(node_tuple(child) for child in node.children)
+    return node_tuple(parse(tokenize_regex(regex), {}))
+
+
+A = (NodeType.CHAR, 'a')
+
+
+class RepetitionTest(unittest.TestCase):
+    def test_exact(self):
+        self.assertEqual(ast("a{2}"), (NodeType.REPEAT, (2, 2), A))
+
+    def test_unbounded(self):
+        self.assertEqual(ast("a{2,}"), (NodeType.REPEAT, (2, None), A))
+
+    def test_nested(self):
+        self.assertEqual(ast("a{2,3}{2,3}"), (NodeType.REPEAT, (2, 3), (NodeType.REPEAT, (2, 3), A)))
+
+    def test_reversed_bounds(self):
+        with self.assertRaises(LexerError) as context:
+            ast("a{3,2}")
+        self.assertEqual(str(context.exception), "Ill-formed repetition regex!")
+
+    def test_zero_maximum(self):
+        with self.assertRaises(LexerError) as context:
+            ast("a{0,0}")
+        self.assertEqual(str(context.exception), "Ill-formed repetition regex!")
+
+    def test_missing_minimum(self):
+        with self.assertRaises(LexerError) as context:
+            ast("a{,2}")
+        self.assertEqual(str(context.exception), "Ill-formed regex!")
+
+
+class ClosureTest(unittest.TestCase):
+    def test_missing_operand(self):
+        with self.assertRaises(ParserError) as context:
+            ast("+a")
+        self.assertEqual(str(context.exception), "Parse error!")
+
+    def test_stacked(self):
+        self.assertEqual(ast("a+*"), (NodeType.KLEENE, '*', (NodeType.PLUS, '+', A)))
+
+
+if __name__ == "__main__":
+    unittest.main()
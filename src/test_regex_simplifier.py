@@ -0,0 +1,90 @@
+import random
+import unittest
+from automata import NONE
+from nfa_to_dfa import eps_closure
+from pattern_descriptor import PatternDesc
+from regex_lexer import tokenize_regex
+from regex_parser import parse
+from regex_simplifier import simplify_patterns
+from regex_to_nfa import regex_to_nfa
+
+# checks that the simplification of the regex ASTs keeps the language of every pattern, and reports the number of NFA
+# states it saves
+# run from the src directory: python3 -m unittest test_regex_simplifier
+
+
+# return the number of states of the NFA which can be reached from its starting state
+# the concatenation leaves the starting state of its right operand in the NFA, unused, so the length of the NFA counts
+# the states the simplification saves only once they can be reached
+def reachable_states(nfa):
+    reached = {nfa.start}
+    stack = [nfa.start]
+    while len(stack) > 0:
+        state = stack.pop()
+        for out_state in (nfa.out1[state], nfa.out2[state]):
+            if out_state != NONE and out_state not in reached:
+                reached.add(out_state)
+                stack.append(out_state)
+    return len(reached)
+
+
+# return the lengths of the tokens the NFA splits the text into, always taking the longest match, up to the first
+# character where there is no match
+def tokens(nfa, text):
+    lengths = []
+    position = 0
+    while position < len(text):
+        states = eps_closure({nfa.start}, nfa)
+        length = 0
+        for (k, c) in enumerate(text[position:]):
+            states = eps_closure({nfa.out1[state] for state in states if nfa.syms[state] == ord(c)}, nfa)
+            if len(states) == 0:
+                break
+            if nfa.accept in states:
+                length = k + 1
+        if length == 0:
+            break
+        lengths.append(length)
+        position += length
+    return lengths
+
+
+class SimplifyPatternsTest(unittest.TestCase):
+    # simplify the regex, and check the reported saving against the NFAs of the original and the simplified AST, and
+    # their tokens on random texts made of the characters of the regex and of its alternatives
+    def check(self, regex, saved):
+        root = parse(tokenize_regex(regex), {})
+        patt_desc = PatternDesc("pattern", "", root, None)
+        self.assertEqual(simplify_patterns([patt_desc]), saved)
+        self.assertIsNot(patt_desc.root, root)
+
+        original = regex_to_nfa(root)
+        simplified = regex_to_nfa(patt_desc.root)
+        self.assertEqual(reachable_states(original) - reachable_states(simplified), saved)
+
+        rng = random.Random(41)
+        pieces = sorted(set(c for c in regex if c.isalpha())) + ["".join(filter(str.isalpha, alternative))
+                                                                 for alternative in regex.split("|")]
+        for _ in range(300):
+            text = "".join(rng.choice(pieces) for _ in range(rng.randrange(8)))
+            self.assertEqual(tokens(simplified, text), tokens(original, text), text)
+
+    def test_nested_closures(self):
+        # (a*)* = a*
+        self.check("(a*)*", 2)
+
+    def test_duplicate_alternatives(self):
+        # a | a | b = a | b
+        self.check("a|a|b", 4)
+
+    def test_common_prefix(self):
+        # then | this | throw = th(en | is | row)
+        self.check("then|this|throw", 4)
+
+    def test_common_prefix_and_closure(self):
+        # ab* | ab = a(b* | b) = ab*
+        self.check("ab*|ab", 5)
+
+
+if __name__ == "__main__":
+    unittest.main()